@@ -1,24 +1,72 @@
-from flask import Flask, render_template, send_from_directory, redirect, session
+import logging
+from flask import Flask, render_template, send_from_directory, redirect, jsonify
 from flask_cors import CORS
 from config import Config
 from models import db
 from routes.auth import auth_bp
 from routes.users import users_bp
 from routes.bots import bots_bp
-from utils.auth import require_login, is_admin
+from routes.bot_api import bot_api_bp
+from routes.commander import commander_bp
+from routes.admin import admin_bp
+from routes.metrics import metrics_bp
+from routes.commands import commands_bp
+from utils.auth import (require_login, is_admin, get_current_user_id, password_hasher,
+                        login_ip_limiter, login_email_limiter, PasswordHasherBusy)
+from utils.cache import bot_state_cache, bot_token_cache, commander_cache, rendered_state_cache
+from utils.notify import bot_notifier
+from utils.heartbeat import heartbeat_buffer
+from utils.expiry import expiry_scheduler
+from utils.invalidation import invalidation_bus
+from utils.sessions import session_store
+from utils import query_counter, metrics, log
+
+logger = logging.getLogger(__name__)
 
 def create_app():
     app = Flask(__name__, template_folder='templates', static_folder='static')
     app.config.from_object(Config)
+    log.init_app(app)
+    if app.config['ENCRYPTION_KEY_TEMPORARY'] and not app.testing:
+        # Every process gets its own key, and BOT_ID_INDEX_KEY / BOT_TOKEN_KEY default to it
+        logger.warning('ENCRYPTION_KEY is not set, using a temporary random key. Encrypted bot_ids, bot_id '
+                       'lookups and bot tokens break after a restart and across workers. '
+                       'Generate a key with: python generate_key.py')
     
     # Initialize extensions
     db.init_app(app)
     CORS(app, supports_credentials=True)
+    bot_state_cache.init_app(app)
+    bot_notifier.init_app(app)
+    heartbeat_buffer.init_app(app)
+    expiry_scheduler.init_app(app)
+    invalidation_bus.init_app(app)
+    session_store.init_app(app)
+    password_hasher.init_app(app)
+    login_ip_limiter.configure(app.config['LOGIN_IP_RATE_PER_MINUTE'] / 60, app.config['LOGIN_IP_BURST'])
+    login_email_limiter.configure(app.config['LOGIN_EMAIL_RATE_PER_MINUTE'] / 60, app.config['LOGIN_EMAIL_BURST'])
+    commander_cache.ttl = app.config['COMMANDER_CACHE_TTL']
+    commander_cache.clear()
+    rendered_state_cache.ttl = app.config['BOT_STATE_CACHE_TTL']
+    rendered_state_cache.clear()
+    bot_token_cache.ttl = app.config['BOT_TOKEN_CACHE_TTL']
+    bot_token_cache.clear()
+    query_counter.init_app(app)
+    metrics.init_app(app)
     
     # Register blueprints
     app.register_blueprint(auth_bp)
     app.register_blueprint(users_bp)
     app.register_blueprint(bots_bp)
+    app.register_blueprint(bot_api_bp)
+    app.register_blueprint(commander_bp)
+    app.register_blueprint(admin_bp)
+    app.register_blueprint(metrics_bp)
+    app.register_blueprint(commands_bp)
+    
+    @app.errorhandler(PasswordHasherBusy)
+    def password_hasher_busy(e):
+        return jsonify({'error': 'Server busy, retry later'}), 503, {'Retry-After': '1'}
     
     # Frontend routes
     @app.route('/')
@@ -35,7 +83,7 @@ def create_app():
     
     @app.route('/admin')
     def admin():
-        if 'user_id' not in session:
+        if get_current_user_id() is None:
             return redirect('/')
         if not is_admin():
             return redirect('/dashboard')
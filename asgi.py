@@ -0,0 +1,315 @@
+"""
+ASGI entry point
+The bot-facing endpoints (poll, check_validity, heartbeat, wait, stream) are served
+natively on the event loop with an async DB driver and connection pool, so a
+single worker can hold tens of thousands of idle bot connections. Every other
+route is delegated to the regular Flask app through a WSGI adapter.
+
+Run with: python serve.py   (or: uvicorn asgi:app)
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from sqlalchemy.ext.asyncio import create_async_engine
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+from werkzeug.http import parse_etags, quote_etag
+
+from app import create_app
+from config import Config
+from utils.bot_state import (bot_state_query, row_to_bot_state, commander_query, row_to_commander,
+                             apply_commander, is_state_valid, state_etag, render_state, compact_validity,
+                             wants_compact, COMPACT_MIMETYPE)
+from utils.bot_tokens import bearer_token, parse_token, bot_token_query, row_to_token, check_token
+from utils.cache import bot_state_cache, bot_token_cache, commander_cache
+from utils.commander import COMMANDER_CACHE_KEY
+from utils.encryption import hash_bot_id
+from utils.expiry import expiry_scheduler
+from utils.heartbeat import heartbeat_buffer, parse_telemetry
+from utils.invalidation import invalidation_bus
+from utils.metrics import observe_request
+from utils.notify import bot_notifier, AsyncBotNotifier, TooManyListeners
+
+flask_app = create_app()
+async_notifier = AsyncBotNotifier(Config.ASGI_STREAM_MAX_CONNECTIONS)
+
+async def get_commander(engine):
+    """Async counterpart of utils.commander.get_commander, same cache"""
+    commander = commander_cache.get(COMMANDER_CACHE_KEY)
+    if commander is None:
+        generation = commander_cache.generation()
+        async with engine.connect() as conn:
+            result = await conn.execute(commander_query())
+            commander = row_to_commander(result.first())
+        commander_cache.set(COMMANDER_CACHE_KEY, commander, generation)
+    return commander
+
+async def get_bot_state(engine, key):
+    """Async counterpart of routes.bot_api.get_bot_state, same caches"""
+    found, state = bot_state_cache.get(key)
+    if not found:
+        generation = bot_state_cache.generation()
+        async with engine.connect() as conn:
+            result = await conn.execute(bot_state_query(key))
+            state = row_to_bot_state(result.first())
+        bot_state_cache.set(key, state, generation)
+    if state is None:
+        return None
+    return apply_commander(state, await get_commander(engine))
+
+async def _get_request_bot_id(request):
+    bot_id = request.query_params.get('bot_id')
+    if not bot_id and request.method == 'POST':
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+        if isinstance(data, dict):
+            bot_id = data.get('bot_id')
+    return bot_id
+
+async def verify_token(engine, token):
+    """Async counterpart of utils.bot_tokens.verify_token, same cache"""
+    parsed = parse_token(token)
+    if parsed is None:
+        return None
+    prefix, secret = parsed
+    entry = bot_token_cache.get(prefix)
+    if entry is None:
+        generation = bot_token_cache.generation()
+        async with engine.connect() as conn:
+            result = await conn.execute(bot_token_query(prefix))
+            entry = row_to_token(result.first())
+        bot_token_cache.set(prefix, entry, generation)
+    return check_token(entry, secret)
+
+async def _get_request_bot_key(request, bot_id=None):
+    """(bot_id_hash of the calling bot or None, error response or None), as require_bot_token"""
+    token = bearer_token(request.headers.get('authorization'))
+    if token is not None:
+        identity = await verify_token(request.app.state.engine, token)
+        if identity is None:
+            return None, _token_error('Invalid bot token')
+        return identity['bot_id_hash'], None
+    if Config.BOT_TOKEN_REQUIRED:
+        return None, _token_error('Bot token required')
+    bot_id = bot_id or await _get_request_bot_id(request)
+    if not bot_id:
+        return None, JSONResponse({'error': 'bot_id is required'}, status_code=400)
+    return hash_bot_id(bot_id), None
+
+def _token_error(message):
+    return JSONResponse({'error': message}, status_code=401, headers={'WWW-Authenticate': 'Bearer'})
+
+def _wants_compact(request):
+    return wants_compact(request.query_params.get('format'), request.headers.get('accept'))
+
+def _etag(state, compact):
+    return state_etag(state) + ('-c' if compact else '')
+
+def _state_response(state, compact):
+    """Same pre-rendered bodies as the Flask routes"""
+    media_type = COMPACT_MIMETYPE if compact else 'application/json'
+    headers = dict(_etag_headers(_etag(state, compact)), Vary='Accept')
+    return Response(render_state(state, compact), media_type=media_type, headers=headers)
+
+def _etag_headers(etag):
+    return {'ETag': quote_etag(etag), 'Cache-Control': 'no-cache'}
+
+def _not_modified(etag):
+    return Response(status_code=304, headers=_etag_headers(etag))
+
+def _too_many():
+    return JSONResponse({'error': 'Too many open connections, retry later'}, status_code=503,
+                        headers={'Retry-After': '5'})
+
+def _timed(handler):
+    """Record the native routes in the same request metrics as the Flask ones"""
+    if not Config.METRICS_ENABLED:
+        return handler
+    endpoint = f'bot_api.{handler.__name__}'
+
+    async def timed_handler(request):
+        start = time.perf_counter()
+        response = await handler(request)
+        observe_request('bot_api', endpoint, request.method, response.status_code, time.perf_counter() - start)
+        return response
+    return timed_handler
+
+async def poll_bot(request):
+    """Bot state for polling bots, JSON or the one-line compact format"""
+    key, error = await _get_request_bot_key(request)
+    if error:
+        return error
+    state = await get_bot_state(request.app.state.engine, key)
+    if state is None:
+        return JSONResponse({'error': 'Bot not found'}, status_code=404)
+    heartbeat_buffer.record(state['assign_id'])
+    compact = _wants_compact(request)
+    etag = _etag(state, compact)
+    if parse_etags(request.headers.get('if-none-match')).contains(etag):
+        return _not_modified(etag)
+    return _state_response(state, compact)
+
+async def check_validity(request):
+    """Check whether a bot assignment is still valid"""
+    key, error = await _get_request_bot_key(request)
+    if error:
+        return error
+    state = await get_bot_state(request.app.state.engine, key)
+    if state is None:
+        return JSONResponse({'valid': False, 'error': 'Bot not found'}, status_code=404)
+    heartbeat_buffer.record(state['assign_id'])
+    if _wants_compact(request):
+        return Response(compact_validity(state), media_type=COMPACT_MIMETYPE)
+    validity = state['validity']
+    return JSONResponse({
+        'valid': is_state_valid(state),
+        'validity': validity.isoformat() if validity else None
+    })
+
+async def heartbeat(request):
+    """Report telemetry: {bot_id, equity, open_trades, version}, all optional (bot_id without a token)"""
+    try:
+        data = await request.json()
+    except ValueError:
+        data = {}  # A bot with a token may send no body at all
+    if not isinstance(data, dict):
+        return JSONResponse({'error': 'bot_id is required'}, status_code=400)
+    key, error = await _get_request_bot_key(request, data.get('bot_id'))
+    if error:
+        return error
+    telemetry, error = parse_telemetry(data)
+    if error:
+        return JSONResponse({'error': error}, status_code=400)
+    state = await get_bot_state(request.app.state.engine, key)
+    if state is None:
+        return JSONResponse({'error': 'Bot not found'}, status_code=404)
+    heartbeat_buffer.record(state['assign_id'], telemetry)
+    return Response(status_code=204)
+
+async def wait_bot(request):
+    """Long-poll: return the bot state as soon as it differs from ?version="""
+    engine = request.app.state.engine
+    key, error = await _get_request_bot_key(request)
+    if error:
+        return error
+    try:
+        known_version = int(request.query_params['version'])
+    except (KeyError, ValueError):
+        known_version = None
+    compact = _wants_compact(request)
+    try:
+        timeout = min(float(request.query_params.get('timeout', Config.LONG_POLL_TIMEOUT)), Config.LONG_POLL_TIMEOUT)
+    except ValueError:
+        timeout = Config.LONG_POLL_TIMEOUT
+    state = await get_bot_state(engine, key)
+    if state is None:
+        return JSONResponse({'error': 'Bot not found'}, status_code=404)
+    assign_id = state['assign_id']
+    heartbeat_buffer.record(assign_id)
+    try:
+        event = async_notifier.acquire(assign_id)
+    except TooManyListeners:
+        return _too_many()
+    try:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            state = await get_bot_state(engine, key)
+            if state is None:
+                return JSONResponse({'error': 'Bot not found'}, status_code=404)
+            if state['version'] != known_version:
+                return _state_response(state, compact)
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return _not_modified(_etag(state, compact))
+            try:
+                await asyncio.wait_for(event.wait(), remaining)
+            except asyncio.TimeoutError:
+                return _not_modified(_etag(state, compact))
+            event.clear()
+    finally:
+        async_notifier.release(assign_id, event)
+
+async def stream_bot(request):
+    """Server-Sent Events stream of bot state changes"""
+    engine = request.app.state.engine
+    key, error = await _get_request_bot_key(request)
+    if error:
+        return error
+    state = await get_bot_state(engine, key)
+    if state is None:
+        return JSONResponse({'error': 'Bot not found'}, status_code=404)
+    assign_id = state['assign_id']
+    heartbeat_buffer.record(assign_id)
+    compact = _wants_compact(request)
+    try:
+        event = async_notifier.acquire(assign_id)
+    except TooManyListeners:
+        return _too_many()
+
+    async def generate():
+        loop = asyncio.get_running_loop()
+        sent_etag = None
+        deadline = loop.time() + Config.SSE_MAX_DURATION
+        while loop.time() < deadline:
+            current = await get_bot_state(engine, key)
+            if current is None:
+                yield 'event: gone\ndata: {}\n\n'
+                return
+            etag = state_etag(current)
+            if etag != sent_etag:
+                sent_etag = etag
+                yield f"id: {current['version']}\nevent: state\ndata: {render_state(current, compact).rstrip()}\n\n"
+            try:
+                await asyncio.wait_for(event.wait(), Config.SSE_HEARTBEAT_INTERVAL)
+                event.clear()
+            except asyncio.TimeoutError:
+                yield ': heartbeat\n\n'
+
+    # The background task runs once the response ends, even on early disconnect
+    return StreamingResponse(generate(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+                             background=BackgroundTask(async_notifier.release, assign_id, event))
+
+@asynccontextmanager
+async def lifespan(app):
+    app.state.engine = create_async_engine(Config.ASYNC_SQLALCHEMY_DATABASE_URI,
+                                           **Config.ASYNC_SQLALCHEMY_ENGINE_OPTIONS)
+    loop = asyncio.get_running_loop()
+
+    # control_bot runs in a WSGI thread; hop onto the loop to wake async waiters
+    def forward(assign_id):
+        if assign_id is None:
+            loop.call_soon_threadsafe(async_notifier.publish_all)
+        else:
+            loop.call_soon_threadsafe(async_notifier.publish, assign_id)
+
+    bot_notifier.subscribe(forward)
+    # Changes made on other workers reach this one's caches and waiting bots
+    invalidation_bus.start()
+    # Flask starts it on the first request, the native routes never go through Flask
+    if Config.EXPIRY_ENABLED:
+        expiry_scheduler.start()
+    try:
+        yield
+    finally:
+        bot_notifier.unsubscribe(forward)
+        await app.state.engine.dispose()
+
+app = Starlette(
+    routes=[
+        Route('/api/bots/poll', _timed(poll_bot), methods=['GET']),
+        Route('/api/bots/check_validity', _timed(check_validity), methods=['POST']),
+        Route('/api/bots/heartbeat', _timed(heartbeat), methods=['POST']),
+        Route('/api/bots/wait', _timed(wait_bot), methods=['GET']),
+        Route('/api/bots/stream', _timed(stream_bot), methods=['GET']),
+        Mount('/', WSGIMiddleware(flask_app, workers=Config.ASGI_WSGI_WORKERS)),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,9 @@
+"""
+Load test and benchmark suite for BotCommander
+Seeds users and bots through the models, then drives a weighted mix of bot
+polls, validity checks, admin list pages, control actions and logins from a
+pool of threads, either in process (Flask test client, with DB queries per
+request) or against a running server (--url). See SETUP.md, "Benchmarking".
+
+    python -m benchmark --bots 1000 --mix fleet --duration 30
+"""
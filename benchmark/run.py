@@ -0,0 +1,233 @@
+"""
+Benchmark runner
+
+    python -m benchmark --users 20 --bots 2000 --mix mixed --duration 30 --concurrency 16
+    python -m benchmark --database mysql+pymysql://root:pw@localhost/bot_commander_bench --reset
+    python -m benchmark --url http://127.0.0.1:8000 --database mysql+pymysql://... --reuse
+    python -m benchmark --save benchmark/baseline.json
+    python -m benchmark --baseline benchmark/baseline.json --max-regression 20
+
+In process (default) the app runs inside this process on the Flask test
+client, so the numbers are the cost of the application and the database
+without a network or a web server. With --url requests go to a running
+server (e.g. serve.py) instead; --database must then point at the database
+that server uses, for seeding.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from config import Config
+from models import db, User
+from benchmark.seed import seed, fleet, ADMIN_EMAIL
+from benchmark.workloads import AppClient, HttpClient, VirtualUser, OPERATIONS, MIXES
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+def create_benchmark_app(database_uri, temporary=False):
+    """The regular app with settings that keep the measurement about the code"""
+    Config.SQLALCHEMY_DATABASE_URI = database_uri
+    Config.REPLICA_DATABASE_URI = None
+    Config.SQLALCHEMY_BINDS = {}
+    if database_uri.startswith('sqlite'):
+        # One connection per thread, wait for the write lock instead of failing
+        Config.SQLALCHEMY_ENGINE_OPTIONS = {'connect_args': {'check_same_thread': False, 'timeout': 30}}
+    Config.QUERY_COUNT_HEADER = True
+    Config.LOG_LEVEL = 'WARNING'
+    # Every virtual user logs in from the same address
+    Config.LOGIN_IP_RATE_PER_MINUTE = Config.LOGIN_IP_BURST = 10 ** 6
+    Config.LOGIN_EMAIL_RATE_PER_MINUTE = Config.LOGIN_EMAIL_BURST = 10 ** 6
+    # Timed background work would add noise
+    Config.EXPIRY_ENABLED = False
+    if temporary:
+        # The data is dropped after the run, a per-process key is fine
+        Config.ENCRYPTION_KEY_TEMPORARY = False
+    return create_app()
+
+def prepare_database(app, users, bots, reset, reuse):
+    with app.app_context():
+        if reset:
+            db.drop_all()
+        db.create_all()
+        if reuse:
+            return fleet(users, bots)
+        if db.session.query(User.user_id).first() is not None:
+            raise SystemExit('Error: the database is not empty. Use --reset to recreate it (all data is lost) '
+                             'or --reuse to run against data seeded earlier.')
+        return seed(users, bots)
+
+def run_workload(make_client, owners, mix, duration, concurrency, rng_seed):
+    """Drive the mix from concurrency threads for duration seconds"""
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    samples = {name: [] for name in names}  # name -> [(seconds, status, queries)]
+    lock = threading.Lock()
+    users = [VirtualUser(make_client, owners, ADMIN_EMAIL, random.Random(rng_seed + i)) for i in range(concurrency)]
+    start_barrier = threading.Barrier(concurrency + 1)
+    deadline = [0.0]
+
+    def worker(user):
+        local = {name: [] for name in names}
+        start_barrier.wait()
+        while time.perf_counter() < deadline[0]:
+            name = user.rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                status, headers = OPERATIONS[name](user)
+                queries = headers.get('X-Query-Count')
+            except Exception as e:
+                status, queries = type(e).__name__, None
+            local[name].append((time.perf_counter() - started, status, queries))
+        with lock:
+            for name, entries in local.items():
+                samples[name].extend(entries)
+
+    threads = [threading.Thread(target=worker, args=(user,), daemon=True) for user in users]
+    for thread in threads:
+        thread.start()
+    deadline[0] = time.perf_counter() + duration
+    started = time.perf_counter()
+    start_barrier.wait()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - started
+
+def summarize(samples, elapsed):
+    operations = {}
+    for name, entries in samples.items():
+        latencies = sorted(seconds for seconds, _, _ in entries)
+        queries = [int(q) for _, _, q in entries if q is not None]
+        statuses = Counter(str(status) for _, status, _ in entries)
+        errors = sum(count for status, count in statuses.items()
+                     if not status.isdigit() or int(status) >= 400)
+        operations[name] = {
+            'requests': len(entries),
+            'throughput': round(len(entries) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+            'errors': errors,
+            'statuses': dict(statuses)
+        }
+    total = sum(op['requests'] for op in operations.values())
+    return {
+        'elapsed': round(elapsed, 1),
+        'requests': total,
+        'throughput': round(total / elapsed, 1),
+        'errors': sum(op['errors'] for op in operations.values()),
+        'operations': operations
+    }
+
+def print_report(result):
+    print(f"{'operation':<16}{'requests':>10}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+          f"{'queries':>10}{'errors':>8}")
+    for name, op in result['operations'].items():
+        queries = '-' if op['queries_per_request'] is None else op['queries_per_request']
+        print(f"{name:<16}{op['requests']:>10}{op['throughput']:>10}{op['p50_ms']:>10}{op['p95_ms']:>10}"
+              f"{op['p99_ms']:>10}{queries:>10}{op['errors']:>8}")
+    print(f"\nTotal: {result['requests']} requests in {result['elapsed']}s, "
+          f"{result['throughput']} req/s, {result['errors']} errors")
+
+def compare(result, baseline, max_regression):
+    """Regressions against a saved result: p95 or throughput worse than max_regression
+    percent, or queries per request up by more than 10% (cache hits make them vary slightly)"""
+    regressions = []
+    factor = max_regression / 100
+    for name, op in result['operations'].items():
+        base = baseline.get('operations', {}).get(name)
+        if not base or not base['requests'] or not op['requests']:
+            continue
+        if op['p95_ms'] > base['p95_ms'] * (1 + factor):
+            regressions.append(f"{name}: p95 {base['p95_ms']} -> {op['p95_ms']} ms")
+        if op['throughput'] < base['throughput'] * (1 - factor):
+            regressions.append(f"{name}: throughput {base['throughput']} -> {op['throughput']} req/s")
+        if (op['queries_per_request'] is not None and base['queries_per_request'] is not None
+                and op['queries_per_request'] > base['queries_per_request'] * 1.1 + 0.05):
+            regressions.append(f"{name}: queries per request {base['queries_per_request']} -> "
+                               f"{op['queries_per_request']}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmark', description='BotCommander load test and benchmark')
+    parser.add_argument('--database', help='SQLAlchemy URL of a database for the benchmark (default: a temporary SQLite file)')
+    parser.add_argument('--url', help='benchmark a running server at this base URL instead of in process')
+    parser.add_argument('--users', type=int, default=10, help='users to seed')
+    parser.add_argument('--bots', type=int, default=1000, help='bots to seed, spread across the users')
+    parser.add_argument('--mix', choices=sorted(MIXES), default='mixed', help='workload mix')
+    parser.add_argument('--duration', type=float, default=20, help='seconds to run')
+    parser.add_argument('--concurrency', type=int, default=8, help='concurrent virtual users (threads)')
+    parser.add_argument('--seed', type=int, default=1, help='random seed for the request sequence')
+    parser.add_argument('--reset', action='store_true', help='drop and recreate all tables first')
+    parser.add_argument('--reuse', action='store_true', help='use data seeded by an earlier run with the same --users/--bots')
+    parser.add_argument('--save', help='write the result as JSON to this file')
+    parser.add_argument('--baseline', help='compare with a result saved by --save, exit 1 on regression')
+    parser.add_argument('--max-regression', type=float, default=20, help='allowed p95/throughput regression in percent')
+    args = parser.parse_args(argv)
+    if args.users < 1 or args.bots < args.users:
+        parser.error('--users must be at least 1 and --bots at least --users')
+
+    temp_dir = None
+    database = args.database
+    if not database:
+        temp_dir = tempfile.TemporaryDirectory(prefix='botcommander-bench-')
+        database = f"sqlite:///{os.path.join(temp_dir.name, 'bench.db')}"
+
+    print("=" * 60)
+    print("BotCommander benchmark")
+    print("=" * 60)
+    print(f"Target: {args.url or 'in process'}, database: {database.split('@')[-1]}")
+    print(f"Mix: {args.mix} {MIXES[args.mix]}")
+    print(f"{args.users} users, {args.bots} bots, {args.concurrency} threads, {args.duration}s")
+    print("=" * 60)
+    try:
+        app = create_benchmark_app(database, temporary=temp_dir is not None)
+        started = time.perf_counter()
+        owners = prepare_database(app, args.users, args.bots, args.reset, args.reuse)
+        print(f"Data ready in {time.perf_counter() - started:.1f}s\n")
+        if args.url:
+            make_client = lambda: HttpClient(args.url)
+        else:
+            make_client = lambda: AppClient(app)
+        samples, elapsed = run_workload(make_client, owners, MIXES[args.mix], args.duration,
+                                        args.concurrency, args.seed)
+    finally:
+        if temp_dir is not None:
+            temp_dir.cleanup()
+
+    result = summarize(samples, elapsed)
+    result['config'] = {key: getattr(args, key) for key in ('url', 'users', 'bots', 'mix', 'duration', 'concurrency')}
+    print_report(result)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"Result saved to {args.save}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), args.max_regression)
+        print("=" * 60)
+        if regressions:
+            print(f"✗ {len(regressions)} regression(s) beyond {args.max_regression}%:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            raise SystemExit(1)
+        print(f"✓ No regression beyond {args.max_regression}% against {args.baseline}")
+    print("=" * 60)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Benchmark data: N users with M bots spread evenly across them, one admin
+Rows are written with batched INSERTs; every user shares one password hash so
+seeding doesn't spend minutes in bcrypt.
+"""
+from datetime import datetime, timedelta
+from models import db, User, Login, UserBot, BotBehaviour
+from utils.auth import hash_password
+from utils.encryption import encrypt_bot_id, hash_bot_id
+
+ADMIN_EMAIL = 'bench-admin@botcommander.local'
+PASSWORD = 'bench-password'
+BATCH_SIZE = 1000
+
+def user_email(index):
+    return f'bench-user-{index}@botcommander.local'
+
+def bot_id(index):
+    return f'BENCH-{index:07d}'
+
+def _insert(table, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(table.insert(), rows[start:start + BATCH_SIZE])
+
+def seed(users, bots):
+    """Create the benchmark data, returns fleet()"""
+    password = hash_password(PASSWORD)
+    admin = User(email=ADMIN_EMAIL, name='Benchmark Admin', is_admin=True)
+    db.session.add(admin)
+    db.session.flush()
+    db.session.add(Login(user_id=admin.user_id, password=password))
+    emails = [user_email(i) for i in range(users)]
+    # Core inserts still apply the models' column defaults (created_on, is_active, version...)
+    _insert(User.__table__, [{'email': email, 'name': email.split('@')[0]} for email in emails])
+    user_ids = dict(db.session.query(User.email, User.user_id).filter(User.email.in_(emails)))
+    _insert(Login.__table__, [{'user_id': user_ids[email], 'password': password} for email in emails])
+    validity = datetime.utcnow() + timedelta(days=365)
+    _insert(UserBot.__table__, [{'user_id': user_ids[emails[i % users]],
+                                 'bot_id': encrypt_bot_id(bot_id(i)),
+                                 'bot_id_hash': hash_bot_id(bot_id(i)),
+                                 'allow_admin_control': i % 2 == 0,
+                                 'validity': validity} for i in range(bots)])
+    assign_ids = [assign_id for (assign_id,) in db.session.query(UserBot.assign_id)]
+    _insert(BotBehaviour.__table__, [{'assign_id': assign_id, 'bot_state': assign_id % 3 != 0}
+                                     for assign_id in assign_ids])
+    db.session.commit()
+    return fleet(users, bots)
+
+def fleet(users, bots):
+    """{email: {'user_id': ..., 'bots': [(bot_id, assign_id)]}} of the seeded data, also for --reuse"""
+    emails = [user_email(i) for i in range(users)]
+    user_ids = dict(db.session.query(User.email, User.user_id).filter(User.email.in_(emails)))
+    assign_ids = dict(db.session.query(UserBot.bot_id_hash, UserBot.assign_id)
+                      .filter(UserBot.is_active == True))
+    owners = {email: {'user_id': user_ids.get(email), 'bots': []} for email in emails}
+    for i in range(bots):
+        assign_id = assign_ids.get(hash_bot_id(bot_id(i)))
+        if assign_id is None or owners[emails[i % users]]['user_id'] is None:
+            raise RuntimeError(f'{bot_id(i)} is not seeded with the current BOT_ID_INDEX_KEY, run without --reuse first')
+        owners[emails[i % users]]['bots'].append((bot_id(i), assign_id))
+    return owners
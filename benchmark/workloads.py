@@ -0,0 +1,127 @@
+"""
+Clients, operations and workload mixes
+A virtual user is one benchmark thread. Each operation issues one request on
+its behalf and returns (status, headers); a mix weights the operations.
+"""
+import http.cookiejar
+import json
+import urllib.error
+import urllib.parse
+import urllib.request
+from benchmark.seed import PASSWORD
+
+class AppClient:
+    """In-process client (Flask test client), no network in the measurement"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None, headers=None):
+        response = self.client.open(path, method=method, json=body, headers=headers)
+        response.close()
+        return response.status_code, response.headers
+
+class HttpClient:
+    """Plain HTTP client for a running server, with its own cookie jar"""
+
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        request = urllib.request.Request(self.base_url + path, data=data, method=method, headers=headers)
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                response.read()
+                return response.status, response.headers
+        except urllib.error.HTTPError as e:
+            # urllib raises for every non-2xx status, 304 included
+            e.read()
+            return e.code, e.headers
+
+class VirtualUser:
+    """One benchmark thread: a signed in user, a signed in admin and the bot fleet"""
+
+    def __init__(self, make_client, fleet, admin_email, rng):
+        self.make_client = make_client
+        self.rng = rng
+        self.fleet = fleet
+        self.bots = [bot for owner in fleet.values() for bot in owner['bots']]
+        self.emails = list(fleet)
+        self.email = rng.choice(self.emails)
+        self.bot_client = make_client()
+        self.user_client = self._signed_in(self.email)
+        self.admin_client = self._signed_in(admin_email)
+
+    def _signed_in(self, email):
+        client = self.make_client()
+        status, _ = client.request('POST', '/api/login', {'email': email, 'password': PASSWORD})
+        if status != 200:
+            raise RuntimeError(f'Login as {email} failed with HTTP {status}')
+        return client
+
+def poll(user):
+    """GET /api/bots/poll in JSON, without a conditional request"""
+    bot_id, _ = user.rng.choice(user.bots)
+    return user.bot_client.request('GET', '/api/bots/poll?bot_id=' + urllib.parse.quote(bot_id))
+
+def poll_compact(user):
+    """GET /api/bots/poll in the compact one-line format"""
+    bot_id, _ = user.rng.choice(user.bots)
+    return user.bot_client.request('GET', '/api/bots/poll?format=compact&bot_id=' + urllib.parse.quote(bot_id))
+
+def check_validity(user):
+    bot_id, _ = user.rng.choice(user.bots)
+    return user.bot_client.request('POST', '/api/bots/check_validity', {'bot_id': bot_id})
+
+def heartbeat(user):
+    bot_id, _ = user.rng.choice(user.bots)
+    return user.bot_client.request('POST', '/api/bots/heartbeat', {
+        'bot_id': bot_id,
+        'equity': round(user.rng.uniform(1000, 50000), 2),
+        'open_trades': user.rng.randint(0, 10)
+    })
+
+def list_bots(user):
+    """One admin list page of a random user's bots"""
+    owner = user.fleet[user.rng.choice(user.emails)]
+    return user.admin_client.request('GET', f"/api/bots?user_id={owner['user_id']}&limit=50")
+
+def control(user):
+    """Toggle bot_state on one of the signed in user's bots"""
+    _, assign_id = user.rng.choice(user.fleet[user.email]['bots'])
+    return user.user_client.request('POST', f'/api/bots/{assign_id}/control',
+                                    {'action': 'bot_state', 'value': user.rng.random() < 0.5})
+
+def login(user):
+    """Full password login (bcrypt) on a fresh session"""
+    return user.make_client().request('POST', '/api/login', {'email': user.rng.choice(user.emails),
+                                                             'password': PASSWORD})
+
+OPERATIONS = {
+    'poll': poll,
+    'poll_compact': poll_compact,
+    'check_validity': check_validity,
+    'heartbeat': heartbeat,
+    'list_bots': list_bots,
+    'control': control,
+    'login': login
+}
+
+# Relative weights of each operation
+MIXES = {
+    # Only the bots: they poll every few seconds and check validity now and then
+    'fleet': {'poll': 90, 'check_validity': 5, 'heartbeat': 5},
+    # The same fleet on the compact poll format
+    'fleet_compact': {'poll_compact': 90, 'check_validity': 5, 'heartbeat': 5},
+    # Bots plus people using the dashboard
+    'mixed': {'poll': 70, 'check_validity': 8, 'heartbeat': 5, 'list_bots': 8, 'control': 8, 'login': 1},
+    # Dashboard only
+    'dashboard': {'list_bots': 60, 'control': 35, 'login': 5}
+}
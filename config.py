@@ -1,6 +1,7 @@
 import os
 from dotenv import load_dotenv
 from cryptography.fernet import Fernet
+from utils.db_pool import InstrumentedQueuePool, REPLICA_BIND
 
 load_dotenv()
 
@@ -14,6 +15,121 @@ class Config:
         f"{os.getenv('DB_NAME', 'bot_commander')}"
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Connection pool: pre-ping and recycle below MySQL's wait_timeout so idle
+    # connections dropped by the server are replaced instead of failing requests
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': int(os.getenv('DB_POOL_SIZE', '10')),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', '20')),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', '1800')),
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', '10')),
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+    }
+    # Optional read replica for read-only list endpoints (same pool options)
+    REPLICA_DATABASE_URI = os.getenv('REPLICA_DATABASE_URI')
+    SQLALCHEMY_BINDS = {REPLICA_BIND: REPLICA_DATABASE_URI} if REPLICA_DATABASE_URI else {}
+    # Async driver used by the ASGI bot endpoints (asgi.py)
+    ASYNC_SQLALCHEMY_DATABASE_URI = os.getenv(
+        'ASYNC_DATABASE_URI',
+        SQLALCHEMY_DATABASE_URI.replace('mysql+pymysql://', 'mysql+aiomysql://', 1)
+    )
+    ASYNC_SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.getenv('ASYNC_DB_POOL_SIZE', '20')),
+        'max_overflow': int(os.getenv('ASYNC_DB_MAX_OVERFLOW', '10')),
+        'pool_recycle': int(os.getenv('ASYNC_DB_POOL_RECYCLE', '1800')),
+        'pool_pre_ping': True
+    }
     # Encryption key should be a base64-encoded 32-byte Fernet key
     # Generate one using: python generate_key.py
     ENCRYPTION_KEY = os.getenv('ENCRYPTION_KEY', Fernet.generate_key().decode())
+    # True when the key above is a random one of this process (warned about at startup)
+    ENCRYPTION_KEY_TEMPORARY = not os.getenv('ENCRYPTION_KEY')
+    # Previous keys, comma separated, still accepted for decryption (key rotation)
+    ENCRYPTION_OLD_KEYS = [k.strip() for k in os.getenv('ENCRYPTION_OLD_KEYS', '').split(',') if k.strip()]
+    # Number of decrypted bot_ids kept in memory (0 disables the cache)
+    DECRYPT_CACHE_SIZE = int(os.getenv('DECRYPT_CACHE_SIZE', '4096'))
+    # Secret for the deterministic bot_id blind index (HMAC-SHA256).
+    # Must stay stable for the lifetime of the data, defaults to ENCRYPTION_KEY
+    BOT_ID_INDEX_KEY = os.getenv('BOT_ID_INDEX_KEY', ENCRYPTION_KEY)
+    # Key of the HMAC stored for bot API tokens, defaults to BOT_ID_INDEX_KEY
+    # (changing it invalidates every issued token)
+    BOT_TOKEN_KEY = os.getenv('BOT_TOKEN_KEY', BOT_ID_INDEX_KEY)
+    # Server-side sessions: unset keeps them in this worker's memory (single worker),
+    # sqlite:////path/sessions.db shares them between the workers of one host, redis://
+    # between hosts. Lifetime in seconds, records held in memory per worker, and seconds
+    # a worker trusts its copy of a shared record
+    SESSION_STORE_URL = os.getenv('SESSION_STORE_URL')
+    SESSION_LIFETIME = int(os.getenv('SESSION_LIFETIME', '604800'))
+    SESSION_MAX_ENTRIES = int(os.getenv('SESSION_MAX_ENTRIES', '10000'))
+    SESSION_CACHE_TTL = int(os.getenv('SESSION_CACHE_TTL', '60'))
+    # Add an X-Query-Count header to every response (development / benchmarking)
+    QUERY_COUNT_HEADER = os.getenv('QUERY_COUNT_HEADER', 'false').lower() == 'true'
+    # Bot polling state cache (seconds, 0 = keep until invalidated)
+    BOT_STATE_CACHE_TTL = int(os.getenv('BOT_STATE_CACHE_TTL', '300'))
+    BOT_STATE_CACHE_NEGATIVE_TTL = int(os.getenv('BOT_STATE_CACHE_NEGATIVE_TTL', '30'))
+    # Bot states (and unknown bot_ids) each worker keeps, the oldest are dropped beyond it
+    BOT_STATE_CACHE_MAX_ENTRIES = int(os.getenv('BOT_STATE_CACHE_MAX_ENTRIES', '100000'))
+    # Seconds each worker caches the common commander record; bounds how long other
+    # workers take to see a broadcast or emergency stop without an invalidation bus
+    # (0 = read on every poll)
+    COMMANDER_CACHE_TTL = int(os.getenv('COMMANDER_CACHE_TTL', '5'))
+    # bcrypt cost (hashes with another cost are upgraded on login), threads running
+    # bcrypt per worker and how many more may queue before logins get a 503
+    BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))
+    BCRYPT_WORKERS = int(os.getenv('BCRYPT_WORKERS', '2'))
+    BCRYPT_MAX_PENDING = int(os.getenv('BCRYPT_MAX_PENDING', '16'))
+    # Login rate limits per client IP and per email (token bucket, 0 disables)
+    LOGIN_IP_RATE_PER_MINUTE = float(os.getenv('LOGIN_IP_RATE_PER_MINUTE', '30'))
+    LOGIN_IP_BURST = int(os.getenv('LOGIN_IP_BURST', '10'))
+    LOGIN_EMAIL_RATE_PER_MINUTE = float(os.getenv('LOGIN_EMAIL_RATE_PER_MINUTE', '5'))
+    LOGIN_EMAIL_BURST = int(os.getenv('LOGIN_EMAIL_BURST', '5'))
+    # Logging: level, 'json' or 'text' output, records buffered before dropping,
+    # and the fraction of bot poll/wait/stream requests logged
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+    LOG_BOT_REQUEST_SAMPLE_RATE = float(os.getenv('LOG_BOT_REQUEST_SAMPLE_RATE', '0.01'))
+    # Prometheus metrics on /metrics (optional bearer token for the scraper)
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+    # Days of bot_command_log history kept by database/maintain_command_log.py
+    COMMAND_LOG_RETENTION_DAYS = int(os.getenv('COMMAND_LOG_RETENTION_DAYS', '365'))
+    # Bot API delivery through the outbox (dispatcher.py). URL template with {bot_id}
+    # and {assign_id}; nothing is queued when unset
+    BOT_DISPATCH_URL = os.getenv('BOT_DISPATCH_URL')
+    DISPATCH_CONCURRENCY = int(os.getenv('DISPATCH_CONCURRENCY', '8'))
+    DISPATCH_BATCH_SIZE = int(os.getenv('DISPATCH_BATCH_SIZE', '100'))
+    DISPATCH_POLL_INTERVAL = float(os.getenv('DISPATCH_POLL_INTERVAL', '1'))
+    DISPATCH_TIMEOUT = float(os.getenv('DISPATCH_TIMEOUT', '5'))
+    DISPATCH_MAX_ATTEMPTS = int(os.getenv('DISPATCH_MAX_ATTEMPTS', '8'))
+    DISPATCH_BACKOFF_BASE = float(os.getenv('DISPATCH_BACKOFF_BASE', '2'))
+    DISPATCH_BACKOFF_MAX = float(os.getenv('DISPATCH_BACKOFF_MAX', '300'))
+    # Bot heartbeats are buffered per worker and written every HEARTBEAT_FLUSH_INTERVAL
+    # seconds; a bot is online when seen within HEARTBEAT_ONLINE_SECONDS
+    HEARTBEAT_FLUSH_INTERVAL = float(os.getenv('HEARTBEAT_FLUSH_INTERVAL', '5'))
+    HEARTBEAT_ONLINE_SECONDS = int(os.getenv('HEARTBEAT_ONLINE_SECONDS', '90'))
+    HEARTBEAT_MAX_BUFFER = int(os.getenv('HEARTBEAT_MAX_BUFFER', '100000'))
+    # Validity expiry: stops bots when their validity passes. Expirations due within
+    # EXPIRY_LOOKAHEAD seconds are kept in memory, reloaded every EXPIRY_RESYNC_INTERVAL
+    EXPIRY_ENABLED = os.getenv('EXPIRY_ENABLED', 'true').lower() == 'true'
+    EXPIRY_LOOKAHEAD = int(os.getenv('EXPIRY_LOOKAHEAD', '3600'))
+    EXPIRY_RESYNC_INTERVAL = int(os.getenv('EXPIRY_RESYNC_INTERVAL', '300'))
+    EXPIRY_BATCH_SIZE = int(os.getenv('EXPIRY_BATCH_SIZE', '500'))
+    # Cross-worker cache invalidation: redis://host:6379/0 (workers on several hosts),
+    # unix:///run/botcommander/bus (workers of one host), unset for a single worker
+    INVALIDATION_BUS_URL = os.getenv('INVALIDATION_BUS_URL')
+    INVALIDATION_CHANNEL = os.getenv('INVALIDATION_CHANNEL', 'botcommander:invalidate')
+    # Bot API tokens: refuse bot requests without one (otherwise bot_id alone is still
+    # accepted), and seconds each worker caches a verified token
+    BOT_TOKEN_REQUIRED = os.getenv('BOT_TOKEN_REQUIRED', 'false').lower() == 'true'
+    BOT_TOKEN_CACHE_TTL = int(os.getenv('BOT_TOKEN_CACHE_TTL', '300'))
+    # Maximum number of bots handled by one bulk assign/control request
+    BULK_MAX_ITEMS = int(os.getenv('BULK_MAX_ITEMS', '1000'))
+    # Long-poll / Server-Sent Events push channel (seconds, connections per worker)
+    STREAM_MAX_CONNECTIONS = int(os.getenv('STREAM_MAX_CONNECTIONS', '100'))
+    LONG_POLL_TIMEOUT = int(os.getenv('LONG_POLL_TIMEOUT', '25'))
+    SSE_HEARTBEAT_INTERVAL = int(os.getenv('SSE_HEARTBEAT_INTERVAL', '15'))
+    SSE_MAX_DURATION = int(os.getenv('SSE_MAX_DURATION', '300'))
+    # ASGI serving mode (serve.py / asgi.py)
+    ASGI_STREAM_MAX_CONNECTIONS = int(os.getenv('ASGI_STREAM_MAX_CONNECTIONS', '20000'))
+    ASGI_WSGI_WORKERS = int(os.getenv('ASGI_WSGI_WORKERS', '16'))
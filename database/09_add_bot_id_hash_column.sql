@@ -0,0 +1,41 @@
+-- 09_add_bot_id_hash_column.sql
+-- Adds bot_id_hash blind index column to user_bot table for indexed bot_id lookups
+-- bot_id is Fernet encrypted (randomized), so it cannot be searched directly.
+-- After running this script, populate the column with: python database/backfill_bot_id_hash.py
+
+USE `bot_commander`;
+
+SET @col_exists = (
+    SELECT COUNT(*) 
+    FROM INFORMATION_SCHEMA.COLUMNS 
+    WHERE TABLE_SCHEMA = 'bot_commander' 
+    AND TABLE_NAME = 'user_bot' 
+    AND COLUMN_NAME = 'bot_id_hash'
+);
+
+SET @sql = IF(@col_exists = 0,
+    'ALTER TABLE `user_bot` ADD COLUMN `bot_id_hash` CHAR(64) NULL COMMENT ''HMAC-SHA256 blind index of bot_id'' AFTER `bot_id`',
+    'SELECT "Column bot_id_hash already exists" AS message'
+);
+
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- Unique index (NULLs allowed for unassigned bots)
+SET @idx_exists = (
+    SELECT COUNT(*) 
+    FROM INFORMATION_SCHEMA.STATISTICS 
+    WHERE TABLE_SCHEMA = 'bot_commander' 
+    AND TABLE_NAME = 'user_bot' 
+    AND INDEX_NAME = 'idx_bot_id_hash'
+);
+
+SET @sql = IF(@idx_exists = 0,
+    'ALTER TABLE `user_bot` ADD UNIQUE INDEX `idx_bot_id_hash` (`bot_id_hash`)',
+    'SELECT "Index idx_bot_id_hash already exists" AS message'
+);
+
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
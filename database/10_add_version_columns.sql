@@ -0,0 +1,39 @@
+-- 10_add_version_columns.sql
+-- Adds version counters to user_bot and bots_behaviour tables
+-- user_bot.version is bumped on every change to the assignment or its behaviour and is served as ETag
+
+USE `bot_commander`;
+
+SET @col_exists = (
+    SELECT COUNT(*) 
+    FROM INFORMATION_SCHEMA.COLUMNS 
+    WHERE TABLE_SCHEMA = 'bot_commander' 
+    AND TABLE_NAME = 'user_bot' 
+    AND COLUMN_NAME = 'version'
+);
+
+SET @sql = IF(@col_exists = 0,
+    'ALTER TABLE `user_bot` ADD COLUMN `version` INT NOT NULL DEFAULT 1 AFTER `validity`',
+    'SELECT "Column user_bot.version already exists" AS message'
+);
+
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @col_exists = (
+    SELECT COUNT(*) 
+    FROM INFORMATION_SCHEMA.COLUMNS 
+    WHERE TABLE_SCHEMA = 'bot_commander' 
+    AND TABLE_NAME = 'bots_behaviour' 
+    AND COLUMN_NAME = 'version'
+);
+
+SET @sql = IF(@col_exists = 0,
+    'ALTER TABLE `bots_behaviour` ADD COLUMN `version` INT NOT NULL DEFAULT 1 AFTER `refresh_data_from_bot`',
+    'SELECT "Column bots_behaviour.version already exists" AS message'
+);
+
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
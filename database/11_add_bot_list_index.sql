@@ -0,0 +1,22 @@
+-- 11_add_bot_list_index.sql
+-- Adds a composite index on user_bot for keyset pagination of a user's bots
+-- (WHERE user_id = ? AND is_active = ? AND assign_id > ? ORDER BY assign_id)
+
+USE `bot_commander`;
+
+SET @idx_exists = (
+    SELECT COUNT(*) 
+    FROM INFORMATION_SCHEMA.STATISTICS 
+    WHERE TABLE_SCHEMA = 'bot_commander' 
+    AND TABLE_NAME = 'user_bot' 
+    AND INDEX_NAME = 'idx_user_active_assign'
+);
+
+SET @sql = IF(@idx_exists = 0,
+    'ALTER TABLE `user_bot` ADD INDEX `idx_user_active_assign` (`user_id`, `is_active`, `assign_id`)',
+    'SELECT "Index idx_user_active_assign already exists" AS message'
+);
+
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
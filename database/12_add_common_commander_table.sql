@@ -0,0 +1,21 @@
+-- 12_add_common_commander_table.sql
+-- Adds the common_commander table: a single global row whose state is applied at poll time
+-- to every bot with listen_to_common_commander (and, for emergency_stop, to every bot)
+
+USE `bot_commander`;
+
+CREATE TABLE IF NOT EXISTS `common_commander` (
+    `commander_id` INT PRIMARY KEY,
+    `bot_state` BOOLEAN NOT NULL DEFAULT FALSE,
+    `hard_stop_all_trades` BOOLEAN NOT NULL DEFAULT FALSE,
+    `news_based_start_stop` BOOLEAN NOT NULL DEFAULT FALSE,
+    `emergency_stop` BOOLEAN NOT NULL DEFAULT FALSE,
+    `version` INT NOT NULL DEFAULT 1,
+    `updated_on` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    `updated_by` INT NULL,
+    FOREIGN KEY (`updated_by`) REFERENCES `user`(`user_id`) ON DELETE SET NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- The single global row
+INSERT IGNORE INTO `common_commander` (`commander_id`, `updated_on`)
+VALUES (1, NOW());
@@ -0,0 +1,24 @@
+-- 13_add_bot_command_log_table.sql
+-- Adds the append-only bot_command_log table (history of every control change)
+-- Partitioned by month on created_on so old months are dropped instantly instead of deleted row by row.
+-- MySQL requires the partitioning column in every unique key (hence the composite primary key)
+-- and does not allow foreign keys on partitioned tables.
+-- Run maintain_command_log.py right after this script (and then monthly) to create the monthly partitions.
+
+USE `bot_commander`;
+
+CREATE TABLE IF NOT EXISTS `bot_command_log` (
+    `log_id` BIGINT NOT NULL AUTO_INCREMENT,
+    `assign_id` INT NOT NULL,
+    `action` VARCHAR(50) NOT NULL,
+    `old_value` VARCHAR(255) NULL,
+    `new_value` VARCHAR(255) NULL,
+    `actor_id` INT NULL,
+    `created_on` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (`log_id`, `created_on`),
+    INDEX `idx_command_log_created` (`created_on`),
+    INDEX `idx_command_log_assign_created` (`assign_id`, `created_on`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+PARTITION BY RANGE COLUMNS (`created_on`) (
+    PARTITION `p_future` VALUES LESS THAN (MAXVALUE)
+);
@@ -0,0 +1,22 @@
+-- 14_add_bot_outbox_table.sql
+-- Adds the bot_outbox table: commands for the bot API written in the same transaction as the
+-- behaviour change and delivered by the dispatcher process (dispatcher.py)
+
+USE `bot_commander`;
+
+CREATE TABLE IF NOT EXISTS `bot_outbox` (
+    `outbox_id` BIGINT AUTO_INCREMENT PRIMARY KEY,
+    `assign_id` INT NOT NULL,
+    `idempotency_key` VARCHAR(36) NOT NULL UNIQUE,
+    `action` VARCHAR(50) NOT NULL,
+    `payload` TEXT NOT NULL,
+    `status` VARCHAR(20) NOT NULL DEFAULT 'pending',
+    `attempts` INT NOT NULL DEFAULT 0,
+    `next_attempt_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    `last_error` VARCHAR(255) NULL,
+    `created_on` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    `delivered_on` DATETIME NULL,
+    FOREIGN KEY (`assign_id`) REFERENCES `user_bot`(`assign_id`) ON DELETE CASCADE,
+    INDEX `idx_outbox_status_next` (`status`, `next_attempt_at`),
+    INDEX `idx_outbox_assign` (`assign_id`, `outbox_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
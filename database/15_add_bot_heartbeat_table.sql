@@ -0,0 +1,15 @@
+-- 15_add_bot_heartbeat_table.sql
+-- Adds the bot_heartbeat table: when each bot last polled and the telemetry it last
+-- reported. Written in batched upserts from an in-memory buffer (utils/heartbeat.py)
+
+USE `bot_commander`;
+
+CREATE TABLE IF NOT EXISTS `bot_heartbeat` (
+    `assign_id` INT PRIMARY KEY,
+    `last_seen` DATETIME NOT NULL,
+    `equity` DECIMAL(18, 2) NULL,
+    `open_trades` INT NULL,
+    `bot_version` VARCHAR(32) NULL,
+    `updated_on` DATETIME NULL,
+    FOREIGN KEY (`assign_id`) REFERENCES `user_bot`(`assign_id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -0,0 +1,22 @@
+-- 16_add_validity_index.sql
+-- Adds an index on user_bot for the validity expiry scheduler (utils/expiry.py)
+-- (WHERE is_active = ? AND validity > ? AND validity <= ?)
+
+USE `bot_commander`;
+
+SET @idx_exists = (
+    SELECT COUNT(*) 
+    FROM INFORMATION_SCHEMA.STATISTICS 
+    WHERE TABLE_SCHEMA = 'bot_commander' 
+    AND TABLE_NAME = 'user_bot' 
+    AND INDEX_NAME = 'idx_active_validity'
+);
+
+SET @sql = IF(@idx_exists = 0,
+    'ALTER TABLE `user_bot` ADD INDEX `idx_active_validity` (`is_active`, `validity`)',
+    'SELECT "Index idx_active_validity already exists" AS message'
+);
+
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
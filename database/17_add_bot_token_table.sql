@@ -0,0 +1,19 @@
+-- 17_add_bot_token_table.sql
+-- Adds the bot_token table: API tokens bots authenticate with. Only an HMAC of the
+-- secret part is stored, tokens are looked up by their unique public prefix
+
+USE `bot_commander`;
+
+CREATE TABLE IF NOT EXISTS `bot_token` (
+    `token_id` INT AUTO_INCREMENT PRIMARY KEY,
+    `assign_id` INT NOT NULL,
+    `prefix` VARCHAR(16) NOT NULL UNIQUE,
+    `token_hash` CHAR(64) NOT NULL,
+    `is_active` BOOLEAN NOT NULL DEFAULT TRUE,
+    `created_on` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    `created_by` INT NULL,
+    `revoked_on` DATETIME NULL,
+    INDEX `ix_bot_token_assign_id` (`assign_id`),
+    FOREIGN KEY (`assign_id`) REFERENCES `user_bot`(`assign_id`) ON DELETE CASCADE,
+    FOREIGN KEY (`created_by`) REFERENCES `user`(`user_id`) ON DELETE SET NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -0,0 +1,65 @@
+"""
+Backfill the bot_id_hash blind index for existing bot assignments
+Run this once after 09_add_bot_id_hash_column.sql (safe to run multiple times)
+"""
+import sys
+import os
+import argparse
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import InvalidToken
+from app import create_app
+from models import db, UserBot
+from utils.encryption import _get_fernet, hash_bot_id
+
+def backfill(batch_size=500):
+    app = create_app()
+    with app.app_context():
+        fernet = _get_fernet()
+        updated = 0
+        failed = 0
+        last_id = 0
+        while True:
+            # Keyset pagination over active rows still missing the index
+            rows = (UserBot.query
+                    .filter(UserBot.assign_id > last_id,
+                            UserBot.is_active == True,
+                            UserBot.bot_id_hash.is_(None))
+                    .order_by(UserBot.assign_id)
+                    .limit(batch_size)
+                    .all())
+            if not rows:
+                break
+            for user_bot in rows:
+                last_id = user_bot.assign_id
+                try:
+                    bot_id = fernet.decrypt(user_bot.bot_id.encode()).decode()
+                except InvalidToken:
+                    print(f"✗ assign_id {user_bot.assign_id}: cannot decrypt bot_id (key mismatch), skipped")
+                    failed += 1
+                    continue
+                bot_id_hash = hash_bot_id(bot_id)
+                duplicate = UserBot.query.filter_by(bot_id_hash=bot_id_hash).first()
+                if duplicate:
+                    print(f"✗ assign_id {user_bot.assign_id}: same bot_id as assign_id {duplicate.assign_id}, skipped")
+                    failed += 1
+                    continue
+                user_bot.bot_id_hash = bot_id_hash
+                updated += 1
+            db.session.commit()
+            print(f"  ... processed up to assign_id {last_id} ({updated} updated)")
+        print(f"✓ Backfill complete: {updated} updated, {failed} failed")
+        return failed == 0
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backfill user_bot.bot_id_hash')
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+    print("=" * 60)
+    print("BotCommander bot_id blind index backfill")
+    print("=" * 60)
+    ok = backfill(args.batch_size)
+    print("=" * 60)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,119 @@
+"""
+Maintain the bot_command_log table (run monthly, e.g. from cron)
+  - Partitioned table (MySQL, 13_add_bot_command_log_table.sql): creates the
+    monthly partitions for the coming months and drops whole months older
+    than the retention period (instant, no row-by-row delete)
+  - Unpartitioned table: deletes expired rows in small batches
+"""
+import sys
+import os
+import time
+import argparse
+from datetime import datetime, timedelta
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from app import create_app
+from config import Config
+from models import db, BotCommandLog
+
+TABLE = BotCommandLog.__tablename__
+FUTURE_PARTITION = 'p_future'
+
+def _month_start(day):
+    return datetime(day.year, day.month, 1)
+
+def _next_month(month):
+    return datetime(month.year + (month.month == 12), month.month % 12 + 1, 1)
+
+def _partitions():
+    """{partition name: upper bound string} or {} when the table isn't partitioned"""
+    if db.engine.dialect.name != 'mysql':
+        return {}
+    rows = db.session.execute(text(
+        "SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM INFORMATION_SCHEMA.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND PARTITION_NAME IS NOT NULL"),
+        {'table': TABLE}).all()
+    return {name: description for name, description in rows}
+
+def _add_partitions(partitions, months_ahead, dry_run):
+    month = _month_start(datetime.utcnow())
+    new = []
+    for _ in range(months_ahead + 1):
+        name = f"p{month:%Y%m}"
+        if name not in partitions:
+            new.append(f"PARTITION {name} VALUES LESS THAN ('{_next_month(month):%Y-%m-%d}')")
+        month = _next_month(month)
+    if not new:
+        print("  Monthly partitions already exist")
+        return
+    # Only valid while p_future is empty, which holds as long as this runs ahead of time
+    statement = (f"ALTER TABLE `{TABLE}` REORGANIZE PARTITION {FUTURE_PARTITION} INTO ("
+                 + ', '.join(new) + f", PARTITION {FUTURE_PARTITION} VALUES LESS THAN (MAXVALUE))")
+    print(f"  Adding {len(new)} partition(s)")
+    if not dry_run:
+        db.session.execute(text(statement))
+
+def _drop_partitions(partitions, cutoff, dry_run):
+    expired = []
+    for name, bound in partitions.items():
+        if name == FUTURE_PARTITION:
+            continue
+        # A partition holds rows strictly before its bound
+        if datetime.fromisoformat(bound.strip("'")) <= cutoff:
+            expired.append(name)
+    if not expired:
+        print("  No partitions past retention")
+        return
+    print(f"  Dropping partition(s): {', '.join(sorted(expired))}")
+    if not dry_run:
+        db.session.execute(text(f"ALTER TABLE `{TABLE}` DROP PARTITION {', '.join(sorted(expired))}"))
+
+def _delete_rows(cutoff, batch_size, sleep, dry_run):
+    query = db.session.query(BotCommandLog.log_id).filter(BotCommandLog.created_on < cutoff)
+    if dry_run:
+        print(f"  Would delete {query.count()} row(s)")
+        return
+    deleted = 0
+    while True:
+        ids = [log_id for (log_id,) in query.limit(batch_size)]
+        if not ids:
+            break
+        db.session.query(BotCommandLog).filter(BotCommandLog.log_id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        deleted += len(ids)
+        time.sleep(sleep)
+    print(f"  Deleted {deleted} row(s)")
+
+def maintain(retention_days, months_ahead=2, batch_size=1000, sleep=0.1, dry_run=False):
+    app = create_app()
+    with app.app_context():
+        cutoff = datetime.utcnow() - timedelta(days=retention_days)
+        print(f"Keeping command log entries since {cutoff:%Y-%m-%d %H:%M} ({retention_days} days)")
+        partitions = _partitions()
+        if partitions:
+            _add_partitions(partitions, months_ahead, dry_run)
+            _drop_partitions(partitions, cutoff, dry_run)
+        else:
+            print("  Table is not partitioned, deleting expired rows in batches")
+            _delete_rows(cutoff, batch_size, sleep, dry_run)
+        if dry_run:
+            print("Dry run, nothing was changed")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Create upcoming partitions and apply retention to bot_command_log')
+    parser.add_argument('--retention-days', type=int, default=Config.COMMAND_LOG_RETENTION_DAYS,
+                        help='keep entries this many days (default COMMAND_LOG_RETENTION_DAYS)')
+    parser.add_argument('--months-ahead', type=int, default=2, help='monthly partitions to create ahead')
+    parser.add_argument('--batch-size', type=int, default=1000, help='rows per delete (unpartitioned table)')
+    parser.add_argument('--sleep', type=float, default=0.1, help='seconds to pause between delete batches')
+    parser.add_argument('--dry-run', action='store_true', help='report what would change without writing')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("BotCommander command log maintenance")
+    print("=" * 60)
+    maintain(args.retention_days, args.months_ahead, args.batch_size, args.sleep, args.dry_run)
+    print("=" * 60)
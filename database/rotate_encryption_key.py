@@ -0,0 +1,119 @@
+"""
+Re-encrypt user_bot.bot_id with the current primary ENCRYPTION_KEY
+Zero-downtime key rotation:
+  1. Set BOT_ID_INDEX_KEY explicitly (to the old ENCRYPTION_KEY if it was never set)
+  2. Set ENCRYPTION_KEY=<new key> and ENCRYPTION_OLD_KEYS=<old key>, restart the app
+     (reads accept both keys, new writes use the new key)
+  3. Run this script, it can be stopped and resumed at any time
+  4. Once it reports 0 rows left on old keys, remove ENCRYPTION_OLD_KEYS and restart
+"""
+import sys
+import os
+import json
+import time
+import argparse
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import InvalidToken
+from sqlalchemy import bindparam
+from app import create_app
+from config import Config
+from models import db, UserBot
+from utils.encryption import _get_fernet, _load_key
+
+def _read_checkpoint(path):
+    if path and os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('last_assign_id', 0)
+    return 0
+
+def _write_checkpoint(path, last_id):
+    if path:
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'last_assign_id': last_id}, f)
+        os.replace(tmp_path, path)
+
+def rotate(batch_size=200, sleep=0.5, start_after=None, checkpoint=None, dry_run=False, app=None):
+    app = app or create_app()
+    with app.app_context():
+        fernet = _get_fernet()
+        primary = _load_key(Config.ENCRYPTION_KEY)
+        last_id = start_after if start_after is not None else _read_checkpoint(checkpoint)
+        total = UserBot.query.filter(UserBot.assign_id > last_id).count()
+        processed = rotated = changed = skipped = failed = 0
+        # Compare-and-swap so a row changed by live traffic in between is left alone
+        update_stmt = (UserBot.__table__.update()
+                       .where(UserBot.assign_id == bindparam('b_assign_id'),
+                              UserBot.bot_id == bindparam('b_old_bot_id'))
+                       .values(bot_id=bindparam('b_new_bot_id')))
+        print(f"Rotating {total} row(s) after assign_id {last_id}, batch size {batch_size}")
+        while True:
+            rows = (db.session.query(UserBot.assign_id, UserBot.bot_id)
+                    .filter(UserBot.assign_id > last_id)
+                    .order_by(UserBot.assign_id)
+                    .limit(batch_size)
+                    .all())
+            if not rows:
+                break
+            updates = []
+            for assign_id, token in rows:
+                last_id = assign_id
+                try:
+                    # Already on the primary key, nothing to do (makes re-runs cheap)
+                    primary.decrypt(token.encode())
+                    skipped += 1
+                    continue
+                except InvalidToken:
+                    pass
+                try:
+                    new_token = fernet.rotate(token.encode()).decode()
+                except InvalidToken:
+                    print(f"✗ assign_id {assign_id}: no configured key can decrypt bot_id, skipped")
+                    failed += 1
+                    continue
+                updates.append({'b_assign_id': assign_id, 'b_old_bot_id': token, 'b_new_bot_id': new_token})
+            if updates and not dry_run:
+                # One statement per row: a row whose ciphertext changed meanwhile matches nothing
+                updated = sum(db.session.execute(update_stmt, params).rowcount for params in updates)
+                db.session.commit()
+                rotated += updated
+                changed += len(updates) - updated
+            else:
+                db.session.rollback()
+                rotated += len(updates)
+            processed += len(rows)
+            _write_checkpoint(checkpoint, last_id)
+            print(f"  ... {processed}/{total} processed, {rotated} rotated, {changed} changed concurrently, "
+                  f"{skipped} already current, {failed} failed (last assign_id {last_id})")
+            if sleep:
+                time.sleep(sleep)
+        # Rows changed concurrently were written by the app, so with the primary key already
+        print(f"✓ Rotation {'dry run ' if dry_run else ''}complete: {rotated} rotated, "
+              f"{changed} changed concurrently (left alone), {skipped} already current, {failed} failed")
+        return failed == 0
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Re-encrypt user_bot.bot_id with the primary ENCRYPTION_KEY')
+    parser.add_argument('--batch-size', type=int, default=200, help='rows per transaction')
+    parser.add_argument('--sleep', type=float, default=0.5, help='seconds to pause between batches')
+    parser.add_argument('--start-after', type=int, default=None, help='resume after this assign_id')
+    parser.add_argument('--checkpoint', default=None,
+                        help='file recording the last processed assign_id, used to resume')
+    parser.add_argument('--dry-run', action='store_true', help='report what would change without writing')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("BotCommander encryption key rotation")
+    print("=" * 60)
+    if not os.getenv('BOT_ID_INDEX_KEY'):
+        print("✗ BOT_ID_INDEX_KEY is not set. It defaults to ENCRYPTION_KEY, so rotating")
+        print("  the key would break bot_id lookups. Set it to the previous key first.")
+        sys.exit(1)
+    if not Config.ENCRYPTION_OLD_KEYS:
+        print("ℹ ENCRYPTION_OLD_KEYS is empty, only rows not on the primary key will be reported.")
+    ok = rotate(args.batch_size, args.sleep, args.start_after, args.checkpoint, args.dry_run)
+    print("=" * 60)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,181 @@
+"""
+Outbox dispatcher for BotCommander
+Delivers the commands queued in bot_outbox (see utils/outbox.py) to the bot
+API at BOT_DISPATCH_URL. Runs as its own process next to the web workers:
+
+    python dispatcher.py
+
+- At most DISPATCH_CONCURRENCY requests in flight, commands for the same bot
+  are delivered one at a time and in order
+- Failures are retried with exponential backoff (DISPATCH_BACKOFF_BASE,
+  capped at DISPATCH_BACKOFF_MAX) up to DISPATCH_MAX_ATTEMPTS, then marked failed
+- Every request carries the row's Idempotency-Key, so a retry after a lost
+  response is harmless
+- Rows are claimed with a compare-and-swap on next_attempt_at, so several
+  dispatchers can run side by side and a crashed one's rows are picked up
+  again once the claim expires
+"""
+import json
+import logging
+import random
+import signal
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from app import create_app
+from models import db, BotOutbox, UserBot
+from utils.encryption import decrypt_bot_id
+
+logger = logging.getLogger('dispatcher')
+
+# HTTP statuses worth retrying; any other 4xx is a permanent failure
+RETRY_STATUSES = {408, 425, 429}
+
+class DeliveryError(Exception):
+    def __init__(self, message, retry=True):
+        super().__init__(message)
+        self.retry = retry
+
+class OutboxDispatcher:
+    """Drains bot_outbox in batches"""
+
+    def __init__(self, app):
+        config = app.config
+        self.app = app
+        self.url = config['BOT_DISPATCH_URL']
+        self.concurrency = config['DISPATCH_CONCURRENCY']
+        self.batch_size = config['DISPATCH_BATCH_SIZE']
+        self.poll_interval = config['DISPATCH_POLL_INTERVAL']
+        self.timeout = config['DISPATCH_TIMEOUT']
+        self.max_attempts = config['DISPATCH_MAX_ATTEMPTS']
+        self.backoff_base = config['DISPATCH_BACKOFF_BASE']
+        self.backoff_max = config['DISPATCH_BACKOFF_MAX']
+        # A claimed row is retried by anyone once the claim is this old
+        self.claim_timeout = timedelta(seconds=self.timeout * 2 + 30)
+        self.executor = ThreadPoolExecutor(self.concurrency, thread_name_prefix='dispatch')
+        self.running = True
+
+    def backoff(self, attempts):
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _claim(self):
+        """Claim due rows that are the oldest pending command of their bot"""
+        now = datetime.utcnow()
+        due = (db.session.query(BotOutbox.outbox_id, BotOutbox.assign_id, BotOutbox.next_attempt_at)
+               .filter(BotOutbox.status == 'pending', BotOutbox.next_attempt_at <= now)
+               .order_by(BotOutbox.outbox_id)
+               .limit(self.batch_size)
+               .all())
+        if not due:
+            return []
+        # Commands for one bot go out in order, only its oldest pending one is eligible
+        heads = {outbox_id for (outbox_id,) in
+                 db.session.query(func.min(BotOutbox.outbox_id))
+                 .filter(BotOutbox.status == 'pending',
+                         BotOutbox.assign_id.in_({row.assign_id for row in due}))
+                 .group_by(BotOutbox.assign_id)}
+        claimed = []
+        for row in due:
+            if row.outbox_id not in heads:
+                continue
+            result = db.session.execute(
+                BotOutbox.__table__.update()
+                .where(BotOutbox.outbox_id == row.outbox_id,
+                       BotOutbox.status == 'pending',
+                       BotOutbox.next_attempt_at == row.next_attempt_at)
+                .values(next_attempt_at=now + self.claim_timeout))
+            if result.rowcount == 1:
+                claimed.append(row.outbox_id)
+        db.session.commit()
+        if not claimed:
+            return []
+        return (db.session.query(BotOutbox, UserBot.bot_id)
+                .join(UserBot, UserBot.assign_id == BotOutbox.assign_id)
+                .filter(BotOutbox.outbox_id.in_(claimed))
+                .all())
+
+    def _send(self, url, payload, idempotency_key):
+        request = urllib.request.Request(
+            url, data=payload.encode('utf-8'), method='POST',
+            headers={'Content-Type': 'application/json', 'Idempotency-Key': idempotency_key})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+        except urllib.error.HTTPError as e:
+            # 409: the bot already applied this idempotency key
+            if e.code == 409:
+                return
+            raise DeliveryError(f'HTTP {e.code}', retry=e.code >= 500 or e.code in RETRY_STATUSES)
+        except (urllib.error.URLError, OSError) as e:
+            raise DeliveryError(str(getattr(e, 'reason', e)))
+
+    def run_once(self):
+        """Deliver one batch, returns the number of rows attempted"""
+        with self.app.app_context():
+            rows = self._claim()
+            futures = []
+            for outbox, encrypted_bot_id in rows:
+                bot_id = decrypt_bot_id(encrypted_bot_id)
+                url = self.url.format(bot_id=urllib.parse.quote(bot_id, safe=''), assign_id=outbox.assign_id)
+                payload = json.dumps(dict(json.loads(outbox.payload), bot_id=bot_id))
+                futures.append((outbox, self.executor.submit(self._send, url, payload, outbox.idempotency_key)))
+            for outbox, future in futures:
+                try:
+                    future.result()
+                except DeliveryError as e:
+                    outbox.attempts += 1
+                    outbox.last_error = str(e)[:255]
+                    if not e.retry or outbox.attempts >= self.max_attempts:
+                        outbox.status = 'failed'
+                        logger.warning('Bot command failed', extra={'outbox_id': outbox.outbox_id,
+                                                                    'assign_id': outbox.assign_id,
+                                                                    'error': outbox.last_error})
+                    else:
+                        outbox.next_attempt_at = datetime.utcnow() + timedelta(seconds=self.backoff(outbox.attempts))
+                else:
+                    outbox.attempts += 1
+                    outbox.status = 'delivered'
+                    outbox.delivered_on = datetime.utcnow()
+                    outbox.last_error = None
+            db.session.commit()
+            db.session.remove()
+            return len(rows)
+
+    def run(self):
+        logger.info('Dispatcher started', extra={'url': self.url, 'concurrency': self.concurrency})
+        while self.running:
+            try:
+                attempted = self.run_once()
+            except Exception:
+                logger.exception('Dispatch cycle failed')
+                attempted = 0
+            if not attempted:
+                time.sleep(self.poll_interval)
+        self.executor.shutdown(wait=True)
+        logger.info('Dispatcher stopped')
+
+    def stop(self, *args):
+        self.running = False
+
+if __name__ == '__main__':
+    app = create_app()
+    if not app.config.get('BOT_DISPATCH_URL'):
+        print("Error: BOT_DISPATCH_URL is not set, there is nothing to dispatch to.")
+        raise SystemExit(1)
+
+    print("=" * 60)
+    print("BotCommander outbox dispatcher")
+    print("=" * 60)
+    print(f"Delivering to {app.config['BOT_DISPATCH_URL']} "
+          f"with {app.config['DISPATCH_CONCURRENCY']} concurrent request(s)")
+    print("=" * 60 + "\n")
+
+    dispatcher = OutboxDispatcher(app)
+    signal.signal(signal.SIGINT, dispatcher.stop)
+    signal.signal(signal.SIGTERM, dispatcher.stop)
+    dispatcher.run()
@@ -1,7 +1,11 @@
+import logging
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from utils.db_pool import RoutingSession
 
-db = SQLAlchemy()
+logger = logging.getLogger(__name__)
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model):
     __tablename__ = 'user'
@@ -51,16 +55,27 @@ class UserBot(db.Model):
     assign_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.user_id', ondelete='CASCADE'), nullable=False)
     bot_id = db.Column(db.Text, nullable=False, unique=True)  # Encrypted bot_id stored as text, unique
+    bot_id_hash = db.Column(db.String(64), nullable=True, unique=True, index=True)  # HMAC blind index of bot_id, NULL once unassigned
     allow_admin_control = db.Column(db.Boolean, default=False, nullable=False)  # Allow admin to control this bot
     validity = db.Column(db.DateTime, nullable=True)  # Validity datetime for bot assignment
+    version = db.Column(db.Integer, default=1, nullable=False)  # Bumped on every change, used as ETag
     created_on = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     created_by = db.Column(db.Integer, db.ForeignKey('user.user_id'), nullable=True)
     updated_on = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
     updated_by = db.Column(db.Integer, db.ForeignKey('user.user_id'), nullable=True)
     is_active = db.Column(db.Boolean, default=True, nullable=False)
     
+    __table_args__ = (
+        # Keyset pagination of a user's bots: WHERE user_id = ? AND is_active = ? ORDER BY assign_id
+        db.Index('idx_user_active_assign', 'user_id', 'is_active', 'assign_id'),
+        # Upcoming expirations for utils/expiry.py: WHERE is_active = ? AND validity BETWEEN ? AND ?
+        db.Index('idx_active_validity', 'is_active', 'validity'),
+    )
+    
     # Relationships
     behaviour = db.relationship('BotBehaviour', backref='user_bot', uselist=False, cascade='all, delete-orphan')
+    # Written only by utils/heartbeat.py, removed by the ON DELETE CASCADE
+    heartbeat = db.relationship('BotHeartbeat', uselist=False, viewonly=True)
     
     def to_dict(self, decrypt_bot_id=False):
         from utils.encryption import decrypt_bot_id as decrypt
@@ -70,7 +85,7 @@ class UserBot(db.Model):
                 bot_id_decrypted = decrypt(self.bot_id)
             except Exception as e:
                 # Handle decryption errors gracefully
-                print(f"Warning: Failed to decrypt bot_id for assign_id {self.assign_id}: {str(e)}")
+                logger.warning('Failed to decrypt bot_id', extra={'assign_id': self.assign_id, 'error': str(e)})
                 bot_id_decrypted = "[Decryption Failed]"
         data = {
             'assign_id': self.assign_id,
@@ -78,6 +93,7 @@ class UserBot(db.Model):
             'bot_id': bot_id_decrypted,
             'allow_admin_control': self.allow_admin_control,
             'validity': self.validity.isoformat() if self.validity else None,
+            'version': self.version,
             'is_active': self.is_active,
             'created_on': self.created_on.isoformat() if self.created_on else None,
             'updated_on': self.updated_on.isoformat() if self.updated_on else None
@@ -94,6 +110,7 @@ class BotBehaviour(db.Model):
     listen_to_common_commander = db.Column(db.Boolean, default=False, nullable=False)
     news_based_start_stop = db.Column(db.Boolean, default=False, nullable=False)
     refresh_data_from_bot = db.Column(db.Boolean, default=False, nullable=False)
+    version = db.Column(db.Integer, default=1, nullable=False)  # Bumped on every behaviour change
     created_on = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     created_by = db.Column(db.Integer, db.ForeignKey('user.user_id'), nullable=True)
     updated_on = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
@@ -109,8 +126,143 @@ class BotBehaviour(db.Model):
             'listen_to_common_commander': self.listen_to_common_commander,
             'news_based_start_stop': self.news_based_start_stop,
             'refresh_data_from_bot': self.refresh_data_from_bot,
+            'version': self.version,
             'created_on': self.created_on.isoformat() if self.created_on else None,
             'updated_on': self.updated_on.isoformat() if self.updated_on else None,
             'is_active': self.is_active
         }
 
+
+class CommonCommander(db.Model):
+    __tablename__ = 'common_commander'
+    
+    # Single global row (commander_id = 1) applied at poll time to every bot
+    # with listen_to_common_commander, so a broadcast is one UPDATE
+    commander_id = db.Column(db.Integer, primary_key=True)
+    bot_state = db.Column(db.Boolean, default=False, nullable=False)
+    hard_stop_all_trades = db.Column(db.Boolean, default=False, nullable=False)
+    news_based_start_stop = db.Column(db.Boolean, default=False, nullable=False)
+    emergency_stop = db.Column(db.Boolean, default=False, nullable=False)  # Overrides every bot, listening or not
+    version = db.Column(db.Integer, default=1, nullable=False)
+    updated_on = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    updated_by = db.Column(db.Integer, db.ForeignKey('user.user_id', ondelete='SET NULL'), nullable=True)
+    
+    def to_dict(self):
+        return {
+            'bot_state': self.bot_state,
+            'hard_stop_all_trades': self.hard_stop_all_trades,
+            'news_based_start_stop': self.news_based_start_stop,
+            'emergency_stop': self.emergency_stop,
+            'version': self.version,
+            'updated_on': self.updated_on.isoformat() if self.updated_on else None,
+            'updated_by': self.updated_by
+        }
+
+class BotCommandLog(db.Model):
+    __tablename__ = 'bot_command_log'
+    
+    # Append-only history of control changes, written in the same transaction as the change.
+    # No foreign keys: the MySQL table is partitioned by month (see 13_add_bot_command_log_table.sql)
+    log_id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True, autoincrement=True)
+    assign_id = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.String(50), nullable=False)
+    old_value = db.Column(db.String(255), nullable=True)
+    new_value = db.Column(db.String(255), nullable=True)
+    actor_id = db.Column(db.Integer, nullable=True)
+    created_on = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    __table_args__ = (
+        db.Index('idx_command_log_created', 'created_on'),
+        db.Index('idx_command_log_assign_created', 'assign_id', 'created_on'),
+    )
+    
+    def to_dict(self):
+        return {
+            'log_id': self.log_id,
+            'assign_id': self.assign_id,
+            'action': self.action,
+            'old_value': self.old_value,
+            'new_value': self.new_value,
+            'actor_id': self.actor_id,
+            'created_on': self.created_on.isoformat() if self.created_on else None
+        }
+
+class BotOutbox(db.Model):
+    __tablename__ = 'bot_outbox'
+    
+    # Commands for the bot API, written in the same transaction as the behaviour change
+    # and delivered by the dispatcher process (dispatcher.py)
+    outbox_id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True, autoincrement=True)
+    assign_id = db.Column(db.Integer, db.ForeignKey('user_bot.assign_id', ondelete='CASCADE'), nullable=False)
+    idempotency_key = db.Column(db.String(36), unique=True, nullable=False)  # Sent as Idempotency-Key
+    action = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON body
+    status = db.Column(db.String(20), default='pending', nullable=False)  # pending, delivered, failed
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    last_error = db.Column(db.String(255), nullable=True)
+    created_on = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    delivered_on = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        db.Index('idx_outbox_status_next', 'status', 'next_attempt_at'),
+        db.Index('idx_outbox_assign', 'assign_id', 'outbox_id'),
+    )
+    
+    def to_dict(self):
+        return {
+            'outbox_id': self.outbox_id,
+            'action': self.action,
+            'status': self.status,
+            'attempts': self.attempts,
+            'next_attempt_at': self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            'last_error': self.last_error,
+            'created_on': self.created_on.isoformat() if self.created_on else None,
+            'delivered_on': self.delivered_on.isoformat() if self.delivered_on else None
+        }
+
+class BotHeartbeat(db.Model):
+    __tablename__ = 'bot_heartbeat'
+    
+    # Last poll and latest telemetry of a bot, one row per assignment. Written in
+    # batched upserts by utils/heartbeat.py, never on the request path
+    assign_id = db.Column(db.Integer, db.ForeignKey('user_bot.assign_id', ondelete='CASCADE'), primary_key=True)
+    last_seen = db.Column(db.DateTime, nullable=False)
+    equity = db.Column(db.Numeric(18, 2), nullable=True)
+    open_trades = db.Column(db.Integer, nullable=True)
+    bot_version = db.Column(db.String(32), nullable=True)  # Version string reported by the bot
+    updated_on = db.Column(db.DateTime, nullable=True)  # When telemetry was last reported
+    
+    def to_dict(self):
+        return {
+            'last_seen': self.last_seen.isoformat() if self.last_seen else None,
+            'equity': float(self.equity) if self.equity is not None else None,
+            'open_trades': self.open_trades,
+            'bot_version': self.bot_version,
+            'updated_on': self.updated_on.isoformat() if self.updated_on else None
+        }
+
+class BotToken(db.Model):
+    __tablename__ = 'bot_token'
+    
+    # API tokens of a bot assignment. Only a keyed hash of the secret part is stored;
+    # the public prefix is indexed so a token is found without scanning (utils/bot_tokens.py)
+    token_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    assign_id = db.Column(db.Integer, db.ForeignKey('user_bot.assign_id', ondelete='CASCADE'), nullable=False, index=True)
+    prefix = db.Column(db.String(16), unique=True, nullable=False)
+    token_hash = db.Column(db.String(64), nullable=False)  # HMAC-SHA256 of the secret, hex
+    is_active = db.Column(db.Boolean, default=True, nullable=False)
+    created_on = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    created_by = db.Column(db.Integer, db.ForeignKey('user.user_id', ondelete='SET NULL'), nullable=True)
+    revoked_on = db.Column(db.DateTime, nullable=True)
+    
+    def to_dict(self):
+        return {
+            'token_id': self.token_id,
+            'assign_id': self.assign_id,
+            'prefix': self.prefix,
+            'is_active': self.is_active,
+            'created_on': self.created_on.isoformat() if self.created_on else None,
+            'created_by': self.created_by,
+            'revoked_on': self.revoked_on.isoformat() if self.revoked_on else None
+        }
@@ -0,0 +1,23 @@
+from flask import Blueprint, jsonify
+from models import db
+from utils.auth import require_admin
+from utils.db_pool import pool_stats, REPLICA_BIND
+from utils.sessions import session_store
+
+admin_bp = Blueprint('admin', __name__, url_prefix='/api/admin')
+
+@admin_bp.route('/db/pool', methods=['GET'])
+@require_admin
+def get_pool_stats():
+    """Connection pool usage of this worker (admin only)"""
+    pools = {'primary': pool_stats(db.engine)}
+    replica = db.engines.get(REPLICA_BIND)
+    if replica is not None:
+        pools['replica'] = pool_stats(replica)
+    return jsonify({'pools': pools}), 200
+
+@admin_bp.route('/sessions', methods=['GET'])
+@require_admin
+def get_session_stats():
+    """Open sessions, and the session records cached by this worker (admin only)"""
+    return jsonify({'sessions': session_store.count(), 'cached': session_store.stats()}), 200
@@ -1,6 +1,11 @@
+import logging
 from flask import Blueprint, request, jsonify, session
 from models import User, Login, db
-from utils.auth import login_user, logout_user, get_current_user, hash_password, require_login
+from utils.auth import (login_user, logout_user, get_current_user, hash_password, require_login, normalize_email,
+                        login_ip_limiter, login_email_limiter, PasswordHasherBusy)
+from utils.invalidation import sessions_ended
+
+logger = logging.getLogger(__name__)
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/api')
 
@@ -8,8 +13,8 @@ auth_bp = Blueprint('auth', __name__, url_prefix='/api')
 def login():
     """User login endpoint"""
     try:
-        data = request.get_json()
-        if not data:
+        data = request.get_json(silent=True)
+        if not data or not isinstance(data, dict):
             return jsonify({'error': 'Invalid request data'}), 400
             
         email = data.get('email')
@@ -17,6 +22,17 @@ def login():
         
         if not email or not password:
             return jsonify({'error': 'Email and password are required'}), 400
+        if not isinstance(email, str) or not isinstance(password, str):
+            return jsonify({'error': 'Email and password must be strings'}), 400
+        # The rate limit key and the lookup use the same address
+        email = normalize_email(email)
+        
+        # Refuse floods before any bcrypt work is done
+        for limiter, key in ((login_ip_limiter, request.remote_addr), (login_email_limiter, email)):
+            allowed, retry_after = limiter.allow(key)
+            if not allowed:
+                logger.warning('Login rate limited', extra={'remote_addr': request.remote_addr})
+                return jsonify({'error': 'Too many login attempts, retry later'}), 429, {'Retry-After': str(int(retry_after) + 1)}
         
         user, error = login_user(email, password)
         if error:
@@ -26,17 +42,19 @@ def login():
             'message': 'Login successful',
             'user': user.to_dict()
         }), 200
+    except PasswordHasherBusy:
+        return jsonify({'error': 'Too many login attempts in progress, retry later'}), 503, {'Retry-After': '1'}
     except Exception as e:
-        import traceback
-        print(f"Login error: {str(e)}")
-        print(traceback.format_exc())
+        logger.exception('Login error')
         return jsonify({'error': f'Internal server error: {str(e)}'}), 500
 
 @auth_bp.route('/logout', methods=['POST'])
 @require_login
 def logout():
     """User logout endpoint"""
-    logout_user()
+    key = logout_user()
+    if key:
+        sessions_ended([key])
     return jsonify({'message': 'Logout successful'}), 200
 
 @auth_bp.route('/me', methods=['GET'])
@@ -0,0 +1,210 @@
+import logging
+import time
+from flask import Blueprint, Response, current_app, g, request, jsonify, stream_with_context
+from models import db
+from utils.bot_state import (bot_state_query, row_to_bot_state, apply_commander, is_state_valid, state_etag,
+                             render_state, compact_validity, wants_compact, COMPACT_MIMETYPE)
+from utils.cache import bot_state_cache
+from utils.commander import get_commander
+from utils.bot_tokens import require_bot_token
+from utils.encryption import hash_bot_id
+from utils.heartbeat import heartbeat_buffer, parse_telemetry
+from utils.log import log_sampled
+from utils.http import is_not_modified, not_modified, with_etag
+from utils.notify import bot_notifier, TooManyListeners
+
+logger = logging.getLogger(__name__)
+
+# Bot-facing endpoints polled by the MT5 bots themselves (no user session). A bot
+# identifies itself with its API token (Authorization: Bearer) or, unless
+# BOT_TOKEN_REQUIRED is set, with its plaintext bot_id
+bot_api_bp = Blueprint('bot_api', __name__, url_prefix='/api/bots')
+
+@bot_api_bp.after_request
+def log_bot_request(response):
+    # Thousands of polls per second, so only a sample is logged
+    log_sampled(logger, logging.INFO, current_app.config['LOG_BOT_REQUEST_SAMPLE_RATE'], 'Bot request',
+                endpoint=request.endpoint, status=response.status_code)
+    return response
+
+def get_bot_state(key):
+    """Get the effective bot state for a bot_id_hash, served from cache when possible"""
+    found, state = bot_state_cache.get(key)
+    if not found:
+        generation = bot_state_cache.generation()
+        state = row_to_bot_state(db.session.execute(bot_state_query(key)).first())
+        bot_state_cache.set(key, state, generation)
+    if state is None:
+        return None
+    return apply_commander(state, get_commander())
+
+def _release_db():
+    # Streams outlive a normal request, don't hold a pooled connection while idle
+    db.session.close()
+
+def _wants_compact():
+    return wants_compact(request.args.get('format'), request.headers.get('Accept'))
+
+def _etag(state, compact):
+    # Each representation gets its own validator
+    return state_etag(state) + ('-c' if compact else '')
+
+def _state_response(state, compact):
+    """Pre-rendered JSON or compact body of a state, with its ETag"""
+    mimetype = COMPACT_MIMETYPE if compact else 'application/json'
+    response = Response(render_state(state, compact), mimetype=mimetype)
+    response.vary.add('Accept')
+    return with_etag(response, _etag(state, compact))
+
+def _get_request_bot_id():
+    bot_id = request.args.get('bot_id')
+    if not bot_id and request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        bot_id = data.get('bot_id')
+    return bot_id
+
+def _get_request_bot_key():
+    """bot_id_hash of the calling bot: from its token, else from bot_id (None if neither)"""
+    if g.bot_token is not None:
+        return g.bot_token['bot_id_hash']
+    bot_id = _get_request_bot_id()
+    return hash_bot_id(bot_id) if bot_id else None
+
+@bot_api_bp.route('/poll', methods=['GET'])
+@require_bot_token
+def poll_bot():
+    """Bot state for polling bots, JSON or the one-line compact format"""
+    key = _get_request_bot_key()
+    if not key:
+        return jsonify({'error': 'bot_id is required'}), 400
+    state = get_bot_state(key)
+    if state is None:
+        return jsonify({'error': 'Bot not found'}), 404
+    heartbeat_buffer.record(state['assign_id'])
+    compact = _wants_compact()
+    etag = _etag(state, compact)
+    if is_not_modified(etag):
+        return not_modified(etag)
+    return _state_response(state, compact)
+
+@bot_api_bp.route('/check_validity', methods=['POST'])
+@require_bot_token
+def check_validity():
+    """Check whether a bot assignment is still valid"""
+    key = _get_request_bot_key()
+    if not key:
+        return jsonify({'error': 'bot_id is required'}), 400
+    state = get_bot_state(key)
+    if state is None:
+        return jsonify({'valid': False, 'error': 'Bot not found'}), 404
+    heartbeat_buffer.record(state['assign_id'])
+    if _wants_compact():
+        return Response(compact_validity(state), mimetype=COMPACT_MIMETYPE)
+    validity = state['validity']
+    return jsonify({
+        'valid': is_state_valid(state),
+        'validity': validity.isoformat() if validity else None
+    }), 200
+
+@bot_api_bp.route('/heartbeat', methods=['POST'])
+@require_bot_token
+def heartbeat():
+    """Report telemetry: {bot_id, equity, open_trades, version}, all optional (bot_id without a token)"""
+    data = request.get_json(silent=True)
+    if data is None:
+        data = {}  # A bot with a token may send no body at all
+    if not isinstance(data, dict):
+        return jsonify({'error': 'bot_id is required'}), 400
+    key = _get_request_bot_key()
+    if not key:
+        return jsonify({'error': 'bot_id is required'}), 400
+    telemetry, error = parse_telemetry(data)
+    if error:
+        return jsonify({'error': error}), 400
+    state = get_bot_state(key)
+    if state is None:
+        return jsonify({'error': 'Bot not found'}), 404
+    heartbeat_buffer.record(state['assign_id'], telemetry)
+    return '', 204
+
+@bot_api_bp.route('/wait', methods=['GET'])
+@require_bot_token
+def wait_bot():
+    """Long-poll: return the bot state as soon as it differs from ?version=
+
+    Responds 304 when nothing changed within the timeout (capped by
+    LONG_POLL_TIMEOUT) so the bot simply re-issues the request.
+    """
+    key = _get_request_bot_key()
+    if not key:
+        return jsonify({'error': 'bot_id is required'}), 400
+    known_version = request.args.get('version', type=int)
+    compact = _wants_compact()
+    max_timeout = current_app.config['LONG_POLL_TIMEOUT']
+    timeout = min(request.args.get('timeout', max_timeout, type=float), max_timeout)
+    state = get_bot_state(key)
+    if state is None:
+        return jsonify({'error': 'Bot not found'}), 404
+    heartbeat_buffer.record(state['assign_id'])
+    _release_db()
+    try:
+        with bot_notifier.listen(state['assign_id']) as event:
+            deadline = time.monotonic() + timeout
+            while True:
+                state = get_bot_state(key)
+                _release_db()
+                if state is None:
+                    return jsonify({'error': 'Bot not found'}), 404
+                if state['version'] != known_version:
+                    return _state_response(state, compact)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not event.wait(remaining):
+                    return not_modified(_etag(state, compact))
+                event.clear()
+    except TooManyListeners:
+        return jsonify({'error': 'Too many open connections, retry later'}), 503, {'Retry-After': '5'}
+
+@bot_api_bp.route('/stream', methods=['GET'])
+@require_bot_token
+def stream_bot():
+    """Server-Sent Events stream of bot state changes"""
+    key = _get_request_bot_key()
+    if not key:
+        return jsonify({'error': 'bot_id is required'}), 400
+    state = get_bot_state(key)
+    if state is None:
+        return jsonify({'error': 'Bot not found'}), 404
+    _release_db()
+    assign_id = state['assign_id']
+    heartbeat_buffer.record(assign_id)
+    heartbeat = current_app.config['SSE_HEARTBEAT_INTERVAL']
+    max_duration = current_app.config['SSE_MAX_DURATION']
+    compact = _wants_compact()
+    try:
+        event = bot_notifier.acquire(assign_id)
+    except TooManyListeners:
+        return jsonify({'error': 'Too many open connections, retry later'}), 503, {'Retry-After': '5'}
+
+    def generate():
+        sent_etag = None
+        deadline = time.monotonic() + max_duration
+        while time.monotonic() < deadline:
+            current = get_bot_state(key)
+            _release_db()
+            if current is None:
+                yield 'event: gone\ndata: {}\n\n'
+                return
+            etag = state_etag(current)
+            if etag != sent_etag:
+                sent_etag = etag
+                yield f"id: {current['version']}\nevent: state\ndata: {render_state(current, compact).rstrip()}\n\n"
+            if event.wait(heartbeat):
+                event.clear()
+            else:
+                yield ': heartbeat\n\n'
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Runs even if the client disconnects before the generator starts
+    response.call_on_close(lambda: bot_notifier.release(assign_id, event))
+    return response
@@ -1,94 +1,234 @@
 
 
 # Place this endpoint after bots_bp is defined
-from flask import Blueprint, request, jsonify
-from models import UserBot, User, BotBehaviour, db
-from utils.auth import require_login, require_admin, get_current_user
-from utils.encryption import encrypt_bot_id, decrypt_bot_id
+import logging
+import time
+from datetime import datetime
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
+from models import UserBot, User, BotBehaviour, BotHeartbeat, BotToken, db
+from utils.auth import require_login, require_admin, get_current_user, get_current_user_id, is_admin
+from utils.encryption import encrypt_bot_id, decrypt_bot_id, hash_bot_id
+from utils.http import is_not_modified, not_modified, with_etag
+from utils.notify import bot_notifier, TooManyListeners
+from utils.invalidation import bots_changed, bot_keys_changed, bot_tokens_changed
+from utils.bot_tokens import issue_token, revoke_tokens
+from utils.pagination import parse_page_args, parse_fields_arg, parse_bool_arg, parse_datetime_arg, keyset_page, serialize_value
+from utils.db_pool import use_replica
+from utils.command_log import record_command, record_commands, command_row
+from utils.outbox import dispatch_enabled, enqueue_command, enqueue_commands, latest_delivery
+from utils.heartbeat import heartbeat_buffer
+from utils.expiry import expiry_scheduler
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+
+logger = logging.getLogger(__name__)
 
 bots_bp = Blueprint('bots', __name__, url_prefix='/api/bots')
 
+# Valid control actions mapping to bots_behaviour columns
+BEHAVIOUR_ACTIONS = {
+    'bot_state': 'bot_state',
+    'hard_stop_all_trades': 'hard_stop_all_trades',
+    'listen_to_common_commander': 'listen_to_common_commander',
+    'news_based_start_stop': 'news_based_start_stop',
+    'refresh_data_from_bot': 'refresh_data_from_bot'
+}
+
+# Fields selectable with ?fields= on the bot list
+BOT_LIST_FIELDS = {
+    'assign_id': UserBot.assign_id,
+    'bot_id': UserBot.bot_id,
+    'user_id': UserBot.user_id,
+    'allow_admin_control': UserBot.allow_admin_control,
+    'validity': UserBot.validity,
+    'is_active': UserBot.is_active,
+    'bot_state': BotBehaviour.bot_state,
+    'hard_stop_all_trades': BotBehaviour.hard_stop_all_trades,
+    'created_on': UserBot.created_on,
+    # From the heartbeat table, joined only when requested
+    'last_seen': BotHeartbeat.last_seen,
+    'online': BotHeartbeat.last_seen
+}
+
+HEARTBEAT_FIELDS = ('last_seen', 'online')
+
 @bots_bp.route('', methods=['GET'])
+@use_replica
 @require_login
 def list_bots():
-    """List bots - for admin: filtered by user_id query param, for users: their own bots"""
+    """List bots - for admin: filtered by user_id query param, for users: their own bots
+
+    Query params: limit, after (assign_id cursor), bot_state, validity_before,
+    online, is_active (admin only), fields
+    """
     try:
-        user = get_current_user()
+        limit, after = parse_page_args()
+        fields = parse_fields_arg(list(BOT_LIST_FIELDS))
+        filter_bot_state = parse_bool_arg('bot_state')
+        validity_before = parse_datetime_arg('validity_before')
+        filter_online = parse_bool_arg('online')
+        filter_is_active = parse_bool_arg('is_active')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        user_id = get_current_user_id()
         # For admin, get user_id from query params (default to self)
-        if user.is_admin:
-            view_user_id = request.args.get('user_id', user.user_id, type=int)
-            # Admin sees all bots for selected user
-            user_bots = UserBot.query.filter_by(user_id=view_user_id, is_active=True).all()
+        if is_admin():
+            view_user_id = request.args.get('user_id', user_id, type=int)
         else:
-            # Regular users see only their own bots
-            user_bots = UserBot.query.filter_by(user_id=user.user_id, is_active=True).all()
+            # Regular users see only their own active bots
+            view_user_id = user_id
+            filter_is_active = True
+        if filter_is_active is None:
+            filter_is_active = True
+        # Single round-trip: only the requested columns, joined with behaviour state
+        columns = [BOT_LIST_FIELDS[f].label(f) for f in fields if f != 'assign_id']
+        query = (db.session.query(UserBot.assign_id, *columns)
+                 .outerjoin(BotBehaviour, (BotBehaviour.assign_id == UserBot.assign_id) & (BotBehaviour.is_active == True))
+                 .filter(UserBot.user_id == view_user_id, UserBot.is_active == filter_is_active))
+        if filter_bot_state is not None:
+            if filter_bot_state:
+                query = query.filter(BotBehaviour.bot_state == True)
+            else:
+                # No behaviour row means the bot is off
+                query = query.filter(db.or_(BotBehaviour.bot_state == False, BotBehaviour.bot_state.is_(None)))
+        if validity_before is not None:
+            query = query.filter(UserBot.validity < validity_before)
+        if filter_online is not None or any(f in HEARTBEAT_FIELDS for f in fields):
+            # Primary key join; the heartbeat table lags this worker's buffer by one flush at most
+            query = query.outerjoin(BotHeartbeat, BotHeartbeat.assign_id == UserBot.assign_id)
+        if filter_online is not None:
+            cutoff = heartbeat_buffer.online_cutoff()
+            if filter_online:
+                query = query.filter(BotHeartbeat.last_seen >= cutoff)
+            else:
+                query = query.filter(db.or_(BotHeartbeat.last_seen < cutoff, BotHeartbeat.last_seen.is_(None)))
+        rows, next_cursor = keyset_page(query, UserBot.assign_id, limit, after)
         bots = []
-        for ub in user_bots:
-            try:
-                bot_data = ub.to_dict(decrypt_bot_id=True)
-                bots.append({
-                    'assign_id': bot_data['assign_id'],
-                    'bot_id': bot_data['bot_id'],
-                    'user_id': bot_data['user_id'],
-                    'allow_admin_control': bot_data['allow_admin_control'],
-                    'created_on': bot_data['created_on']
-                })
-            except Exception as e:
-                # Log error but continue with other bots
-                print(f"Error processing bot {ub.assign_id}: {str(e)}")
-                bots.append({
-                    'assign_id': ub.assign_id,
-                    'user_id': ub.user_id,
-                    'bot_id': '[Decryption Error]',
-                    'allow_admin_control': getattr(ub, 'allow_admin_control', False),
-                    'created_on': ub.created_on.isoformat() if ub.created_on else None
-                })
-        return jsonify({'bots': bots}), 200
+        for row in rows:
+            bot = {}
+            for field in fields:
+                value = getattr(row, field)
+                if field == 'bot_id':
+                    # Only decrypted when requested; never raises, failures come back as a placeholder
+                    value = decrypt_bot_id(value)
+                elif field in ('bot_state', 'hard_stop_all_trades'):
+                    value = bool(value)
+                elif field in HEARTBEAT_FIELDS:
+                    value = heartbeat_buffer.merge_last_seen(row.assign_id, value)
+                    if field == 'online':
+                        value = heartbeat_buffer.is_online(value)
+                bot[field] = serialize_value(value)
+            bots.append(bot)
+        return jsonify({'bots': bots, 'next_cursor': next_cursor}), 200
     except Exception as e:
-        import traceback
-        print(f"Error in list_bots: {str(e)}")
-        print(traceback.format_exc())
+        logger.exception('Error in list_bots')
         return jsonify({'error': f'Failed to load bots: {str(e)}'}), 500
 
+def _default_behaviour(assign_id):
+    """Behaviour of a bot without a bots_behaviour row (all switches off)"""
+    return {
+        'bot_behav_id': None,
+        'assign_id': assign_id,
+        'bot_state': False,
+        'hard_stop_all_trades': False,
+        'listen_to_common_commander': False,
+        'news_based_start_stop': False,
+        'refresh_data_from_bot': False,
+        'version': 0,
+        'created_on': None,
+        'updated_on': None,
+        'is_active': True
+    }
+
 @bots_bp.route('/<int:assign_id>', methods=['GET'])
 @require_login
 def get_bot_details(assign_id):
     """Get bot details by assign_id - checks ownership or admin control permission"""
     try:
-        user = get_current_user()
-        user_bot = UserBot.query.filter_by(assign_id=assign_id, is_active=True).first_or_404()
+        user_id = get_current_user_id()
+        user_is_admin = is_admin()
+        # Assignment, behaviour and heartbeat in one query
+        user_bot = (UserBot.query
+                    .options(joinedload(UserBot.behaviour), joinedload(UserBot.heartbeat))
+                    .filter_by(assign_id=assign_id, is_active=True)
+                    .first())
+        if not user_bot:
+            return jsonify({'error': 'Bot not found'}), 404
         # Check if user can access this bot
-        if user_bot.user_id != user.user_id:
+        if user_bot.user_id != user_id:
             # Admin can view any bot, but controls depend on allow_admin_control
-            if not user.is_admin:
+            if not user_is_admin:
                 return jsonify({'error': 'Access denied'}), 403
+        # The dispatcher and heartbeats update these without bumping the version
+        delivery = latest_delivery(assign_id) if dispatch_enabled() else None
+        heartbeat = user_bot.heartbeat
+        last_seen = heartbeat_buffer.merge_last_seen(assign_id, heartbeat.last_seen if heartbeat else None)
+        online = heartbeat_buffer.is_online(last_seen)
+        # Answer conditional requests before decrypting and serializing. The
+        # response depends on the viewer (can_admin_control), so the user is
+        # part of the ETag.
+        etag = f'{assign_id}-{user_bot.version}-{user_id}'
+        if delivery:
+            etag += f'-{delivery.outbox_id}.{delivery.status}.{delivery.attempts}'
+        if last_seen:
+            etag += f'-{int(last_seen.timestamp())}.{int(online)}'
+        if heartbeat and heartbeat.updated_on:
+            etag += f'.{int(heartbeat.updated_on.timestamp())}'
+        if is_not_modified(etag):
+            return not_modified(etag)
         bot_data = user_bot.to_dict(decrypt_bot_id=True)
         # Add flag for admin control permission (for frontend)
         can_admin_control = False
-        if user.user_id == user_bot.user_id:
+        if user_id == user_bot.user_id:
             can_admin_control = True  # Owner always has control
-        elif user.is_admin:
+        elif user_is_admin:
             can_admin_control = bool(user_bot.allow_admin_control)
         bot_data['can_admin_control'] = can_admin_control
-        # Get or create bot behaviour
-        behaviour = BotBehaviour.query.filter_by(assign_id=assign_id, is_active=True).first()
-        if not behaviour:
-            # Create default behaviour record
-            behaviour = BotBehaviour(
-                assign_id=assign_id,
-                created_by=user.user_id
-            )
-            db.session.add(behaviour)
-            db.session.commit()
-        bot_data['behaviour'] = behaviour.to_dict()
-        return jsonify({'bot': bot_data}), 200
+        # A missing behaviour row just means defaults, don't write on a GET
+        behaviour = user_bot.behaviour
+        if behaviour and behaviour.is_active:
+            bot_data['behaviour'] = behaviour.to_dict()
+        else:
+            bot_data['behaviour'] = _default_behaviour(assign_id)
+        bot_data['delivery'] = delivery.to_dict() if delivery else None
+        bot_data['heartbeat'] = dict(heartbeat.to_dict() if heartbeat else {},
+                                     last_seen=serialize_value(last_seen), online=online)
+        return with_etag(jsonify({'bot': bot_data}), etag)
     except Exception as e:
-        import traceback
-        print(f"Error in get_bot_details: {str(e)}")
-        print(traceback.format_exc())
+        logger.exception('Error in get_bot_details', extra={'assign_id': assign_id})
         return jsonify({'error': f'Failed to load bot details: {str(e)}'}), 500
 
+@bots_bp.route('/<int:assign_id>/events', methods=['GET'])
+@require_login
+def bot_events(assign_id):
+    """Server-Sent Events stream telling the bot details page to reload"""
+    user = get_current_user()
+    user_bot = UserBot.query.filter_by(assign_id=assign_id, is_active=True).first_or_404()
+    if user_bot.user_id != user.user_id and not user.is_admin:
+        return jsonify({'error': 'Access denied'}), 403
+    db.session.close()
+    heartbeat = current_app.config['SSE_HEARTBEAT_INTERVAL']
+    max_duration = current_app.config['SSE_MAX_DURATION']
+    try:
+        event = bot_notifier.acquire(assign_id)
+    except TooManyListeners:
+        return jsonify({'error': 'Too many open connections, retry later'}), 503, {'Retry-After': '5'}
+
+    def generate():
+        deadline = time.monotonic() + max_duration
+        while time.monotonic() < deadline:
+            if event.wait(heartbeat):
+                event.clear()
+                yield 'event: changed\ndata: {}\n\n'
+            else:
+                yield ': heartbeat\n\n'
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(lambda: bot_notifier.release(assign_id, event))
+    return response
+
 @bots_bp.route('', methods=['POST'])
 @require_admin
 def assign_bot():
@@ -103,20 +243,22 @@ def assign_bot():
     # Verify user exists
     user = User.query.get_or_404(user_id)
     
-    # Encrypt bot_id
-    encrypted_bot_id = encrypt_bot_id(bot_id)
-    
-    # Check if bot_id already exists
-    existing_bot = UserBot.query.filter_by(bot_id=encrypted_bot_id, is_active=True).first()
+    # Check if bot_id already exists (single indexed lookup on the blind index)
+    bot_id_hash = hash_bot_id(bot_id)
+    existing_bot = UserBot.query.filter_by(bot_id_hash=bot_id_hash, is_active=True).first()
     if existing_bot:
         return jsonify({'error': 'This bot is already assigned to another user'}), 400
     
+    # Encrypt bot_id
+    encrypted_bot_id = encrypt_bot_id(bot_id)
+    
     # Create assignment
     current_user = get_current_user()
     try:
         user_bot = UserBot(
             user_id=user_id,
             bot_id=encrypted_bot_id,
+            bot_id_hash=bot_id_hash,
             created_by=current_user.user_id if current_user else None
         )
         db.session.add(user_bot)
@@ -129,6 +271,7 @@ def assign_bot():
         )
         db.session.add(behaviour)
         db.session.commit()
+        bot_keys_changed([bot_id_hash])
     except IntegrityError as e:
         db.session.rollback()
         # Check if it's a unique constraint violation
@@ -157,26 +300,33 @@ def control_bot(assign_id):
     if action == 'validity':
         if not user.is_admin:
             return jsonify({'error': 'Only admin can update validity'}), 403
-        from datetime import datetime
         try:
-            print('Received validity value:', value)  # Debug print
             # Remove trailing Z if present (Z = UTC)
             val = value.rstrip('Z') if value else None
-            user_bot.validity = datetime.fromisoformat(val) if val else None
-            print('Parsed validity:', user_bot.validity)  # Debug print
-            user_bot.updated_by = user.user_id
-            db.session.commit()
-            return jsonify({'message': 'Validity updated successfully', 'validity': user_bot.validity.isoformat() if user_bot.validity else None}), 200
-        except Exception as e:
-            print('Error parsing validity:', str(e))  # Debug print
+            validity = datetime.fromisoformat(val) if val else None
+        except (AttributeError, TypeError, ValueError) as e:
+            logger.info('Invalid validity value', extra={'assign_id': assign_id, 'value': value})
             return jsonify({'error': f'Invalid datetime format: {str(e)}'}), 400
+        logger.debug('Parsed validity', extra={'assign_id': assign_id, 'validity': validity})
+        record_command(assign_id, action, user_bot.validity, validity, user.user_id)
+        enqueue_command(assign_id, action, validity)
+        user_bot.validity = validity
+        user_bot.updated_by = user.user_id
+        user_bot.version = UserBot.version + 1
+        db.session.commit()
+        bots_changed([assign_id])
+        expiry_scheduler.schedule(assign_id, validity)
+        return jsonify({'message': 'Validity updated successfully', 'validity': validity.isoformat() if validity else None}), 200
     # Handle allow_admin_control toggle (only bot owner can change)
     if action == 'allow_admin_control':
         if user_bot.user_id != user.user_id:
             return jsonify({'error': 'Only bot owner can change admin control permission'}), 403
+        record_command(assign_id, action, user_bot.allow_admin_control, bool(value), user.user_id)
         user_bot.allow_admin_control = bool(value)
         user_bot.updated_by = user.user_id
+        user_bot.version = UserBot.version + 1
         db.session.commit()
+        bots_changed([assign_id])
         return jsonify({
             'message': 'Admin control permission updated successfully',
             'allow_admin_control': user_bot.allow_admin_control
@@ -185,6 +335,9 @@ def control_bot(assign_id):
     if user_bot.user_id != user.user_id:
         if not (user.is_admin and user_bot.allow_admin_control):
             return jsonify({'error': 'Access denied'}), 403
+    # The expiry scheduler only stops a bot once, don't let it be restarted
+    if action == 'bot_state' and value and user_bot.validity and user_bot.validity <= datetime.utcnow():
+        return jsonify({'error': 'Bot validity has expired'}), 400
     # Get or create bot behaviour
     behaviour = BotBehaviour.query.filter_by(assign_id=assign_id, is_active=True).first()
     if not behaviour:
@@ -194,26 +347,23 @@ def control_bot(assign_id):
         )
         db.session.add(behaviour)
         db.session.flush()
-    # Valid actions mapping to database columns
-    action_map = {
-        'bot_state': 'bot_state',
-        'hard_stop_all_trades': 'hard_stop_all_trades',
-        'listen_to_common_commander': 'listen_to_common_commander',
-        'news_based_start_stop': 'news_based_start_stop',
-        'refresh_data_from_bot': 'refresh_data_from_bot'
-    }
-    if action not in action_map:
-        valid_actions = ', '.join(action_map.keys())
+    if action not in BEHAVIOUR_ACTIONS:
+        valid_actions = ', '.join(BEHAVIOUR_ACTIONS.keys())
         return jsonify({'error': f'Invalid action. Valid actions: {valid_actions}'}), 400
     # Update the behaviour record
-    column_name = action_map[action]
+    column_name = BEHAVIOUR_ACTIONS[action]
+    record_command(assign_id, action, getattr(behaviour, column_name), bool(value), user.user_id)
+    enqueue_command(assign_id, action, bool(value))
     setattr(behaviour, column_name, bool(value))
     behaviour.updated_by = user.user_id
+    # Atomic increments so concurrent updates never reuse a version
+    behaviour.version = BotBehaviour.version + 1
+    user_bot.version = UserBot.version + 1
     db.session.commit()
-    # Decrypt bot_id for API call (if needed for actual bot communication)
+    bots_changed([assign_id])
     bot_id = decrypt_bot_id(user_bot.bot_id)
-    # Here you would make API call to the actual bot
-    # TODO: Implement actual bot API communication using bot_id and the updated behaviour
+    # Bots holding /api/bots/wait or /api/bots/stream were woken by the publish above,
+    # the bot API call (if configured) was queued in the outbox and is sent by dispatcher.py
     return jsonify({
         'message': f'Bot control action "{action}" updated successfully',
         'bot_id': bot_id,
@@ -222,15 +372,277 @@ def control_bot(assign_id):
         'behaviour': behaviour.to_dict()
     }), 200
 
+@bots_bp.route('/bulk', methods=['POST'])
+@require_admin
+def bulk_assign_bots():
+    """Assign many bots to one user in a single transaction (admin only)
+
+    Body: {"user_id": 1, "bot_ids": ["A", "B", ...]}
+    Returns a result per bot_id: assigned (with assign_id), duplicate or invalid.
+    """
+    data = request.get_json(silent=True) or {}
+    user_id = data.get('user_id')
+    bot_ids = data.get('bot_ids')
+    if not user_id or not isinstance(bot_ids, list) or not bot_ids:
+        return jsonify({'error': 'user_id and a non-empty bot_ids list are required'}), 400
+    max_items = current_app.config['BULK_MAX_ITEMS']
+    if len(bot_ids) > max_items:
+        return jsonify({'error': f'At most {max_items} bot_ids per request'}), 400
+    if not db.session.get(User, user_id):
+        return jsonify({'error': 'User not found'}), 404
+    
+    results = []
+    to_insert = {}  # bot_id_hash -> bot_id, in request order
+    for bot_id in bot_ids:
+        if not isinstance(bot_id, str) or not bot_id:
+            results.append({'bot_id': bot_id, 'status': 'invalid'})
+            continue
+        bot_id_hash = hash_bot_id(bot_id)
+        if bot_id_hash in to_insert:
+            results.append({'bot_id': bot_id, 'status': 'duplicate', 'error': 'Repeated in request'})
+            continue
+        to_insert[bot_id_hash] = bot_id
+        results.append({'bot_id': bot_id, 'bot_id_hash': bot_id_hash})
+    
+    # One indexed lookup for every already assigned bot
+    existing = set()
+    if to_insert:
+        existing = {h for (h,) in db.session.query(UserBot.bot_id_hash)
+                    .filter(UserBot.bot_id_hash.in_(list(to_insert)), UserBot.is_active == True)}
+    new_hashes = [h for h in to_insert if h not in existing]
+    
+    current_user_id = get_current_user_id()
+    assign_ids = {}
+    if new_hashes:
+        try:
+            # Batched INSERTs (executemany) for assignments, then their default behaviours
+            db.session.execute(UserBot.__table__.insert(), [{
+                'user_id': user_id,
+                'bot_id': encrypt_bot_id(to_insert[h]),
+                'bot_id_hash': h,
+                'created_by': current_user_id
+            } for h in new_hashes])
+            assign_ids = dict(db.session.query(UserBot.bot_id_hash, UserBot.assign_id)
+                              .filter(UserBot.bot_id_hash.in_(new_hashes)))
+            db.session.execute(BotBehaviour.__table__.insert(), [{
+                'assign_id': assign_ids[h],
+                'created_by': current_user_id
+            } for h in new_hashes])
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return jsonify({'error': 'Some bots were assigned concurrently, please retry'}), 409
+        bot_keys_changed(new_hashes)
+    
+    for result in results:
+        bot_id_hash = result.pop('bot_id_hash', None)
+        if bot_id_hash is None:
+            continue
+        if bot_id_hash in assign_ids:
+            result.update({'status': 'assigned', 'assign_id': assign_ids[bot_id_hash]})
+        else:
+            result.update({'status': 'duplicate', 'error': 'This bot is already assigned to another user'})
+    return jsonify({
+        'message': f'{len(assign_ids)} of {len(bot_ids)} bots assigned',
+        'results': results
+    }), 200
+
+def _is_int(value):
+    """A JSON integer (bool is an int subclass in Python)"""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+@bots_bp.route('/bulk/control', methods=['POST'])
+@require_login
+def bulk_control_bots():
+    """Apply one control action to many bots in a single transaction
+
+    Body: {"action": "hard_stop_all_trades", "value": true,
+           "assign_ids": [1, 2, ...]}  or  "filter": {"user_id": 1, "bot_state": true}
+    Returns a result per assign_id: updated, denied, expired (bot_state on
+    past validity) or not_found.
+
+    A filter is applied to at most BULK_MAX_ITEMS bots in assign_id order. When
+    more match, the response has "truncated": true and "next_after"; send the
+    same request with "after": next_after to continue.
+    """
+    data = request.get_json(silent=True) or {}
+    action = data.get('action')
+    value = data.get('value')
+    if action not in BEHAVIOUR_ACTIONS and action != 'validity':
+        valid_actions = ', '.join(list(BEHAVIOUR_ACTIONS) + ['validity'])
+        return jsonify({'error': f'Invalid action. Valid actions: {valid_actions}'}), 400
+    user_id = get_current_user_id()
+    user_is_admin = is_admin()
+    if action == 'validity':
+        if not user_is_admin:
+            return jsonify({'error': 'Only admin can update validity'}), 403
+        try:
+            validity = datetime.fromisoformat(value.rstrip('Z')) if value else None
+        except (AttributeError, ValueError) as e:
+            return jsonify({'error': f'Invalid datetime format: {str(e)}'}), 400
+    max_items = current_app.config['BULK_MAX_ITEMS']
+    
+    # Candidate assignments in one query, either listed or matched by filter
+    query = (db.session.query(UserBot.assign_id, UserBot.user_id, UserBot.allow_admin_control, UserBot.validity)
+             .filter(UserBot.is_active == True))
+    assign_ids = data.get('assign_ids')
+    bot_filter = data.get('filter')
+    after = data.get('after')
+    if isinstance(assign_ids, list) and assign_ids:
+        if len(assign_ids) > max_items:
+            return jsonify({'error': f'At most {max_items} assign_ids per request'}), 400
+        if not all(_is_int(assign_id) for assign_id in assign_ids):
+            return jsonify({'error': 'assign_ids must be integers'}), 400
+        query = query.filter(UserBot.assign_id.in_(assign_ids))
+    elif isinstance(bot_filter, dict):
+        filter_user_id = bot_filter.get('user_id', user_id)
+        if not _is_int(filter_user_id):
+            return jsonify({'error': 'filter.user_id must be an integer'}), 400
+        if after is not None and not _is_int(after):
+            return jsonify({'error': 'after must be an integer'}), 400
+        if filter_user_id != user_id and not user_is_admin:
+            return jsonify({'error': 'Access denied'}), 403
+        query = query.filter(UserBot.user_id == filter_user_id)
+        if 'bot_state' in bot_filter:
+            # Same join as list_bots, so the filter selects the bots the list shows
+            query = query.outerjoin(BotBehaviour, (BotBehaviour.assign_id == UserBot.assign_id) & (BotBehaviour.is_active == True))
+            if bot_filter['bot_state']:
+                query = query.filter(BotBehaviour.bot_state == True)
+            else:
+                query = query.filter(db.or_(BotBehaviour.bot_state == False, BotBehaviour.bot_state.is_(None)))
+        if after is not None:
+            query = query.filter(UserBot.assign_id > after)
+        # One row more than processed tells whether the filter matched more
+        query = query.order_by(UserBot.assign_id).limit(max_items + 1)
+    else:
+        return jsonify({'error': 'assign_ids or filter is required'}), 400
+    
+    rows = query.all()
+    next_after = None
+    if isinstance(bot_filter, dict) and not isinstance(assign_ids, list) and len(rows) > max_items:
+        rows = rows[:max_items]
+        next_after = rows[-1].assign_id
+    results = {}
+    allowed = []
+    now = datetime.utcnow()
+    for row in rows:
+        # Same rules as control_bot: owner, or admin with admin control allowed (validity: any admin)
+        if action == 'bot_state' and value and row.validity and row.validity <= now:
+            results[row.assign_id] = 'expired'
+        elif row.user_id == user_id or (user_is_admin and (action == 'validity' or row.allow_admin_control)):
+            allowed.append(row.assign_id)
+            results[row.assign_id] = 'updated'
+        else:
+            results[row.assign_id] = 'denied'
+    if isinstance(assign_ids, list):
+        for assign_id in assign_ids:
+            results.setdefault(assign_id, 'not_found')
+    
+    if allowed:
+        if action == 'validity':
+            old_values = dict(db.session.query(UserBot.assign_id, UserBot.validity)
+                              .filter(UserBot.assign_id.in_(allowed)))
+            record_commands([command_row(a, action, old_values.get(a), validity, user_id) for a in allowed])
+            enqueue_commands(allowed, action, validity)
+            db.session.execute(UserBot.__table__.update()
+                               .where(UserBot.assign_id.in_(allowed))
+                               .values(validity=validity, updated_by=user_id, version=UserBot.version + 1))
+        else:
+            # Create missing behaviour rows with one batched INSERT, then one UPDATE for all
+            column = getattr(BotBehaviour, BEHAVIOUR_ACTIONS[action])
+            old_values = dict(db.session.query(BotBehaviour.assign_id, column)
+                              .filter(BotBehaviour.assign_id.in_(allowed)))
+            record_commands([command_row(a, action, old_values.get(a, False), bool(value), user_id) for a in allowed])
+            enqueue_commands(allowed, action, bool(value))
+            missing = [a for a in allowed if a not in old_values]
+            if missing:
+                db.session.execute(BotBehaviour.__table__.insert(),
+                                   [{'assign_id': a, 'created_by': user_id} for a in missing])
+            db.session.execute(BotBehaviour.__table__.update()
+                               .where(BotBehaviour.assign_id.in_(allowed))
+                               .values({BEHAVIOUR_ACTIONS[action]: bool(value),
+                                        'updated_by': user_id,
+                                        'version': BotBehaviour.version + 1}))
+            db.session.execute(UserBot.__table__.update()
+                               .where(UserBot.assign_id.in_(allowed))
+                               .values(version=UserBot.version + 1))
+        db.session.commit()
+        bots_changed(allowed)
+        for assign_id in allowed:
+            if action == 'validity':
+                expiry_scheduler.schedule(assign_id, validity)
+    
+    return jsonify({
+        'message': f'Bot control action "{action}" applied to {len(allowed)} bots',
+        'action': action,
+        'value': value,
+        'results': [{'assign_id': a, 'status': status} for a, status in results.items()],
+        'truncated': next_after is not None,
+        'next_after': next_after
+    }), 200
+
 @bots_bp.route('/<int:assign_id>', methods=['DELETE'])
 @require_admin
 def unassign_bot(assign_id):
     """Unassign bot from user (admin only)"""
     user_bot = UserBot.query.get_or_404(assign_id)
-    user_bot.is_active = False
     current_user = get_current_user()
+    record_command(assign_id, 'unassign', user_bot.is_active, False, current_user.user_id if current_user else None)
+    user_bot.is_active = False
+    # Release the blind index so the bot can be assigned again later
+    user_bot.bot_id_hash = None
+    user_bot.version = UserBot.version + 1
     user_bot.updated_by = current_user.user_id if current_user else None
+    prefixes = revoke_tokens(BotToken.assign_id == assign_id)
     db.session.commit()
+    bots_changed([assign_id])
+    bot_tokens_changed(prefixes)
+    expiry_scheduler.schedule(assign_id, None)
     
     return jsonify({'message': 'Bot unassigned successfully'}), 200
 
+
+@bots_bp.route('/<int:assign_id>/tokens', methods=['GET'])
+@require_admin
+def list_bot_tokens(assign_id):
+    """API tokens of a bot assignment, without their secrets (admin only)"""
+    UserBot.query.filter_by(assign_id=assign_id, is_active=True).first_or_404()
+    tokens = BotToken.query.filter_by(assign_id=assign_id).order_by(BotToken.token_id.desc()).all()
+    return jsonify({'tokens': [token.to_dict() for token in tokens]}), 200
+
+@bots_bp.route('/<int:assign_id>/tokens', methods=['POST'])
+@require_admin
+def create_bot_token(assign_id):
+    """Issue an API token for a bot (admin only). The token is returned only once.
+
+    {"revoke_existing": true} revokes the bot's other tokens in the same step.
+    """
+    UserBot.query.filter_by(assign_id=assign_id, is_active=True).first_or_404()
+    data = request.get_json(silent=True) or {}
+    user_id = get_current_user_id()
+    prefixes = []
+    if data.get('revoke_existing'):
+        prefixes = revoke_tokens(BotToken.assign_id == assign_id)
+        for prefix in prefixes:
+            record_command(assign_id, 'revoke_token', prefix, None, user_id)
+    token, row = issue_token(assign_id, user_id)
+    record_command(assign_id, 'issue_token', None, row.prefix, user_id)
+    db.session.commit()
+    bot_tokens_changed(prefixes)
+    return jsonify({
+        'message': 'Token issued successfully, it is shown only once',
+        'token': token,
+        'token_info': row.to_dict()
+    }), 201
+
+@bots_bp.route('/<int:assign_id>/tokens/<int:token_id>', methods=['DELETE'])
+@require_admin
+def revoke_bot_token(assign_id, token_id):
+    """Revoke one API token of a bot (admin only)"""
+    token = BotToken.query.filter_by(token_id=token_id, assign_id=assign_id).first_or_404()
+    prefixes = revoke_tokens(BotToken.token_id == token.token_id)
+    for prefix in prefixes:
+        record_command(assign_id, 'revoke_token', prefix, None, get_current_user_id())
+    db.session.commit()
+    bot_tokens_changed(prefixes)
+    return jsonify({'message': 'Token revoked successfully'}), 200
@@ -0,0 +1,58 @@
+from flask import Blueprint, request, jsonify
+from sqlalchemy import update
+from models import CommonCommander, db
+from utils.auth import require_login, require_admin, get_current_user_id
+from utils.bot_state import COMMANDER_ID, DEFAULT_COMMANDER
+from utils.invalidation import commander_changed
+
+commander_bp = Blueprint('commander', __name__, url_prefix='/api/commander')
+
+# Actions accepted by update_commander, mapped to the CommonCommander column they set
+COMMANDER_ACTIONS = {
+    'bot_state': CommonCommander.bot_state,
+    'hard_stop_all_trades': CommonCommander.hard_stop_all_trades,
+    'news_based_start_stop': CommonCommander.news_based_start_stop,
+    'emergency_stop': CommonCommander.emergency_stop
+}
+
+@commander_bp.route('', methods=['GET'])
+@require_login
+def get_commander_state():
+    """Get the common commander state"""
+    commander = db.session.get(CommonCommander, COMMANDER_ID)
+    if not commander:
+        return jsonify({'commander': dict(DEFAULT_COMMANDER, updated_on=None, updated_by=None)}), 200
+    return jsonify({'commander': commander.to_dict()}), 200
+
+@commander_bp.route('', methods=['POST'])
+@require_admin
+def update_commander():
+    """Broadcast a command to every bot listening to the common commander (admin only)
+
+    Body: {action, value}. action 'emergency_stop' stops every bot, listening or not.
+    A broadcast is a single-row UPDATE regardless of fleet size.
+    """
+    data = request.get_json() or {}
+    action = data.get('action')
+    value = data.get('value')
+    if action not in COMMANDER_ACTIONS:
+        valid_actions = ', '.join(COMMANDER_ACTIONS.keys())
+        return jsonify({'error': f'Invalid action. Valid actions: {valid_actions}'}), 400
+    user_id = get_current_user_id()
+    result = db.session.execute(
+        update(CommonCommander)
+        .where(CommonCommander.commander_id == COMMANDER_ID)
+        .values({COMMANDER_ACTIONS[action]: bool(value),
+                 CommonCommander.version: CommonCommander.version + 1,
+                 CommonCommander.updated_by: user_id}))
+    if result.rowcount == 0:
+        # Migration 12 seeds the row; create it for databases built with create_all()
+        db.session.add(CommonCommander(commander_id=COMMANDER_ID, updated_by=user_id,
+                                       **{action: bool(value)}))
+    db.session.commit()
+    commander_changed()
+    commander = db.session.get(CommonCommander, COMMANDER_ID)
+    return jsonify({
+        'message': 'Common commander updated successfully',
+        'commander': commander.to_dict()
+    }), 200
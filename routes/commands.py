@@ -0,0 +1,89 @@
+import csv
+import io
+import json
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from models import BotCommandLog, UserBot, db
+from utils.auth import require_login, get_current_user_id, is_admin
+from utils.pagination import parse_datetime_arg, serialize_value
+
+commands_bp = Blueprint('commands', __name__, url_prefix='/api/commands')
+
+COMMAND_LOG_FIELDS = ['log_id', 'assign_id', 'action', 'old_value', 'new_value', 'actor_id', 'created_on']
+
+# Rows fetched per query while streaming an export
+EXPORT_BATCH_SIZE = 1000
+
+def _export_batches(assign_id, since, until):
+    """Yield lists of rows in (created_on, log_id) order, one indexed range query per batch"""
+    columns = [getattr(BotCommandLog, field) for field in COMMAND_LOG_FIELDS]
+    last = None
+    while True:
+        query = db.session.query(*columns)
+        if assign_id is not None:
+            query = query.filter(BotCommandLog.assign_id == assign_id)
+        if since is not None:
+            query = query.filter(BotCommandLog.created_on >= since)
+        if until is not None:
+            query = query.filter(BotCommandLog.created_on < until)
+        if last is not None:
+            query = query.filter(db.or_(BotCommandLog.created_on > last.created_on,
+                                        db.and_(BotCommandLog.created_on == last.created_on,
+                                                BotCommandLog.log_id > last.log_id)))
+        rows = (query.order_by(BotCommandLog.created_on, BotCommandLog.log_id)
+                .limit(EXPORT_BATCH_SIZE).all())
+        # Give the connection back between batches, a large export can take a while
+        db.session.close()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < EXPORT_BATCH_SIZE:
+            return
+        last = rows[-1]
+
+@commands_bp.route('/export', methods=['GET'])
+@require_login
+def export_commands():
+    """Stream the command log as CSV or NDJSON
+
+    Query params: assign_id, since, until (ISO datetimes, until exclusive),
+    format (csv or ndjson). Admins may export everything, other users only
+    the log of a bot assigned to them (assign_id required).
+    """
+    try:
+        since = parse_datetime_arg('since')
+        until = parse_datetime_arg('until')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    assign_id = request.args.get('assign_id', type=int)
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'ndjson'):
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+    if not is_admin():
+        if assign_id is None:
+            return jsonify({'error': 'assign_id is required'}), 400
+        owner_id = db.session.query(UserBot.user_id).filter(UserBot.assign_id == assign_id).scalar()
+        if owner_id != get_current_user_id():
+            return jsonify({'error': 'Access denied'}), 403
+
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(COMMAND_LOG_FIELDS)
+        for rows in _export_batches(assign_id, since, until):
+            writer.writerows([serialize_value(v) for v in row] for row in rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+    def generate_ndjson():
+        for rows in _export_batches(assign_id, since, until):
+            yield ''.join(json.dumps(dict(zip(COMMAND_LOG_FIELDS, map(serialize_value, row)))) + '\n'
+                          for row in rows)
+
+    if export_format == 'csv':
+        body, mimetype, extension = generate_csv(), 'text/csv', 'csv'
+    else:
+        body, mimetype, extension = generate_ndjson(), 'application/x-ndjson', 'ndjson'
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename=command_log.{extension}'})
@@ -0,0 +1,21 @@
+import hmac
+from flask import Blueprint, Response, current_app, request, jsonify
+from utils.metrics import registry
+
+metrics_bp = Blueprint('metrics', __name__)
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus text exposition of this worker's metrics
+
+    Protected by a bearer token when METRICS_TOKEN is set.
+    """
+    if not current_app.config.get('METRICS_ENABLED'):
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    token = current_app.config.get('METRICS_TOKEN')
+    if token:
+        auth = request.headers.get('Authorization', '')
+        supplied = auth[len('Bearer '):] if auth.startswith('Bearer ') else ''
+        if not hmac.compare_digest(supplied.encode('utf-8'), token.encode('utf-8')):
+            return jsonify({'error': 'Authentication required'}), 401
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
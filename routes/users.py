@@ -1,17 +1,56 @@
 from flask import Blueprint, request, jsonify
-from models import User, Login, db
-from utils.auth import require_admin, get_current_user, hash_password
+from models import User, Login, UserBot, BotToken, db
+from utils.auth import require_admin, get_current_user, hash_password, normalize_email
+from utils.invalidation import users_changed, bots_changed, bot_tokens_changed
+from utils.bot_tokens import revoke_tokens
+from utils.sessions import session_store
 from datetime import datetime
+from utils.pagination import parse_page_args, parse_fields_arg, parse_bool_arg, keyset_page, serialize_value
+from utils.db_pool import use_replica
 
 users_bp = Blueprint('users', __name__, url_prefix='/api/users')
 
+# Fields selectable with ?fields= on the user list
+USER_LIST_FIELDS = {
+    'user_id': User.user_id,
+    'email': User.email,
+    'name': User.name,
+    'is_admin': User.is_admin,
+    'is_active': Login.is_active,
+    'created_on': User.created_on
+}
+
 @users_bp.route('', methods=['GET'])
+@use_replica
 @require_admin
 def list_users():
-    """List all users (admin only)"""
-    users = User.query.all()
+    """List users page by page (admin only)
+
+    Query params: limit, after (user_id cursor), is_admin, is_active, fields
+    """
+    try:
+        limit, after = parse_page_args()
+        fields = parse_fields_arg(list(USER_LIST_FIELDS))
+        filter_is_admin = parse_bool_arg('is_admin')
+        filter_is_active = parse_bool_arg('is_active')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    # The cursor column is always selected
+    columns = [USER_LIST_FIELDS[f].label(f) for f in fields if f != 'user_id']
+    query = db.session.query(User.user_id, *columns)
+    if 'is_active' in fields or filter_is_active is not None:
+        query = query.outerjoin(Login, Login.user_id == User.user_id)
+    if filter_is_admin is not None:
+        query = query.filter(User.is_admin == filter_is_admin)
+    if filter_is_active is not None:
+        query = query.filter(Login.is_active == filter_is_active)
+    rows, next_cursor = keyset_page(query, User.user_id, limit, after)
+    users = []
+    for row in rows:
+        users.append({f: serialize_value(getattr(row, f)) for f in fields})
     return jsonify({
-        'users': [user.to_dict() for user in users]
+        'users': users,
+        'next_cursor': next_cursor
     }), 200
 
 @users_bp.route('', methods=['POST'])
@@ -26,6 +65,11 @@ def create_user():
     
     if not email or not name or not password:
         return jsonify({'error': 'Email, name, and password are required'}), 400
+    if not isinstance(email, str) or not isinstance(password, str):
+        return jsonify({'error': 'Email and password must be strings'}), 400
+    email = normalize_email(email)
+    if not email:
+        return jsonify({'error': 'Email, name, and password are required'}), 400
     
     # Check if user already exists
     if User.query.filter_by(email=email).first():
@@ -52,6 +96,7 @@ def create_user():
     }), 201
 
 @users_bp.route('/<int:user_id>', methods=['GET'])
+@use_replica
 @require_admin
 def get_user(user_id):
     """Get user details (admin only)"""
@@ -69,20 +114,34 @@ def update_user(user_id):
     current_user = get_current_user()
     if user_id == current_user.user_id and data.get('is_admin') is False:
         return jsonify({'error': 'You cannot remove your own admin status'}), 400
+    if user_id == current_user.user_id and data.get('is_active') is False:
+        return jsonify({'error': 'You cannot deactivate your own account'}), 400
     
     # Update fields
     if 'name' in data:
         user.name = data['name']
     if 'email' in data:
+        if not isinstance(data['email'], str) or not data['email'].strip():
+            return jsonify({'error': 'Email must be a non-empty string'}), 400
+        email = normalize_email(data['email'])
         # Check if email is already taken by another user
-        existing_user = User.query.filter_by(email=data['email']).first()
+        existing_user = User.query.filter_by(email=email).first()
         if existing_user and existing_user.user_id != user_id:
             return jsonify({'error': 'Email already in use'}), 400
-        user.email = data['email']
+        user.email = email
     if 'is_admin' in data:
         user.is_admin = bool(data['is_admin'])
+    if 'is_active' in data and user.login:
+        user.login.is_active = bool(data['is_active'])
+        user.login.updated_by = current_user.user_id
     
     db.session.commit()
+    # Open sessions pick up the new details (or end) on their next request, on every worker
+    if user.login and not user.login.is_active:
+        session_store.revoke_user(user_id)
+    else:
+        session_store.update_user(user)
+    users_changed([user_id])
     return jsonify({
         'message': 'User updated successfully',
         'user': user.to_dict()
@@ -99,7 +158,31 @@ def delete_user(user_id):
     if user_id == current_user.user_id:
         return jsonify({'error': 'You cannot delete your own account'}), 400
     
+    # Their assignments go with them, polls of those bots must stop being served from cache
+    assign_ids = [assign_id for (assign_id,) in
+                  db.session.query(UserBot.assign_id).filter_by(user_id=user_id, is_active=True)]
+    prefixes = revoke_tokens(BotToken.assign_id.in_(assign_ids)) if assign_ids else []
     db.session.delete(user)
     db.session.commit()
+    session_store.revoke_user(user_id)
+    users_changed([user_id])
+    bots_changed(assign_ids)
+    bot_tokens_changed(prefixes)
     return jsonify({'message': 'User deleted successfully'}), 200
 
+@users_bp.route('/<int:user_id>/sessions', methods=['GET'])
+@require_admin
+def get_user_sessions(user_id):
+    """Number of open sessions of a user (admin only)"""
+    User.query.get_or_404(user_id)
+    return jsonify({'user_id': user_id, 'sessions': session_store.count(user_id)}), 200
+
+@users_bp.route('/<int:user_id>/sessions', methods=['DELETE'])
+@require_admin
+def revoke_user_sessions(user_id):
+    """Sign a user out everywhere (admin only)"""
+    User.query.get_or_404(user_id)
+    session_store.revoke_user(user_id)
+    users_changed([user_id])
+    return jsonify({'message': 'Sessions revoked successfully'}), 200
+
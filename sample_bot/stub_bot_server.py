@@ -0,0 +1,78 @@
+"""
+Local stub of the bot API, for trying out and testing dispatcher.py
+
+    python sample_bot/stub_bot_server.py --port 8081 --fail-rate 0.3
+    BOT_DISPATCH_URL=http://127.0.0.1:8081/bots/{bot_id}/commands python dispatcher.py
+
+Accepts POST /bots/<bot_id>/commands, prints every command and answers
+200 (or 409 for an Idempotency-Key it has already applied). --fail-rate
+answers a share of requests with 503 and --latency delays every answer,
+to exercise retries and the concurrency limit.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class StubBotHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        parts = self.path.strip('/').split('/')
+        if len(parts) != 3 or parts[0] != 'bots' or parts[2] != 'commands':
+            self._reply(404, {'error': 'Not found'})
+            return
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if server.latency:
+            time.sleep(server.latency)
+        if random.random() < server.fail_rate:
+            self._reply(503, {'error': 'Simulated failure'})
+            return
+        key = self.headers.get('Idempotency-Key')
+        with server.lock:
+            duplicate = key in server.applied
+            if not duplicate:
+                server.applied[key] = json.loads(body or b'{}')
+        if duplicate:
+            self._reply(409, {'error': 'Already applied'})
+            return
+        if not server.quiet:
+            print(f"bot {parts[1]}: {body.decode('utf-8')}")
+        self._reply(200, {'status': 'applied'})
+
+    def _reply(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def make_server(host='127.0.0.1', port=8081, fail_rate=0.0, latency=0.0, quiet=False):
+    """Create the stub server; server.applied maps Idempotency-Key -> command"""
+    server = ThreadingHTTPServer((host, port), StubBotHandler)
+    server.fail_rate = fail_rate
+    server.latency = latency
+    server.quiet = quiet
+    server.applied = {}
+    server.lock = threading.Lock()
+    return server
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stub bot API for the outbox dispatcher')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='share of requests answered with 503')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds to wait before answering')
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.fail_rate, args.latency)
+    print(f"Stub bot API listening on http://{args.host}:{args.port}/bots/<bot_id>/commands")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,41 @@
+"""
+Production launcher for BotCommander
+Serves the ASGI entry point (asgi.py) with uvicorn instead of Flask's debug
+server. Requires: pip install -r requirements-asgi.txt
+
+Environment:
+  HOST             bind address (default 0.0.0.0)
+  PORT             bind port (default 5000)
+  WEB_CONCURRENCY  worker processes (default 1)
+  LOG_LEVEL        uvicorn log level (default info)
+"""
+import os
+import sys
+
+try:
+    import uvicorn
+except ImportError:
+    print("Error: uvicorn not found. Please install it with: pip install -r requirements-asgi.txt")
+    sys.exit(1)
+
+if __name__ == '__main__':
+    host = os.getenv('HOST', '0.0.0.0')
+    port = int(os.getenv('PORT', '5000'))
+    workers = int(os.getenv('WEB_CONCURRENCY', '1'))
+
+    print("=" * 60)
+    print("BotCommander (ASGI) is starting...")
+    print("=" * 60)
+    print(f"Listening on http://{host}:{port} with {workers} worker(s)")
+    print("=" * 60 + "\n")
+
+    uvicorn.run(
+        'asgi:app',
+        host=host,
+        port=port,
+        workers=workers,
+        proxy_headers=True,
+        log_level=os.getenv('LOG_LEVEL', 'info').lower(),
+        # Long-polls and SSE streams keep connections open well past the default
+        timeout_keep_alive=int(os.getenv('KEEP_ALIVE_TIMEOUT', '75'))
+    )
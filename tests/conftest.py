@@ -0,0 +1,91 @@
+"""
+Test fixtures: the regular app on an in-memory SQLite database with one
+admin, one user and a few bots assigned to that user
+"""
+import contextvars
+import os
+import sys
+from contextlib import contextmanager
+import pytest
+from flask.testing import FlaskClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from models import db, User, Login, UserBot, BotBehaviour
+
+PASSWORD = 'test-password'
+BOTS = 5
+
+class IsolatedClient(FlaskClient):
+    """Runs each request outside the test's app context, with its own g and session like a real one"""
+
+    def open(self, *args, **kwargs):
+        return contextvars.Context().run(super().open, *args, **kwargs)
+
+def configure(database_uri='sqlite://'):
+    Config.SQLALCHEMY_DATABASE_URI = database_uri
+    Config.REPLICA_DATABASE_URI = None
+    Config.SQLALCHEMY_BINDS = {}
+    Config.SQLALCHEMY_ENGINE_OPTIONS = {}
+    Config.SESSION_STORE_URL = None
+    Config.INVALIDATION_BUS_URL = None
+    Config.BCRYPT_ROUNDS = 4
+    Config.EXPIRY_ENABLED = False
+    # Tests flush heartbeats themselves, the background flush would outlive the database
+    Config.HEARTBEAT_FLUSH_INTERVAL = 3600
+    Config.BOT_DISPATCH_URL = None
+    Config.BOT_TOKEN_REQUIRED = False
+    Config.TESTING = True
+
+@contextmanager
+def running_app(database_uri='sqlite://'):
+    """The app with its tables created and seeded, inside an app context"""
+    configure(database_uri)
+    from app import create_app
+    app = create_app()
+    app.config['TESTING'] = True
+    app.test_client_class = IsolatedClient
+    with app.app_context():
+        db.create_all()
+        seed()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def app():
+    with running_app() as app:
+        yield app
+
+def seed():
+    from utils.auth import hash_password
+    from utils.encryption import encrypt_bot_id, hash_bot_id
+    password = hash_password(PASSWORD)
+    admin = User(email='admin@example.com', name='Admin', is_admin=True)
+    user = User(email='user@example.com', name='User')
+    db.session.add_all([admin, user])
+    db.session.flush()
+    db.session.add_all([Login(user_id=admin.user_id, password=password),
+                        Login(user_id=user.user_id, password=password)])
+    for i in range(BOTS):
+        bot = UserBot(user_id=user.user_id, bot_id=encrypt_bot_id(f'TEST-{i}'),
+                      bot_id_hash=hash_bot_id(f'TEST-{i}'), allow_admin_control=True)
+        db.session.add(bot)
+        db.session.flush()
+        db.session.add(BotBehaviour(assign_id=bot.assign_id, bot_state=i % 2 == 0))
+    db.session.commit()
+
+def signed_in(app, email):
+    client = app.test_client()
+    response = client.post('/api/login', json={'email': email, 'password': PASSWORD})
+    assert response.status_code == 200, response.get_json()
+    return client
+
+@pytest.fixture
+def admin_client(app):
+    return signed_in(app, 'admin@example.com')
+
+@pytest.fixture
+def user_client(app):
+    return signed_in(app, 'user@example.com')
@@ -0,0 +1,61 @@
+"""
+ASGI serving mode: the bot-facing routes served natively by asgi.py against
+a file SQLite database shared by the sync and async engines
+"""
+import importlib
+import pytest
+from config import Config
+from models import db, UserBot
+from conftest import configure, seed, PASSWORD
+
+starlette_testclient = pytest.importorskip('starlette.testclient')
+pytest.importorskip('aiosqlite')
+
+BOT_ID = 'TEST-0'
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    path = tmp_path / 'asgi.db'
+    configure(f'sqlite:///{path}')
+    monkeypatch.setattr(Config, 'ASYNC_SQLALCHEMY_DATABASE_URI', f'sqlite+aiosqlite:///{path}')
+    monkeypatch.setattr(Config, 'ASYNC_SQLALCHEMY_ENGINE_OPTIONS', {})
+    import asgi
+    asgi = importlib.reload(asgi)
+    with asgi.flask_app.app_context():
+        db.create_all()
+        seed()
+        assign_id = UserBot.query.order_by(UserBot.assign_id).first().assign_id
+    with starlette_testclient.TestClient(asgi.app) as client:
+        response = client.post('/api/login', json={'email': 'user@example.com', 'password': PASSWORD})
+        assert response.status_code == 200
+        client.assign_id = assign_id
+        yield client
+    with asgi.flask_app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+def _poll(client, headers=None, compact=False):
+    query = f'bot_id={BOT_ID}' + ('&format=compact' if compact else '')
+    return client.get(f'/api/bots/poll?{query}', headers=headers)
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_conditional_poll(client, compact):
+    first = _poll(client, compact=compact)
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    repeat = _poll(client, {'If-None-Match': etag}, compact=compact)
+    assert repeat.status_code == 304
+    assert repeat.headers['ETag'] == etag
+    assert not repeat.content
+    response = client.post(f'/api/bots/{client.assign_id}/control', json={'action': 'bot_state', 'value': False})
+    assert response.status_code == 200
+    changed = _poll(client, {'If-None-Match': etag}, compact=compact)
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+
+def test_json_and_compact_etags_differ(client):
+    etag = _poll(client).headers['ETag']
+    response = _poll(client, {'If-None-Match': etag}, compact=True)
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.headers['Content-Type'].startswith('text/plain')
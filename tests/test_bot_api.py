@@ -0,0 +1,89 @@
+"""
+Bot-facing endpoints: ETags, conditional polls and the common commander overlay
+"""
+import threading
+import time
+import pytest
+from models import UserBot
+from utils.notify import bot_notifier
+
+BOT_ID = 'TEST-0'
+
+def _poll(app, headers=None, compact=False):
+    query = f'bot_id={BOT_ID}' + ('&format=compact' if compact else '')
+    return app.test_client().get(f'/api/bots/poll?{query}', headers=headers)
+
+def _listen_to_commander(user_client):
+    assign_id = UserBot.query.order_by(UserBot.assign_id).first().assign_id
+    response = user_client.post(f'/api/bots/{assign_id}/control',
+                                json={'action': 'listen_to_common_commander', 'value': True})
+    assert response.status_code == 200
+
+def _toggle_bot_state(user_client):
+    assign_id = UserBot.query.order_by(UserBot.assign_id).first().assign_id
+    response = user_client.post(f'/api/bots/{assign_id}/control', json={'action': 'bot_state', 'value': False})
+    assert response.status_code == 200
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_conditional_poll(app, user_client, compact):
+    first = _poll(app, compact=compact)
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    repeat = _poll(app, {'If-None-Match': etag}, compact=compact)
+    assert repeat.status_code == 304
+    assert repeat.headers['ETag'] == etag
+    assert not repeat.data
+    _toggle_bot_state(user_client)
+    changed = _poll(app, {'If-None-Match': etag}, compact=compact)
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+
+def test_json_and_compact_etags_differ(app):
+    etag = _poll(app).headers['ETag']
+    response = _poll(app, {'If-None-Match': etag}, compact=True)
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+def test_commander_broadcast_changes_version_and_etag(app, admin_client, user_client):
+    _listen_to_commander(user_client)
+    first = _poll(app)
+    bot_version = first.get_json()['version']
+    response = admin_client.post('/api/commander', json={'action': 'hard_stop_all_trades', 'value': True})
+    assert response.status_code == 200
+    commander_version = response.get_json()['commander']['version']
+    second = _poll(app, {'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 200
+    assert second.headers['ETag'] != first.headers['ETag']
+    # Effective version = assignment version + commander version
+    assert second.get_json()['version'] == bot_version + commander_version
+    assert second.get_json()['hard_stop_all_trades'] is True
+
+def test_emergency_stop_reaches_bots_not_listening(app, admin_client):
+    first = _poll(app)
+    assert admin_client.post('/api/commander', json={'action': 'emergency_stop', 'value': True}).status_code == 200
+    second = _poll(app, {'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 200
+    assert second.get_json()['emergency_stop'] is True
+    assert second.get_json()['bot_state'] is False
+
+def test_commander_broadcast_wakes_wait(app, admin_client, user_client):
+    _listen_to_commander(user_client)
+    version = _poll(app).get_json()['version']
+    result = {}
+
+    def wait():
+        started = time.monotonic()
+        response = app.test_client().get(f'/api/bots/wait?bot_id={BOT_ID}&version={version}&timeout=10')
+        result.update(status=response.status_code, body=response.get_json(), elapsed=time.monotonic() - started)
+
+    waiter = threading.Thread(target=wait)
+    waiter.start()
+    deadline = time.monotonic() + 5
+    while bot_notifier.active == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert bot_notifier.active == 1
+    assert admin_client.post('/api/commander', json={'action': 'bot_state', 'value': False}).status_code == 200
+    waiter.join(10)
+    assert result['status'] == 200
+    assert result['body']['version'] > version
+    assert result['elapsed'] < 5
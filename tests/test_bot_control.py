@@ -0,0 +1,42 @@
+"""
+POST /api/bots/<assign_id>/control
+"""
+import pytest
+from models import db, UserBot, BotCommandLog, BotOutbox
+
+def _bot():
+    return UserBot.query.order_by(UserBot.assign_id).first()
+
+def test_validity_update_is_logged_and_queued(app, admin_client):
+    app.config['BOT_DISPATCH_URL'] = 'http://bots.invalid/{bot_id}'
+    bot = _bot()
+    version = bot.version
+    response = admin_client.post(f'/api/bots/{bot.assign_id}/control',
+                                 json={'action': 'validity', 'value': '2030-01-01T00:00:00Z'})
+    assert response.status_code == 200
+    assert response.get_json()['validity'] == '2030-01-01T00:00:00'
+    db.session.expire_all()
+    assert _bot().version == version + 1
+    assert BotCommandLog.query.filter_by(assign_id=bot.assign_id, action='validity').count() == 1
+    assert BotOutbox.query.filter_by(assign_id=bot.assign_id, action='validity').count() == 1
+
+@pytest.mark.parametrize('value', ['not a date', 20300101, ['2030-01-01']])
+def test_invalid_validity_is_a_400(admin_client, value):
+    bot = _bot()
+    response = admin_client.post(f'/api/bots/{bot.assign_id}/control', json={'action': 'validity', 'value': value})
+    assert response.status_code == 400
+    assert 'Invalid datetime format' in response.get_json()['error']
+    assert BotCommandLog.query.count() == 0
+
+def test_validity_write_failure_is_not_a_400(app, admin_client, monkeypatch):
+    def broken_outbox(*args):
+        raise RuntimeError('outbox unavailable')
+    monkeypatch.setattr('routes.bots.enqueue_command', broken_outbox)
+    bot = _bot()
+    # TESTING propagates the error instead of answering 500
+    with pytest.raises(RuntimeError):
+        admin_client.post(f'/api/bots/{bot.assign_id}/control',
+                          json={'action': 'validity', 'value': '2030-01-01T00:00:00'})
+    db.session.rollback()
+    assert _bot().validity is None
+    assert BotCommandLog.query.count() == 0
@@ -0,0 +1,53 @@
+"""
+Bot API tokens: verification, revocation through bot_token_cache and BOT_TOKEN_REQUIRED
+"""
+from models import UserBot
+from utils.bot_tokens import parse_token
+from utils.cache import bot_token_cache
+
+def _assign_id():
+    return UserBot.query.order_by(UserBot.assign_id).first().assign_id
+
+def _issue(admin_client, assign_id):
+    response = admin_client.post(f'/api/bots/{assign_id}/tokens')
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()
+
+def _poll(app, token):
+    return app.test_client().get('/api/bots/poll', headers={'Authorization': f'Bearer {token}'})
+
+def test_valid_token_identifies_the_bot(app, admin_client):
+    token = _issue(admin_client, _assign_id())['token']
+    response = _poll(app, token)
+    assert response.status_code == 200
+    assert response.get_json()['bot_state'] is True
+
+def test_wrong_secret_is_refused(app, admin_client):
+    token = _issue(admin_client, _assign_id())['token']
+    response = _poll(app, token[:-1] + ('A' if token[-1] != 'A' else 'B'))
+    assert response.status_code == 401
+    assert response.headers['WWW-Authenticate'] == 'Bearer'
+
+def test_revoked_token_is_refused(app, admin_client):
+    assign_id = _assign_id()
+    issued = _issue(admin_client, assign_id)
+    prefix, _ = parse_token(issued['token'])
+    assert _poll(app, issued['token']).status_code == 200
+    assert bot_token_cache.get(prefix)
+    token_id = issued['token_info']['token_id']
+    assert admin_client.delete(f'/api/bots/{assign_id}/tokens/{token_id}').status_code == 200
+    assert bot_token_cache.get(prefix) is None
+    assert _poll(app, issued['token']).status_code == 401
+
+def test_token_required_refuses_bare_bot_id(app):
+    app.config['BOT_TOKEN_REQUIRED'] = True
+    response = app.test_client().get('/api/bots/poll?bot_id=TEST-0')
+    assert response.status_code == 401
+    assert response.get_json()['error'] == 'Bot token required'
+
+def test_unassign_revokes_tokens(app, admin_client):
+    assign_id = _assign_id()
+    token = _issue(admin_client, assign_id)['token']
+    assert _poll(app, token).status_code == 200
+    assert admin_client.delete(f'/api/bots/{assign_id}').status_code == 200
+    assert _poll(app, token).status_code == 401
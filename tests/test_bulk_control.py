@@ -0,0 +1,44 @@
+"""
+POST /api/bots/bulk/control
+"""
+from models import db, UserBot, BotBehaviour
+
+def _listed(client, bot_state):
+    response = client.get(f"/api/bots?bot_state={'true' if bot_state else 'false'}&fields=assign_id")
+    assert response.status_code == 200
+    return {bot['assign_id'] for bot in response.get_json()['bots']}
+
+def _updated(response):
+    assert response.status_code == 200
+    return {r['assign_id'] for r in response.get_json()['results'] if r['status'] == 'updated'}
+
+def test_filter_matches_list_bots(user_client):
+    # A running bot whose behaviour row is inactive reads as stopped in the list
+    stale = (UserBot.query.join(BotBehaviour, BotBehaviour.assign_id == UserBot.assign_id)
+             .filter(BotBehaviour.bot_state == True).first())
+    stale.behaviour.is_active = False
+    db.session.commit()
+    for bot_state in (True, False):
+        listed = _listed(user_client, bot_state)
+        response = user_client.post('/api/bots/bulk/control', json={
+            'action': 'refresh_data_from_bot', 'value': True, 'filter': {'bot_state': bot_state}})
+        assert _updated(response) == listed
+    assert stale.assign_id in _listed(user_client, False)
+
+def test_filter_is_paged_with_after(app, user_client):
+    app.config['BULK_MAX_ITEMS'] = 2
+    body = {'action': 'hard_stop_all_trades', 'value': True, 'filter': {}}
+    updated = []
+    while True:
+        data = user_client.post('/api/bots/bulk/control', json=body).get_json()
+        updated += [r['assign_id'] for r in data['results']]
+        if not data['truncated']:
+            break
+        body['after'] = data['next_after']
+    assert updated == sorted(bot.assign_id for bot in UserBot.query)
+
+def test_non_integer_assign_ids_are_refused(user_client):
+    for assign_ids in ([1, 'x'], [True], [1.5]):
+        response = user_client.post('/api/bots/bulk/control', json={
+            'action': 'bot_state', 'value': True, 'assign_ids': assign_ids})
+        assert response.status_code == 400
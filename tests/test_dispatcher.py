@@ -0,0 +1,117 @@
+"""
+Outbox dispatcher against the stub bot API: per-bot ordering, retries after
+a 5xx, 409 as success and at-most-once claims between racing dispatchers
+"""
+import json
+import threading
+from datetime import datetime
+import pytest
+from models import db, BotOutbox, UserBot
+from dispatcher import OutboxDispatcher
+from sample_bot.stub_bot_server import make_server
+from conftest import running_app, BOTS
+
+@pytest.fixture
+def app(tmp_path):
+    # A file database, the dispatchers claim rows from their own threads
+    with running_app(f'sqlite:///{tmp_path / "outbox.db"}') as app:
+        yield app
+
+@pytest.fixture
+def stub(app):
+    server = make_server(port=0, quiet=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    app.config['BOT_DISPATCH_URL'] = f'http://127.0.0.1:{server.server_port}/bots/{{bot_id}}/commands'
+    app.config['DISPATCH_BACKOFF_BASE'] = 0
+    app.config['DISPATCH_TIMEOUT'] = 2
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def _assign_ids():
+    return [assign_id for (assign_id,) in db.session.query(UserBot.assign_id).order_by(UserBot.assign_id)]
+
+def _control(user_client, assign_id, value):
+    response = user_client.post(f'/api/bots/{assign_id}/control', json={'action': 'bot_state', 'value': value})
+    assert response.status_code == 200
+
+def _outbox():
+    db.session.expire_all()
+    return BotOutbox.query.order_by(BotOutbox.outbox_id).all()
+
+def test_commands_for_one_bot_are_delivered_in_order(app, stub, user_client):
+    assign_id = _assign_ids()[0]
+    for value in (False, True, False):
+        _control(user_client, assign_id, value)
+    dispatcher = OutboxDispatcher(app)
+    # Only the bot's oldest pending command is eligible, one per batch
+    assert [dispatcher.run_once() for _ in range(4)] == [1, 1, 1, 0]
+    assert [command['value'] for command in stub.applied.values()] == [False, True, False]
+    assert all(command['bot_id'] == 'TEST-0' for command in stub.applied.values())
+    assert [row.status for row in _outbox()] == ['delivered'] * 3
+
+def test_failed_delivery_is_retried(app, stub, user_client):
+    _control(user_client, _assign_ids()[0], False)
+    dispatcher = OutboxDispatcher(app)
+    stub.fail_rate = 1.0
+    assert dispatcher.run_once() == 1
+    row, = _outbox()
+    assert (row.status, row.attempts, row.last_error) == ('pending', 1, 'HTTP 503')
+    assert not stub.applied
+    stub.fail_rate = 0.0
+    assert dispatcher.run_once() == 1
+    row, = _outbox()
+    assert (row.status, row.attempts, row.last_error) == ('delivered', 2, None)
+    assert list(stub.applied) == [row.idempotency_key]
+
+def test_already_applied_command_counts_as_delivered(app, stub, user_client):
+    _control(user_client, _assign_ids()[0], False)
+    row, = _outbox()
+    # The bot applied it, but the response was lost
+    stub.applied[row.idempotency_key] = json.loads(row.payload)
+    assert OutboxDispatcher(app).run_once() == 1
+    row, = _outbox()
+    assert (row.status, row.attempts) == ('delivered', 1)
+
+def test_racing_dispatchers_deliver_each_command_once(app, stub, user_client):
+    for assign_id in _assign_ids():
+        _control(user_client, assign_id, False)
+    requests = []
+    handler = stub.RequestHandlerClass
+
+    class CountingHandler(handler):
+        def do_POST(self):
+            requests.append(self.headers['Idempotency-Key'])
+            super().do_POST()
+
+    stub.RequestHandlerClass = CountingHandler
+    stub.latency = 0.05
+    dispatchers = [OutboxDispatcher(app) for _ in range(2)]
+    barrier = threading.Barrier(len(dispatchers))
+    attempted = []
+
+    def run(dispatcher):
+        barrier.wait()
+        attempted.append(dispatcher.run_once())
+
+    threads = [threading.Thread(target=run, args=(dispatcher,)) for dispatcher in dispatchers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert sum(attempted) == BOTS
+    assert sorted(requests) == sorted(row.idempotency_key for row in _outbox())
+    assert all((row.status, row.attempts) == ('delivered', 1) for row in _outbox())
+
+def test_claimed_rows_are_skipped_until_the_claim_expires(app, stub, user_client):
+    _control(user_client, _assign_ids()[0], False)
+    first, second = OutboxDispatcher(app), OutboxDispatcher(app)
+    claimed = first._claim()
+    assert len(claimed) == 1
+    assert second._claim() == []
+    # A crashed dispatcher's claim runs out and the row is picked up again
+    BotOutbox.query.update({'next_attempt_at': datetime.utcnow()})
+    db.session.commit()
+    assert second.run_once() == 1
+    assert list(stub.applied) == [claimed[0][0].idempotency_key]
@@ -0,0 +1,69 @@
+"""
+Validity expiry: ExpiryScheduler.expire() and the control endpoints on expired bots
+"""
+from datetime import datetime, timedelta
+from models import db, UserBot, BotBehaviour, BotCommandLog, BotOutbox
+from utils.expiry import expiry_scheduler
+
+def _expired_bots(count=2):
+    """The first bots that are running, with their validity in the past"""
+    bots = (UserBot.query.join(BotBehaviour, BotBehaviour.assign_id == UserBot.assign_id)
+            .filter(BotBehaviour.bot_state == True).order_by(UserBot.assign_id).limit(count).all())
+    for bot in bots:
+        bot.validity = datetime.utcnow() - timedelta(minutes=1)
+    db.session.commit()
+    return [bot.assign_id for bot in bots]
+
+def test_expire_stops_logs_and_queues(app):
+    app.config['BOT_DISPATCH_URL'] = 'http://bots.invalid/{bot_id}'
+    assign_ids = _expired_bots()
+    versions = {bot.assign_id: (bot.version, bot.behaviour.version)
+                for bot in UserBot.query.filter(UserBot.assign_id.in_(assign_ids))}
+    assert sorted(expiry_scheduler.expire(assign_ids)) == assign_ids
+    db.session.expire_all()
+    for bot in UserBot.query.filter(UserBot.assign_id.in_(assign_ids)):
+        assert bot.behaviour.bot_state is False
+        assert (bot.version, bot.behaviour.version) == (versions[bot.assign_id][0] + 1, versions[bot.assign_id][1] + 1)
+    log = BotCommandLog.query.filter(BotCommandLog.assign_id.in_(assign_ids)).all()
+    assert [(e.action, e.old_value, e.new_value, e.actor_id) for e in log] == [('bot_state', 'true', 'false', None)] * 2
+    assert BotOutbox.query.filter(BotOutbox.assign_id.in_(assign_ids), BotOutbox.action == 'bot_state').count() == 2
+
+def test_expire_twice_is_a_no_op(app):
+    assign_ids = _expired_bots()
+    expiry_scheduler.expire(assign_ids)
+    assert expiry_scheduler.expire(assign_ids) == []
+    assert BotCommandLog.query.count() == 2
+
+def test_expire_skips_bots_still_valid(app):
+    bot = (UserBot.query.join(BotBehaviour, BotBehaviour.assign_id == UserBot.assign_id)
+           .filter(BotBehaviour.bot_state == True).first())
+    bot.validity = datetime.utcnow() + timedelta(days=1)
+    db.session.commit()
+    assert expiry_scheduler.expire([bot.assign_id]) == []
+    db.session.expire_all()
+    assert bot.behaviour.bot_state is True
+
+def test_expired_bot_cannot_be_switched_on(user_client):
+    assign_id = _expired_bots(1)[0]
+    expiry_scheduler.expire([assign_id])
+    response = user_client.post(f'/api/bots/{assign_id}/control', json={'action': 'bot_state', 'value': True})
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Bot validity has expired'
+    db.session.expire_all()
+    assert db.session.get(UserBot, assign_id).behaviour.bot_state is False
+    # Switching off and the other actions still work
+    response = user_client.post(f'/api/bots/{assign_id}/control', json={'action': 'bot_state', 'value': False})
+    assert response.status_code == 200
+    response = user_client.post(f'/api/bots/{assign_id}/control', json={'action': 'hard_stop_all_trades', 'value': True})
+    assert response.status_code == 200
+
+def test_bulk_control_skips_expired_bots(user_client):
+    assign_id = _expired_bots(1)[0]
+    expiry_scheduler.expire([assign_id])
+    response = user_client.post('/api/bots/bulk/control', json={'action': 'bot_state', 'value': True, 'filter': {}})
+    assert response.status_code == 200
+    results = {r['assign_id']: r['status'] for r in response.get_json()['results']}
+    assert results.pop(assign_id) == 'expired'
+    assert set(results.values()) == {'updated'}
+    db.session.expire_all()
+    assert db.session.get(UserBot, assign_id).behaviour.bot_state is False
@@ -0,0 +1,60 @@
+"""
+POST /api/login: validation, email normalization, rate limits and hash upgrades
+"""
+import bcrypt
+import pytest
+from models import db, User, Login
+from tests.conftest import PASSWORD
+from utils.auth import login_email_limiter, login_ip_limiter, password_hasher
+
+def _login(client, email, password=PASSWORD):
+    return client.post('/api/login', json={'email': email, 'password': password})
+
+@pytest.mark.parametrize('body', [{'email': 5, 'password': PASSWORD}, {'email': ['user@example.com'], 'password': PASSWORD},
+                                  {'email': 'user@example.com', 'password': 1}, [1, 2]])
+def test_non_string_credentials_are_a_400(app, body):
+    assert app.test_client().post('/api/login', json=body).status_code == 400
+
+def test_user_created_with_mixed_case_email_can_log_in(app, admin_client):
+    response = admin_client.post('/api/users', json={'email': ' Foo@Example.com ', 'name': 'Foo', 'password': PASSWORD})
+    assert response.status_code == 201
+    assert response.get_json()['user']['email'] == 'foo@example.com'
+    assert _login(app.test_client(), 'FOO@example.COM').status_code == 200
+    response = admin_client.post('/api/users', json={'email': 'foo@EXAMPLE.com', 'name': 'Foo', 'password': PASSWORD})
+    assert response.status_code == 400
+
+def test_updated_email_is_normalized(app, admin_client):
+    user_id = User.query.filter_by(email='user@example.com').first().user_id
+    response = admin_client.put(f'/api/users/{user_id}', json={'email': 'New.User@Example.com'})
+    assert response.status_code == 200
+    assert response.get_json()['user']['email'] == 'new.user@example.com'
+    assert _login(app.test_client(), 'new.user@example.com').status_code == 200
+    response = admin_client.put(f'/api/users/{user_id}', json={'email': 'ADMIN@example.com'})
+    assert response.status_code == 400
+
+def test_email_limiter_refuses_with_429(app):
+    login_email_limiter.configure(rate=1 / 60, burst=2)
+    client = app.test_client()
+    assert _login(client, 'user@example.com', 'wrong').status_code == 401
+    # Another spelling of the same address shares its bucket
+    assert _login(client, ' USER@example.com', 'wrong').status_code == 401
+    response = _login(client, 'user@example.com')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    assert _login(client, 'admin@example.com').status_code == 200
+
+def test_ip_limiter_refuses_with_429(app):
+    login_ip_limiter.configure(rate=1 / 60, burst=1)
+    client = app.test_client()
+    assert _login(client, 'user@example.com').status_code == 200
+    assert _login(client, 'admin@example.com').status_code == 429
+
+def test_login_upgrades_hash_with_old_cost(app):
+    login = Login.query.join(User, User.user_id == Login.user_id).filter(User.email == 'user@example.com').first()
+    login.password = bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt(password_hasher.rounds + 1)).decode()
+    db.session.commit()
+    assert password_hasher.needs_rehash(login.password)
+    assert _login(app.test_client(), 'user@example.com').status_code == 200
+    db.session.expire_all()
+    assert not password_hasher.needs_rehash(login.password)
+    assert bcrypt.checkpw(PASSWORD.encode(), login.password.encode())
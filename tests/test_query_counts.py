@@ -0,0 +1,51 @@
+"""
+Query counts of hot endpoints, see utils/query_counter.py
+A failure lists the statements issued, usually a new lazy load (N+1).
+"""
+from models import UserBot
+from tests.conftest import BOTS
+from utils.query_counter import assert_max_queries
+
+def _assign_id():
+    return UserBot.query.order_by(UserBot.assign_id).first().assign_id
+
+def test_list_bots_with_behaviour_is_one_query(user_client):
+    with assert_max_queries(1):
+        response = user_client.get('/api/bots')
+    assert response.status_code == 200
+    bots = response.get_json()['bots']
+    assert len(bots) == BOTS
+    assert all('bot_state' in bot for bot in bots)
+
+def test_list_bots_query_count_does_not_grow_with_bots(admin_client, user_client):
+    user_id = user_client.get('/api/me').get_json()['user']['user_id']
+    with assert_max_queries(1):
+        response = admin_client.get(f'/api/bots?user_id={user_id}&fields=assign_id,bot_id,bot_state,last_seen')
+    assert response.status_code == 200
+    assert len(response.get_json()['bots']) == BOTS
+
+def test_get_bot_details_is_one_query(user_client):
+    assign_id = _assign_id()
+    with assert_max_queries(1):
+        response = user_client.get(f'/api/bots/{assign_id}')
+    assert response.status_code == 200
+    bot = response.get_json()['bot']
+    assert bot['behaviour']['assign_id'] == assign_id
+    assert 'heartbeat' in bot
+
+def test_get_bot_details_as_admin_is_one_query(admin_client):
+    assign_id = _assign_id()
+    with assert_max_queries(1):
+        response = admin_client.get(f'/api/bots/{assign_id}')
+    assert response.status_code == 200
+    assert response.get_json()['bot']['can_admin_control'] is True
+
+def test_assert_max_queries_reports_statements(user_client):
+    try:
+        with assert_max_queries(0):
+            user_client.get('/api/bots')
+    except AssertionError as e:
+        assert 'Expected at most 0 queries, got 1' in str(e)
+        assert 'SELECT' in str(e)
+    else:
+        raise AssertionError('assert_max_queries(0) did not fail')
@@ -0,0 +1,63 @@
+"""
+database/rotate_encryption_key.py: old key -> MultiFernet -> new key
+"""
+import pytest
+from cryptography.fernet import Fernet
+from config import Config
+from database.rotate_encryption_key import rotate
+from models import db, UserBot
+from tests.conftest import BOTS
+from utils.encryption import _get_fernet, decrypt_bot_id, encrypt_bot_id, reset_encryption_cache
+
+@pytest.fixture
+def new_key(app, monkeypatch):
+    """Make a new primary key, with the key the bots were seeded with as the old one"""
+    key = Fernet.generate_key().decode()
+    monkeypatch.setattr(Config, 'ENCRYPTION_OLD_KEYS', [Config.ENCRYPTION_KEY])
+    monkeypatch.setattr(Config, 'ENCRYPTION_KEY', key)
+    reset_encryption_cache()
+    yield key
+    monkeypatch.undo()
+    reset_encryption_cache()
+
+def _bot_ids():
+    db.session.expire_all()
+    return {bot.assign_id: bot.bot_id for bot in UserBot.query}
+
+def test_rotation_round_trip(app, new_key, capsys):
+    before = _bot_ids()
+    assert rotate(sleep=0, app=app)
+    assert f'complete: {BOTS} rotated, 0 changed concurrently' in capsys.readouterr().out
+    after = _bot_ids()
+    primary = Fernet(new_key.encode())
+    for assign_id, token in after.items():
+        assert token != before[assign_id]
+        assert primary.decrypt(token.encode()).decode().startswith('TEST-')
+    assert sorted(decrypt_bot_id(token) for token in after.values()) == [f'TEST-{i}' for i in range(BOTS)]
+    # A re-run finds everything on the primary key and writes nothing
+    assert rotate(sleep=0, app=app)
+    assert f'complete: 0 rotated, 0 changed concurrently (left alone), {BOTS} already current' in capsys.readouterr().out
+    assert _bot_ids() == after
+
+def test_rows_changed_concurrently_are_not_counted(app, new_key, capsys, monkeypatch):
+    fernet = _get_fernet()
+    rotate_token = fernet.rotate
+    raced = UserBot.query.order_by(UserBot.assign_id).first().assign_id
+    live_token = encrypt_bot_id('TEST-live')
+
+    def rotate_racing_a_live_write(token):
+        # The app reassigns the first bot between the read and the compare-and-swap
+        db.session.execute(UserBot.__table__.update().where(UserBot.assign_id == raced).values(bot_id=live_token))
+        monkeypatch.setattr(fernet, 'rotate', rotate_token)
+        return rotate_token(token)
+
+    monkeypatch.setattr(fernet, 'rotate', rotate_racing_a_live_write)
+    assert rotate(sleep=0, app=app)
+    assert f'complete: {BOTS - 1} rotated, 1 changed concurrently (left alone)' in capsys.readouterr().out
+    assert _bot_ids()[raced] == live_token
+
+def test_dry_run_writes_nothing(app, new_key, capsys):
+    before = _bot_ids()
+    assert rotate(sleep=0, dry_run=True, app=app)
+    assert f'dry run complete: {BOTS} rotated' in capsys.readouterr().out
+    assert _bot_ids() == before
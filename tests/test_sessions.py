@@ -0,0 +1,49 @@
+"""
+Server-side sessions: deactivating a user or revoking their sessions signs them out at once
+"""
+import pytest
+from models import User
+from utils.sessions import session_store
+from conftest import signed_in
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, app, tmp_path):
+    """The session store on this worker's memory or on a shared SQLite file"""
+    if request.param == 'sqlite':
+        app.config['SESSION_STORE_URL'] = f'sqlite:///{tmp_path / "sessions.db"}'
+        session_store.init_app(app)
+    yield session_store
+    app.config['SESSION_STORE_URL'] = None
+    session_store.init_app(app)
+
+def _user_id():
+    return User.query.filter_by(email='user@example.com').first().user_id
+
+def test_deactivating_a_user_ends_their_sessions(app, store):
+    admin_client = signed_in(app, 'admin@example.com')
+    user_client = signed_in(app, 'user@example.com')
+    user_id = _user_id()
+    assert user_client.get('/api/me').status_code == 200
+    assert store.count(user_id) == 1
+    response = admin_client.put(f'/api/users/{user_id}', json={'is_active': False})
+    assert response.status_code == 200
+    assert store.count(user_id) == 0
+    assert user_client.get('/api/me').status_code == 401
+    assert admin_client.get('/api/me').status_code == 200
+
+def test_revoke_endpoint_signs_user_out(app, store):
+    admin_client = signed_in(app, 'admin@example.com')
+    user_client = signed_in(app, 'user@example.com')
+    other_client = signed_in(app, 'user@example.com')
+    user_id = _user_id()
+    response = admin_client.get(f'/api/users/{user_id}/sessions')
+    assert response.get_json()['sessions'] == 2
+    assert admin_client.delete(f'/api/users/{user_id}/sessions').status_code == 200
+    assert admin_client.get(f'/api/users/{user_id}/sessions').get_json()['sessions'] == 0
+    assert user_client.get('/api/me').status_code == 401
+    assert other_client.get('/api/me').status_code == 401
+    # Signing in again works, the account itself is untouched
+    assert signed_in(app, 'user@example.com').get('/api/me').status_code == 200
+
+def test_revoking_unknown_user_is_404(admin_client):
+    assert admin_client.delete('/api/users/999/sessions').status_code == 404
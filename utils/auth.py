@@ -1,15 +1,83 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
-from flask import session, jsonify, request
+from flask import session, jsonify, request, g
 import bcrypt
 from models import User, Login, db
+from utils.rate_limit import TokenBucketLimiter
+from utils.sessions import session_store
+
+class PasswordHasherBusy(Exception):
+    """Raised when too many bcrypt operations are already queued"""
+
+class PasswordHasher:
+    """Runs bcrypt on a small dedicated pool so login bursts can't occupy every request thread
+
+    At most `workers` hashes run at once and at most `max_pending` wait;
+    beyond that PasswordHasherBusy is raised immediately.
+    """
+
+    def __init__(self, rounds=12, workers=2, max_pending=16):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.rounds = app.config.get('BCRYPT_ROUNDS', self.rounds)
+        self.workers = app.config.get('BCRYPT_WORKERS', self.workers)
+        self.max_pending = app.config.get('BCRYPT_MAX_PENDING', self.max_pending)
+        self._slots = threading.BoundedSemaphore(self.workers + self.max_pending)
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy()
+        try:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='bcrypt')
+                executor = self._executor
+            return executor.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        salt = bcrypt.gensalt(self.rounds)
+        return self._run(bcrypt.hashpw, password.encode('utf-8'), salt).decode('utf-8')
+
+    def verify(self, password, hashed):
+        return self._run(bcrypt.checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+
+    def needs_rehash(self, hashed):
+        """True if hashed was made with a different cost than the configured one"""
+        try:
+            return int(hashed.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+password_hasher = PasswordHasher()
+
+# Login attempts per client IP and per email, configured from LOGIN_* settings
+login_ip_limiter = TokenBucketLimiter(rate=0.5, burst=10)
+login_email_limiter = TokenBucketLimiter(rate=5 / 60, burst=5)
+
+def normalize_email(email: str) -> str:
+    """Emails are stored, looked up and rate limited in this form"""
+    return email.strip().lower()
 
 def hash_password(password: str) -> str:
     """Hash password using bcrypt"""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return password_hasher.hash(password)
 
 def verify_password(password: str, hashed: str) -> bool:
     """Verify password against hash"""
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+    return password_hasher.verify(password, hashed)
 
 def login_user(email: str, password: str):
     """Authenticate user and create session"""
@@ -24,34 +92,65 @@ def login_user(email: str, password: str):
     if not verify_password(password, login.password):
         return None, "Invalid password"
     
-    session['user_id'] = user.user_id
-    session['email'] = user.email
-    session['name'] = user.name
+    # Upgrade hashes made with an old cost factor while the password is at hand
+    if password_hasher.needs_rehash(login.password):
+        try:
+            login.password = hash_password(password)
+            db.session.commit()
+        except PasswordHasherBusy:
+            pass  # Retried on the next login
+    
+    # The cookie only carries the id of the server-side session
+    if session.get('sid'):
+        session_store.delete(session['sid'])
+    session.clear()
+    session['sid'] = session_store.create(user)
     return user, None
 
 def logout_user():
-    """Clear user session"""
+    """End the server-side session and clear the cookie, returns the session key or None"""
+    sid = session.get('sid')
     session.clear()
+    return session_store.delete(sid) if sid else None
+
+def get_current_session():
+    """Session record of the request ({'user_id', 'email', 'name', 'is_admin', 'expires'}) or None"""
+    if 'current_session' not in g:
+        sid = session.get('sid')
+        g.current_session = session_store.get(sid) if sid else None
+    return g.current_session
+
+def get_current_user_id():
+    """Get current logged in user_id from the session store (no query)"""
+    record = get_current_session()
+    return record['user_id'] if record else None
 
 def get_current_user():
-    """Get current logged in user"""
-    user_id = session.get('user_id')
-    if not user_id:
+    """Get current logged in user, loaded at most once per request"""
+    if 'current_user' not in g:
+        user_id = get_current_user_id()
+        g.current_user = db.session.get(User, user_id) if user_id else None
+    return g.current_user
+
+def get_current_user_info():
+    """Get {'is_admin', 'name'} of the current user from the session store (no query)"""
+    record = get_current_session()
+    if not record:
         return None
-    return User.query.get(user_id)
+    return {'is_admin': record['is_admin'], 'name': record['name']}
 
 def is_admin():
     """Check if current user is admin"""
-    user = get_current_user()
-    if not user:
+    info = get_current_user_info()
+    if not info:
         return False
-    return user.is_admin
+    return info['is_admin']
 
 def require_login(f):
     """Decorator to require user login"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
+        if get_current_session() is None:
             return jsonify({'error': 'Authentication required'}), 401
         return f(*args, **kwargs)
     return decorated_function
@@ -0,0 +1,179 @@
+"""
+Compact bot state shared by the Flask and ASGI bot-facing endpoints
+The per-bot state is cached as stored; the common commander is applied on top
+of it at response time (apply_commander), so a fleet-wide broadcast never has
+to touch or invalidate per-bot rows.
+
+Bots can ask for a compact one-line body instead of JSON (?format=compact or
+Accept: text/plain), see compact_payload(). Both are rendered once per state
+and served from rendered_state_cache afterwards.
+"""
+import json
+from datetime import datetime, timezone
+from sqlalchemy import select
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+from models import UserBot, BotBehaviour, CommonCommander
+from utils.cache import rendered_state_cache
+
+# The single common_commander row
+COMMANDER_ID = 1
+
+# Flags a listening bot takes from the common commander instead of its own behaviour
+COMMANDER_FLAGS = ('bot_state', 'hard_stop_all_trades', 'news_based_start_stop')
+
+# Compact format: "<format version>,<flags>,<validity epoch>,<version>", flags bit i = COMPACT_FLAGS[i]
+COMPACT_FORMAT_VERSION = 1
+COMPACT_FLAGS = ('bot_state', 'hard_stop_all_trades', 'listen_to_common_commander', 'news_based_start_stop',
+                 'refresh_data_from_bot', 'valid', 'emergency_stop')
+COMPACT_MIMETYPE = 'text/plain'
+
+DEFAULT_COMMANDER = {
+    'bot_state': False,
+    'hard_stop_all_trades': False,
+    'news_based_start_stop': False,
+    'emergency_stop': False,
+    'version': 0
+}
+
+def bot_state_query(bot_id_hash):
+    """Column-only SELECT of an active assignment and its behaviour"""
+    return (select(
+                UserBot.assign_id,
+                UserBot.validity,
+                UserBot.version,
+                BotBehaviour.bot_state,
+                BotBehaviour.hard_stop_all_trades,
+                BotBehaviour.listen_to_common_commander,
+                BotBehaviour.news_based_start_stop,
+                BotBehaviour.refresh_data_from_bot)
+            .outerjoin(BotBehaviour, (BotBehaviour.assign_id == UserBot.assign_id) & (BotBehaviour.is_active == True))
+            .where(UserBot.bot_id_hash == bot_id_hash, UserBot.is_active == True)
+            .limit(1))
+
+def row_to_bot_state(row):
+    """Build the cached state dict from a bot_state_query row (None if no row)"""
+    if row is None:
+        return None
+    return {
+        'assign_id': row.assign_id,
+        'validity': row.validity,
+        'version': row.version,
+        'bot_state': bool(row.bot_state),
+        'hard_stop_all_trades': bool(row.hard_stop_all_trades),
+        'listen_to_common_commander': bool(row.listen_to_common_commander),
+        'news_based_start_stop': bool(row.news_based_start_stop),
+        'refresh_data_from_bot': bool(row.refresh_data_from_bot)
+    }
+
+def commander_query():
+    """Column-only SELECT of the common commander row"""
+    return (select(
+                CommonCommander.bot_state,
+                CommonCommander.hard_stop_all_trades,
+                CommonCommander.news_based_start_stop,
+                CommonCommander.emergency_stop,
+                CommonCommander.version)
+            .where(CommonCommander.commander_id == COMMANDER_ID))
+
+def row_to_commander(row):
+    """Build the cached commander dict from a commander_query row (defaults if no row)"""
+    if row is None:
+        return dict(DEFAULT_COMMANDER)
+    return {
+        'bot_state': bool(row.bot_state),
+        'hard_stop_all_trades': bool(row.hard_stop_all_trades),
+        'news_based_start_stop': bool(row.news_based_start_stop),
+        'emergency_stop': bool(row.emergency_stop),
+        'version': row.version
+    }
+
+def apply_commander(state, commander):
+    """Return the effective state a bot should act on
+
+    Bots listening to the common commander take its flags, and an emergency
+    stop forces every bot off. The returned version is the sum of the
+    assignment and commander versions so it still moves whenever either does.
+    """
+    if state is None:
+        return None
+    effective = dict(state)
+    if state['listen_to_common_commander']:
+        for flag in COMMANDER_FLAGS:
+            effective[flag] = commander[flag]
+    if commander['emergency_stop']:
+        effective['bot_state'] = False
+        effective['hard_stop_all_trades'] = True
+    effective['emergency_stop'] = commander['emergency_stop']
+    effective['version'] = state['version'] + commander['version']
+    return effective
+
+def is_state_valid(state):
+    validity = state['validity']
+    return validity is None or validity > datetime.utcnow()
+
+def state_etag(state):
+    # Validity can lapse without a version bump, so it is part of the ETag
+    return f"{state['assign_id']}-{state['version']}-{int(is_state_valid(state))}"
+
+def state_payload(state):
+    validity = state['validity']
+    return {
+        'bot_state': state['bot_state'],
+        'hard_stop_all_trades': state['hard_stop_all_trades'],
+        'listen_to_common_commander': state['listen_to_common_commander'],
+        'news_based_start_stop': state['news_based_start_stop'],
+        'refresh_data_from_bot': state['refresh_data_from_bot'],
+        'validity': validity.isoformat() if validity else None,
+        'valid': is_state_valid(state),
+        'emergency_stop': state.get('emergency_stop', False),
+        'version': state['version']
+    }
+
+def _validity_epoch(state):
+    # Validity is stored as naive UTC; 0 means it never expires
+    validity = state['validity']
+    return int(validity.replace(tzinfo=timezone.utc).timestamp()) if validity else 0
+
+def compact_payload(state):
+    """One line for MQL5 clients, e.g. "1,33,1767225600,12" (parse with StringSplit on ',')"""
+    valid = is_state_valid(state)
+    flags = 0
+    for bit, name in enumerate(COMPACT_FLAGS):
+        if (valid if name == 'valid' else state.get(name, False)):
+            flags |= 1 << bit
+    return f"{COMPACT_FORMAT_VERSION},{flags},{_validity_epoch(state)},{state['version']}"
+
+def compact_validity(state):
+    """check_validity in the compact format: "<format version>,<valid 0/1>,<validity epoch>" """
+    return f"{COMPACT_FORMAT_VERSION},{int(is_state_valid(state))},{_validity_epoch(state)}"
+
+def wants_compact(format_arg, accept_header):
+    """?format=compact, or an Accept header preferring text/plain over JSON"""
+    if format_arg:
+        return format_arg == 'compact'
+    if not accept_header:
+        return False
+    accept = parse_accept_header(accept_header, MIMEAccept)
+    return accept.best_match(['application/json', COMPACT_MIMETYPE]) == COMPACT_MIMETYPE
+
+def render_state(state, compact):
+    """Response body for a state, rendered once and reused until the state changes
+
+    The effective version alone is not enough to key on (it is the sum of two
+    versions, and validity lapses without a change), so the cached body is
+    checked against every field it was rendered from.
+    """
+    key = (state['assign_id'], compact)
+    signature = (state['version'], is_state_valid(state), state['validity'],
+                 *(state.get(name, False) for name in COMPACT_FLAGS if name != 'valid'))
+    entry = rendered_state_cache.get(key)
+    if entry is not None and entry[0] == signature:
+        return entry[1]
+    if compact:
+        body = compact_payload(state)
+    else:
+        # Same bytes as jsonify() outside debug mode
+        body = json.dumps(state_payload(state), separators=(',', ':'), sort_keys=True) + '\n'
+    rendered_state_cache.set(key, (signature, body))
+    return body
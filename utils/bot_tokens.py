@@ -0,0 +1,125 @@
+"""
+Bot API tokens
+A token reads `bct_<prefix>_<secret>`. The 12 character prefix is public and
+unique, the secret is 256 random bits of which only an HMAC-SHA256 (keyed with
+BOT_TOKEN_KEY) is stored. Being random rather than a password, the secret
+needs no slow hash like bcrypt.
+
+Verification finds the prefix in bot_token_cache and compares the HMAC in
+constant time, the database is only read on a cache miss. Revoking a token,
+or unassigning its bot, drops it from every worker's cache through the
+invalidation bus.
+"""
+import hashlib
+import hmac
+import secrets
+from datetime import datetime
+from functools import wraps
+from flask import current_app, g, jsonify, request
+from sqlalchemy import select
+from config import Config
+from models import db, BotToken, UserBot
+from utils.cache import bot_token_cache
+
+TOKEN_SCHEME = 'bct'
+PREFIX_LENGTH = 12
+
+def token_digest(secret):
+    key = Config.BOT_TOKEN_KEY
+    if isinstance(key, str):
+        key = key.encode()
+    return hmac.new(key, secret.encode(), hashlib.sha256).hexdigest()
+
+def generate_token():
+    """A new (token, prefix, token_hash). The token itself is shown once and never stored."""
+    prefix = secrets.token_hex(PREFIX_LENGTH // 2)
+    secret = secrets.token_urlsafe(32)
+    return f'{TOKEN_SCHEME}_{prefix}_{secret}', prefix, token_digest(secret)
+
+def parse_token(token):
+    """(prefix, secret) of a well-formed token, else None"""
+    scheme, _, rest = token.partition('_')
+    prefix, _, secret = rest.partition('_')
+    if scheme != TOKEN_SCHEME or len(prefix) != PREFIX_LENGTH or not secret:
+        return None
+    return prefix, secret
+
+def bearer_token(authorization):
+    """The token of an `Authorization: Bearer <token>` header value, or None"""
+    if authorization and authorization[:7].lower() == 'bearer ':
+        return authorization[7:].strip() or None
+    return None
+
+def bot_token_query(prefix):
+    """Column-only SELECT of an active token of an active assignment"""
+    return (select(BotToken.token_hash, BotToken.assign_id, UserBot.bot_id_hash)
+            .join(UserBot, UserBot.assign_id == BotToken.assign_id)
+            .where(BotToken.prefix == prefix, BotToken.is_active == True, UserBot.is_active == True)
+            .limit(1))
+
+def row_to_token(row):
+    """Cache entry of a bot_token_query row, False for an unknown or revoked prefix"""
+    if row is None:
+        return False
+    return {'token_hash': row.token_hash, 'assign_id': row.assign_id, 'bot_id_hash': row.bot_id_hash}
+
+def check_token(entry, secret):
+    """{'assign_id', 'bot_id_hash'} of a cache entry when secret matches it, else None"""
+    if not entry or not hmac.compare_digest(entry['token_hash'], token_digest(secret)):
+        return None
+    return {'assign_id': entry['assign_id'], 'bot_id_hash': entry['bot_id_hash']}
+
+def verify_token(token):
+    """The bot a token belongs to ({'assign_id', 'bot_id_hash'}), or None"""
+    parsed = parse_token(token)
+    if parsed is None:
+        return None
+    prefix, secret = parsed
+    entry = bot_token_cache.get(prefix)
+    if entry is None:
+        # Not cached if revoked in the meantime, see BotStateCache
+        generation = bot_token_cache.generation()
+        entry = row_to_token(db.session.execute(bot_token_query(prefix)).first())
+        bot_token_cache.set(prefix, entry, generation)
+    return check_token(entry, secret)
+
+def token_error(message):
+    return jsonify({'error': message}), 401, {'WWW-Authenticate': 'Bearer'}
+
+def require_bot_token(f):
+    """Decorator for the bot-facing endpoints, sets g.bot_token to verify_token()'s result
+
+    Without a token the request passes with g.bot_token = None (the endpoint
+    then identifies the bot by bot_id) unless BOT_TOKEN_REQUIRED is set. An
+    invalid token is always refused.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        g.bot_token = None
+        token = bearer_token(request.headers.get('Authorization'))
+        if token is None:
+            if current_app.config['BOT_TOKEN_REQUIRED']:
+                return token_error('Bot token required')
+        else:
+            g.bot_token = verify_token(token)
+            if g.bot_token is None:
+                return token_error('Invalid bot token')
+        return f(*args, **kwargs)
+    return decorated_function
+
+def issue_token(assign_id, created_by):
+    """Add a token for an assignment (not committed), returns (token, BotToken)"""
+    token, prefix, token_hash = generate_token()
+    row = BotToken(assign_id=assign_id, prefix=prefix, token_hash=token_hash, created_by=created_by)
+    db.session.add(row)
+    return token, row
+
+def revoke_tokens(*criteria):
+    """Deactivate the active tokens matching criteria (not committed), returns their prefixes"""
+    prefixes = [prefix for (prefix,) in
+                db.session.query(BotToken.prefix).filter(BotToken.is_active == True, *criteria)]
+    if prefixes:
+        db.session.execute(BotToken.__table__.update()
+                           .where(BotToken.prefix.in_(prefixes))
+                           .values(is_active=False, revoked_on=datetime.utcnow()))
+    return prefixes
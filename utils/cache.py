@@ -0,0 +1,168 @@
+"""
+In-process caches
+BotStateCache holds the compact bot state served to polling bots, keyed by
+bot_id_hash and dropped whenever the assignment changes. TTLCache is a small
+general purpose expiring map used for the common commander record,
+pre-rendered poll bodies and verified bot API tokens.
+"""
+import threading
+import time
+
+class BotStateCache:
+    """Thread-safe bot state cache, invalidated by assign_id or bot_id_hash
+
+    A miss reads generation() before its query and passes it to set(): the
+    write is dropped when an invalidation happened in between, so a state read
+    just before a change can't be cached after the change was invalidated.
+    """
+
+    def __init__(self, ttl=300, negative_ttl=30, max_entries=100000):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = {}  # bot_id_hash -> (expires_at, state or None), insertion ordered
+        self._keys = {}     # assign_id -> bot_id_hash
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def init_app(self, app):
+        self.ttl = app.config.get('BOT_STATE_CACHE_TTL', self.ttl)
+        self.negative_ttl = app.config.get('BOT_STATE_CACHE_NEGATIVE_TTL', self.negative_ttl)
+        self.max_entries = app.config.get('BOT_STATE_CACHE_MAX_ENTRIES', self.max_entries)
+        self.clear()
+
+    def generation(self):
+        """Token for set(), read before loading a state from the database"""
+        return self._generation
+
+    def get(self, key):
+        """Return (found, state). state is None for a cached unknown bot."""
+        entry = self._entries.get(key)
+        if entry is not None and (entry[0] is None or entry[0] > time.monotonic()):
+            self.hits += 1
+            return True, entry[1]
+        self.misses += 1
+        return False, None
+
+    def set(self, key, state, generation=None):
+        ttl = self.ttl if state is not None else self.negative_ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return  # invalidated while the state was being read
+            self._pop(key)
+            if len(self._entries) >= self.max_entries:
+                self._evict()
+            self._entries[key] = (expires_at, state)
+            if state is not None:
+                self._keys[state['assign_id']] = key
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None and entry[1] is not None and self._keys.get(entry[1]['assign_id']) == key:
+            del self._keys[entry[1]['assign_id']]
+
+    def _evict(self):
+        """Make room: drop expired entries, then the oldest ones (lock held)"""
+        now = time.monotonic()
+        for key in [key for key, (expires_at, _) in self._entries.items()
+                    if expires_at is not None and expires_at <= now]:
+            self._pop(key)
+        while len(self._entries) >= self.max_entries:
+            self._pop(next(iter(self._entries)))
+            self.evicted += 1
+
+    def invalidate(self, assign_id):
+        with self._lock:
+            self._generation += 1
+            key = self._keys.pop(assign_id, None)
+            if key is not None:
+                self._entries.pop(key, None)
+
+    def invalidate_key(self, key):
+        with self._lock:
+            self._generation += 1
+            self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._keys.clear()
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evicted': self.evicted
+        }
+
+class TTLCache:
+    """Thread-safe expiring map with a size bound (oldest entries evicted first)
+
+    set() takes an optional generation() read before the value was loaded,
+    as BotStateCache.set.
+    """
+
+    def __init__(self, ttl=30, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = {}  # key -> (expires_at, value), insertion ordered
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def generation(self):
+        return self._generation
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return default
+
+    def set(self, key, value, generation=None):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return  # invalidated while the value was being read
+            self._entries.pop(key, None)
+            while len(self._entries) >= self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+bot_state_cache = BotStateCache()
+
+# Single entry: the common commander state every poll is merged with
+commander_cache = TTLCache(ttl=5, max_entries=1)
+
+# Pre-rendered poll bodies per (assign_id, format), see utils.bot_state.render_state
+rendered_state_cache = TTLCache(ttl=300, max_entries=100000)
+
+# Bot API tokens by public prefix, see utils.bot_tokens.verify_token
+bot_token_cache = TTLCache(ttl=300, max_entries=100000)
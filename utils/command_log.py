@@ -0,0 +1,36 @@
+"""
+Bot command log
+Every control change is appended to bot_command_log in the same transaction
+as the change itself, so the history can't disagree with the data.
+"""
+from datetime import datetime
+from models import BotCommandLog, db
+
+def format_value(value):
+    """Store values as text: booleans as true/false, datetimes as ISO 8601"""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+def command_row(assign_id, action, old_value, new_value, actor_id):
+    return {
+        'assign_id': assign_id,
+        'action': action,
+        'old_value': format_value(old_value),
+        'new_value': format_value(new_value),
+        'actor_id': actor_id,
+        'created_on': datetime.utcnow()
+    }
+
+def record_command(assign_id, action, old_value, new_value, actor_id):
+    """Append one entry to the current transaction (committed with the change)"""
+    db.session.add(BotCommandLog(**command_row(assign_id, action, old_value, new_value, actor_id)))
+
+def record_commands(rows):
+    """Append many command_row() entries with one batched INSERT"""
+    if rows:
+        db.session.execute(BotCommandLog.__table__.insert(), rows)
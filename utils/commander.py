@@ -0,0 +1,24 @@
+"""
+Common commander lookup
+One global record applied to every bot at poll time. It is cached per worker
+for COMMANDER_CACHE_TTL seconds. A change drops the copy of every worker through
+the invalidation bus (commander_changed()); the TTL only bounds staleness when
+a bus message is lost.
+"""
+from models import db
+from utils.bot_state import commander_query, row_to_commander
+from utils.cache import commander_cache
+
+COMMANDER_CACHE_KEY = 'commander'
+
+def get_commander():
+    """Current common commander state, one indexed read at most per TTL"""
+    commander = commander_cache.get(COMMANDER_CACHE_KEY)
+    if commander is None:
+        generation = commander_cache.generation()
+        commander = row_to_commander(db.session.execute(commander_query()).first())
+        commander_cache.set(COMMANDER_CACHE_KEY, commander, generation)
+    return commander
+
+def invalidate_commander():
+    commander_cache.invalidate(COMMANDER_CACHE_KEY)
@@ -0,0 +1,88 @@
+"""
+Database connection pool helpers
+InstrumentedQueuePool records how long requests wait for a pooled connection,
+pool_stats() reports pool usage for the admin endpoint, and RoutingSession
+sends the reads of endpoints marked with @use_replica to the optional read
+replica (the 'replica' bind, see REPLICA_DATABASE_URI).
+"""
+import threading
+import time
+from functools import wraps
+from flask import g, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Select
+from sqlalchemy.pool import QueuePool
+
+REPLICA_BIND = 'replica'
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that keeps checkout wait time statistics"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts += 1
+                self.wait_total += waited
+                if waited > self.wait_max:
+                    self.wait_max = waited
+
+def pool_stats(engine):
+    """Usage snapshot of an engine's connection pool"""
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return {'pool': type(pool).__name__}
+    stats = {
+        'pool': type(pool).__name__,
+        'size': pool.size(),
+        'checked_in': pool.checkedin(),
+        'checked_out': pool.checkedout(),
+        'overflow': pool.overflow(),
+        'max_overflow': pool._max_overflow,
+        'timeout': pool.timeout()
+    }
+    if isinstance(pool, InstrumentedQueuePool):
+        stats.update({
+            'checkouts': pool.checkouts,
+            'timeouts': pool.timeouts,
+            'wait_avg_ms': round(pool.wait_total / pool.checkouts * 1000, 3) if pool.checkouts else 0.0,
+            'wait_max_ms': round(pool.wait_max * 1000, 3)
+        })
+    return stats
+
+def use_replica(f):
+    """Route this endpoint's reads to the read replica when one is configured
+
+    Only for read-only endpoints that tolerate replication lag.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        g.use_replica = True
+        return f(*args, **kwargs)
+    return decorated_function
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that sends SELECTs to the replica when requested"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and isinstance(clause, Select)
+                and has_request_context() and g.get('use_replica')):
+            engine = self._db.engines.get(REPLICA_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
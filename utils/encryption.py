@@ -1,19 +1,52 @@
-from cryptography.fernet import Fernet
-import base64
+from cryptography.fernet import Fernet, MultiFernet, InvalidToken
+from functools import lru_cache
+import hashlib
+import hmac
 from config import Config
 
+# Built once per process, see reset_encryption_cache()
+_fernet = None
+
+def _load_key(key):
+    if isinstance(key, str):
+        key = key.strip().encode()
+    return Fernet(key)
+
 def _get_fernet():
-    """Get Fernet instance from encryption key"""
-    key = Config.ENCRYPTION_KEY
-    if isinstance(key, bytes):
-        key = key.decode()
-    # Ensure it's a valid Fernet key (32 bytes base64 encoded)
-    try:
-        # Try to use the key directly
-        return Fernet(key.encode() if isinstance(key, str) else key)
-    except:
-        # If key is not valid, generate a new one (shouldn't happen in production)
-        raise ValueError("Invalid encryption key. Please generate a new key using generate_key.py")
+    """Get the cached MultiFernet built from the primary and old encryption keys.
+
+    The first key (ENCRYPTION_KEY) encrypts, every key is tried for decryption.
+    """
+    global _fernet
+    if _fernet is None:
+        try:
+            keys = [Config.ENCRYPTION_KEY] + list(Config.ENCRYPTION_OLD_KEYS)
+            _fernet = MultiFernet([_load_key(key) for key in keys])
+        except Exception:
+            raise ValueError("Invalid encryption key. Please generate a new key using generate_key.py")
+    return _fernet
+
+@lru_cache(maxsize=Config.DECRYPT_CACHE_SIZE)
+def _decrypt_cached(encrypted_bot_id: str) -> str:
+    # Ciphertext -> plaintext is immutable, so it is safe to memoize.
+    # Exceptions are not cached, failed tokens are retried on every call.
+    return _get_fernet().decrypt(encrypted_bot_id.encode()).decode()
+
+def reset_encryption_cache():
+    """Drop the cached cipher and decrypted values (after changing keys)"""
+    global _fernet
+    _fernet = None
+    _decrypt_cached.cache_clear()
+
+def decrypt_cache_stats():
+    """Hit/miss counters of the decrypt LRU (misses are real decryptions)"""
+    info = _decrypt_cached.cache_info()
+    return {
+        'hits': info.hits,
+        'misses': info.misses,
+        'size': info.currsize,
+        'max_size': info.maxsize
+    }
 
 def encrypt_bot_id(bot_id: str) -> str:
     """Encrypt bot_id before storing in database"""
@@ -23,15 +56,22 @@ def encrypt_bot_id(bot_id: str) -> str:
 
 def decrypt_bot_id(encrypted_bot_id: str) -> str:
     """Decrypt bot_id from database"""
-    from cryptography.fernet import InvalidToken
-    
     try:
-        fernet = _get_fernet()
-        decrypted = fernet.decrypt(encrypted_bot_id.encode())
-        return decrypted.decode()
+        return _decrypt_cached(encrypted_bot_id)
     except InvalidToken:
         # If decryption fails, return a placeholder indicating encryption key mismatch
         return "[Encrypted - Key Mismatch]"
     except Exception as e:
         # Handle other decryption errors gracefully
         return f"[Decryption Error: {type(e).__name__}]"
+
+def hash_bot_id(bot_id: str) -> str:
+    """Deterministic keyed blind index of a plaintext bot_id.
+
+    Fernet output is randomized, so the encrypted column can never be used
+    for lookups. The HMAC digest is stored alongside it and indexed instead.
+    """
+    key = Config.BOT_ID_INDEX_KEY
+    if isinstance(key, str):
+        key = key.encode()
+    return hmac.new(key, bot_id.encode(), hashlib.sha256).hexdigest()
@@ -0,0 +1,182 @@
+"""
+Validity expiry
+A background thread per worker keeps the validity expirations of the next
+EXPIRY_LOOKAHEAD seconds in a min-heap and sleeps until the earliest one. When
+a bot's validity passes it is stopped (bot_state off, versions bumped, command
+logged and queued), its cache entry dropped and waiting bots woken.
+
+The heap is reloaded from an indexed range query (is_active, validity) every
+EXPIRY_RESYNC_INTERVAL seconds, which also picks up edits made on other
+workers and bots that expired while no worker was running. Edits handled by
+this worker are scheduled right away (schedule()). Expiring is idempotent, so
+several workers firing for the same bot stop it once.
+"""
+import heapq
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from models import db, UserBot, BotBehaviour
+from utils.command_log import record_commands, command_row
+from utils.invalidation import bots_changed
+from utils.outbox import enqueue_commands
+
+logger = logging.getLogger(__name__)
+
+class ExpiryScheduler:
+    """Min-heap of (validity, assign_id) drained by a background thread"""
+
+    def __init__(self, lookahead=3600, resync_interval=300, batch_size=500):
+        self.lookahead = lookahead
+        self.resync_interval = resync_interval
+        self.batch_size = batch_size
+        self.app = None
+        self._cond = threading.Condition()
+        self._heap = []
+        self._scheduled = {}  # assign_id -> validity of its live heap entry
+        self._next_sync = 0
+        self._pid = None
+        self.expired = 0
+
+    def init_app(self, app):
+        self.app = app
+        self.lookahead = app.config.get('EXPIRY_LOOKAHEAD', self.lookahead)
+        self.resync_interval = app.config.get('EXPIRY_RESYNC_INTERVAL', self.resync_interval)
+        self.batch_size = app.config.get('EXPIRY_BATCH_SIZE', self.batch_size)
+        with self._cond:
+            self._heap = []
+            self._scheduled = {}
+            self._next_sync = 0
+        if app.config.get('EXPIRY_ENABLED'):
+            app.before_request(self.start)
+
+    def schedule(self, assign_id, validity):
+        """Track a committed validity change (None: never expires / unassigned)"""
+        with self._cond:
+            if validity is None or validity > datetime.utcnow() + timedelta(seconds=self.lookahead):
+                # Beyond the window, the next resync loads it in time
+                self._scheduled.pop(assign_id, None)
+                return
+            self._scheduled[assign_id] = validity
+            heapq.heappush(self._heap, (validity, assign_id))
+            if self._heap[0] == (validity, assign_id):
+                self._cond.notify()
+
+    def _pop_due(self, now):
+        due = []
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now:
+                validity, assign_id = heapq.heappop(self._heap)
+                # Entries replaced by a later schedule() are skipped here
+                if self._scheduled.get(assign_id) == validity:
+                    del self._scheduled[assign_id]
+                    due.append(assign_id)
+        return due
+
+    def sync(self):
+        """Reload the upcoming expirations and stop bots already past their validity"""
+        now = datetime.utcnow()
+        upcoming = (db.session.query(UserBot.assign_id, UserBot.validity)
+                    .filter(UserBot.is_active == True,
+                            UserBot.validity > now,
+                            UserBot.validity <= now + timedelta(seconds=self.lookahead))
+                    .all())
+        with self._cond:
+            self._heap = [(validity, assign_id) for assign_id, validity in upcoming]
+            heapq.heapify(self._heap)
+            self._scheduled = {assign_id: validity for assign_id, validity in upcoming}
+        # Every overdue bot, in assign_id batches: a backlog (e.g. after downtime)
+        # must not wait for later resyncs
+        stopped = []
+        after = 0
+        while True:
+            overdue = [assign_id for (assign_id,) in
+                       db.session.query(UserBot.assign_id)
+                       .join(BotBehaviour, (BotBehaviour.assign_id == UserBot.assign_id) & (BotBehaviour.is_active == True))
+                       .filter(UserBot.is_active == True, UserBot.validity <= now, BotBehaviour.bot_state == True,
+                               UserBot.assign_id > after)
+                       .order_by(UserBot.assign_id)
+                       .limit(self.batch_size)]
+            if not overdue:
+                return stopped
+            stopped += self.expire(overdue)
+            after = overdue[-1]
+
+    def expire(self, assign_ids):
+        """Stop the given bots whose validity has passed, returns the ids stopped"""
+        if not assign_ids:
+            return []
+        now = datetime.utcnow()
+        # Locking read: another worker expiring the same bots waits, then sees them stopped
+        rows = (db.session.query(UserBot.assign_id, BotBehaviour.bot_state)
+                .outerjoin(BotBehaviour, (BotBehaviour.assign_id == UserBot.assign_id) & (BotBehaviour.is_active == True))
+                .filter(UserBot.assign_id.in_(assign_ids), UserBot.is_active == True, UserBot.validity <= now)
+                .with_for_update()
+                .all())
+        running = [assign_id for assign_id, bot_state in rows if bot_state]
+        if running:
+            record_commands([command_row(assign_id, 'bot_state', True, False, None) for assign_id in running])
+            enqueue_commands(running, 'bot_state', False)
+            db.session.execute(BotBehaviour.__table__.update()
+                               .where(BotBehaviour.assign_id.in_(running), BotBehaviour.is_active == True)
+                               .values(bot_state=False, version=BotBehaviour.version + 1))
+            db.session.execute(UserBot.__table__.update()
+                               .where(UserBot.assign_id.in_(running))
+                               .values(version=UserBot.version + 1))
+        db.session.commit()
+        # Bots that were already off still get the event, their state now reads valid: false
+        bots_changed([assign_id for assign_id, _ in rows])
+        if running:
+            self.expired += len(running)
+            logger.info('Bots expired', extra={'assign_ids': running})
+        return running
+
+    def run_once(self):
+        """Resync when due and expire everything due now, returns the ids stopped"""
+        stopped = []
+        with self.app.app_context():
+            try:
+                if time.monotonic() >= self._next_sync:
+                    self._next_sync = time.monotonic() + self.resync_interval
+                    stopped += self.sync()
+                due = self._pop_due(datetime.utcnow())
+                for start in range(0, len(due), self.batch_size):
+                    stopped += self.expire(due[start:start + self.batch_size])
+            finally:
+                db.session.remove()
+        return stopped
+
+    def _wait(self):
+        with self._cond:
+            timeout = self._next_sync - time.monotonic()
+            if self._heap:
+                timeout = min(timeout, (self._heap[0][0] - datetime.utcnow()).total_seconds())
+            if timeout > 0:
+                self._cond.wait(timeout)
+
+    def _run(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception:
+                # Popped bots are found again by the next resync
+                logger.exception('Validity expiry run failed')
+                self._next_sync = min(self._next_sync, time.monotonic() + 30)
+            self._wait()
+
+    def start(self):
+        """Start this worker's expiry thread (once per process)"""
+        if self._pid != os.getpid():
+            with self._cond:
+                if self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    threading.Thread(target=self._run, name='validity-expiry', daemon=True).start()
+
+    def stats(self):
+        return {
+            'scheduled': len(self._scheduled),
+            'expired': self.expired
+        }
+
+expiry_scheduler = ExpiryScheduler()
@@ -0,0 +1,202 @@
+"""
+Bot heartbeat ingestion
+Every bot request records "seen now" (plus optional telemetry: equity, open
+trades, bot version) in a per-worker in-memory buffer. Repeated heartbeats of
+the same bot between flushes collapse into one entry, and a background thread
+writes the buffer to bot_heartbeat every HEARTBEAT_FLUSH_INTERVAL seconds with
+one batched upsert, instead of one UPDATE per poll.
+
+Heartbeats are best effort: a flush that fails is retried with the next one,
+and whatever is buffered when a worker is killed is simply replaced by the
+bot's next poll.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.exc import IntegrityError
+from models import db, BotHeartbeat
+
+logger = logging.getLogger(__name__)
+
+# Telemetry fields a bot may report, with their bot_heartbeat column
+TELEMETRY_FIELDS = ('equity', 'open_trades', 'bot_version')
+
+class HeartbeatBuffer:
+    """Coalesces heartbeats per assign_id and flushes them in batches"""
+
+    def __init__(self, flush_interval=5, online_seconds=90, max_entries=100000):
+        self.flush_interval = flush_interval
+        self.online_seconds = online_seconds
+        self.max_entries = max_entries
+        self.app = None
+        self._lock = threading.Lock()
+        self._pending = {}   # assign_id -> {'last_seen': ..., telemetry...}
+        self._flushing = {}  # batch being written, still visible to last_seen()
+        self._thread = None
+        self._pid = None
+        self.flushes = 0
+        self.written = 0
+        self.dropped = 0
+
+    def init_app(self, app):
+        self.app = app
+        self.flush_interval = app.config.get('HEARTBEAT_FLUSH_INTERVAL', self.flush_interval)
+        self.online_seconds = app.config.get('HEARTBEAT_ONLINE_SECONDS', self.online_seconds)
+        self.max_entries = app.config.get('HEARTBEAT_MAX_BUFFER', self.max_entries)
+        with self._lock:
+            self._pending.clear()
+
+    def record(self, assign_id, telemetry=None):
+        """Note that a bot was seen now; telemetry is a dict of TELEMETRY_FIELDS"""
+        now = datetime.utcnow()
+        with self._lock:
+            entry = self._pending.get(assign_id)
+            if entry is None:
+                if len(self._pending) >= self.max_entries:
+                    self.dropped += 1
+                    return
+                entry = self._pending[assign_id] = {}
+            entry['last_seen'] = now
+            if telemetry:
+                entry.update(telemetry)
+                entry['updated_on'] = now
+        self._ensure_thread()
+
+    def last_seen(self, assign_id):
+        """Newest heartbeat of this worker not yet in the database, or None"""
+        entry = self._pending.get(assign_id) or self._flushing.get(assign_id)
+        return entry['last_seen'] if entry else None
+
+    def merge_last_seen(self, assign_id, stored):
+        """The later of a stored last_seen and this worker's buffered one"""
+        buffered = self.last_seen(assign_id)
+        if buffered is None or (stored is not None and stored >= buffered):
+            return stored
+        return buffered
+
+    def is_online(self, last_seen):
+        return last_seen is not None and last_seen >= self.online_cutoff()
+
+    def online_cutoff(self):
+        return datetime.utcnow() - timedelta(seconds=self.online_seconds)
+
+    def _ensure_thread(self):
+        # Started lazily so each forked worker gets its own flusher
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    self._thread = threading.Thread(target=self._run, name='heartbeat-flush', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Heartbeat flush failed')
+
+    def flush(self):
+        """Write buffered heartbeats, returns the number of bots written"""
+        with self._lock:
+            batch, self._pending = self._pending, {}
+            self._flushing = batch
+        if not batch or self.app is None:
+            self._flushing = {}
+            return 0
+        try:
+            with self.app.app_context():
+                try:
+                    _upsert(batch)
+                    db.session.commit()
+                except IntegrityError:
+                    # An assignment was deleted meanwhile; its bots' next polls refill the buffer
+                    db.session.rollback()
+                    logger.warning('Heartbeat batch dropped', extra={'bots': len(batch)})
+                    return 0
+                except Exception:
+                    db.session.rollback()
+                    self._requeue(batch)
+                    raise
+                finally:
+                    db.session.remove()
+        finally:
+            self._flushing = {}
+        self.flushes += 1
+        self.written += len(batch)
+        return len(batch)
+
+    def _requeue(self, batch):
+        with self._lock:
+            for assign_id, entry in batch.items():
+                newer = self._pending.get(assign_id)
+                self._pending[assign_id] = dict(entry, **newer) if newer else entry
+
+    def stats(self):
+        return {
+            'buffered': len(self._pending),
+            'flushes': self.flushes,
+            'written': self.written,
+            'dropped': self.dropped
+        }
+
+def _upsert(batch):
+    """INSERT ... ON DUPLICATE KEY UPDATE (ON CONFLICT on SQLite), one statement per shape"""
+    table = BotHeartbeat.__table__
+    groups = {}
+    for assign_id, entry in batch.items():
+        row = dict(entry, assign_id=assign_id)
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+    is_mysql = db.engine.dialect.name == 'mysql'
+    for columns, rows in groups.items():
+        if is_mysql:
+            stmt = mysql.insert(table)
+            new = stmt.inserted
+            # Workers flush independently, never move last_seen backwards
+            latest = func.greatest(table.c.last_seen, new.last_seen)
+        else:
+            stmt = sqlite.insert(table)
+            new = stmt.excluded
+            latest = func.max(table.c.last_seen, new.last_seen)
+        values = {column: new[column] for column in columns if column not in ('assign_id', 'last_seen')}
+        values['last_seen'] = latest
+        if is_mysql:
+            stmt = stmt.on_duplicate_key_update(values)
+        else:
+            stmt = stmt.on_conflict_do_update(index_elements=[table.c.assign_id], set_=values)
+        db.session.execute(stmt, rows)
+
+heartbeat_buffer = HeartbeatBuffer()
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        heartbeat_buffer.flush()
+    except Exception:
+        logger.exception('Heartbeat flush at exit failed')
+
+def parse_telemetry(data):
+    """Validate a heartbeat body; returns (telemetry dict, error message or None)"""
+    telemetry = {}
+    equity = data.get('equity')
+    if equity is not None:
+        if isinstance(equity, bool) or not isinstance(equity, (int, float)):
+            return None, 'equity must be a number'
+        telemetry['equity'] = round(equity, 2)
+    open_trades = data.get('open_trades')
+    if open_trades is not None:
+        if isinstance(open_trades, bool) or not isinstance(open_trades, int) or open_trades < 0:
+            return None, 'open_trades must be a non-negative integer'
+        telemetry['open_trades'] = open_trades
+    version = data.get('version')
+    if version is not None:
+        if not isinstance(version, str) or len(version) > 32:
+            return None, 'version must be a string of at most 32 characters'
+        telemetry['bot_version'] = version
+    return telemetry, None
@@ -0,0 +1,16 @@
+from flask import request, Response
+
+def is_not_modified(etag: str) -> bool:
+    """Check the request's If-None-Match header against an ETag"""
+    return request.if_none_match.contains(etag)
+
+def not_modified(etag: str) -> Response:
+    """Empty 304 response carrying the current ETag"""
+    response = Response(status=304)
+    return with_etag(response, etag)
+
+def with_etag(response, etag: str):
+    """Attach ETag and force clients to revalidate before reusing the body"""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
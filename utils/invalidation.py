@@ -0,0 +1,327 @@
+"""
+Cross-worker cache invalidation
+Every worker keeps its own bot state, user and commander caches. A change is
+applied to the caches of the worker that made it right away and published on
+the invalidation bus; every other worker subscribed to the bus drops the same
+entries and wakes its waiting bots. The TTLs still bound staleness when a
+message is lost.
+
+INVALIDATION_BUS_URL selects the transport:
+  redis://host:6379/0    Redis pub/sub, for workers on several hosts
+  unix:///run/botcommander/bus
+                         one datagram socket per worker in that directory,
+                         for the workers of one host without Redis
+  unset or local://      in-memory, delivers between the buses of one process
+                         (a single worker, tests)
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from utils.cache import bot_state_cache, bot_token_cache
+from utils.commander import invalidate_commander
+from utils.notify import bot_notifier
+from utils.sessions import session_store
+
+logger = logging.getLogger(__name__)
+
+# Values per message, keeps Unix datagrams well below the socket buffer size
+MAX_VALUES_PER_MESSAGE = 500
+
+class LocalBackend:
+    """In-memory delivery to the other buses of this process"""
+
+    _lock = threading.Lock()
+    _channels = {}  # channel -> list of LocalBackend
+
+    def __init__(self, channel, on_message):
+        self.channel = channel
+        self.on_message = on_message
+
+    def start(self):
+        with self._lock:
+            self._channels.setdefault(self.channel, []).append(self)
+
+    def send(self, data):
+        for backend in list(self._channels.get(self.channel, ())):
+            if backend is not self:
+                backend.on_message(data)
+
+    def close(self):
+        with self._lock:
+            members = self._channels.get(self.channel, [])
+            if self in members:
+                members.remove(self)
+
+class UnixSocketBackend:
+    """One datagram socket per worker in a shared directory, sent to all the others"""
+
+    def __init__(self, directory, on_message):
+        self.directory = directory
+        self.on_message = on_message
+        self.name = f'{os.getpid()}-{uuid.uuid4().hex[:8]}.sock'
+        self._sock = None
+        self._sender = None
+
+    def start(self):
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(os.path.join(self.directory, self.name))
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        # A worker that stops reading must not block the request publishing
+        self._sender.setblocking(False)
+        threading.Thread(target=self._run, name='invalidation-bus', daemon=True).start()
+
+    def _run(self):
+        sock = self._sock
+        while True:
+            try:
+                data = sock.recv(1 << 20)
+            except OSError:
+                return
+            if not data:
+                return  # shut down by close()
+            self.on_message(data)
+
+    def send(self, data):
+        failed = 0
+        for name in os.listdir(self.directory):
+            if name == self.name or not name.endswith('.sock'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                self._sender.sendto(data, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Left behind by a worker that exited without cleaning up
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            except OSError:
+                failed += 1
+        if failed:
+            raise OSError(f'{failed} worker(s) did not accept the message')
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                self._sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        for sock in (self._sock, self._sender):
+            if sock is not None:
+                sock.close()
+        try:
+            os.remove(os.path.join(self.directory, self.name))
+        except OSError:
+            pass
+
+class RedisBackend:
+    """Redis pub/sub on one channel, resubscribing with backoff when the connection drops"""
+
+    def __init__(self, url, channel, on_message, on_reconnect):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('INVALIDATION_BUS_URL is a Redis URL but the redis package is not installed. '
+                               'Install it with: pip install -r requirements-redis.txt')
+        self._redis = redis
+        self.channel = channel
+        self.on_message = on_message
+        self.on_reconnect = on_reconnect
+        self._publisher = redis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2)
+        self._subscriber = redis.Redis.from_url(url, socket_connect_timeout=5, health_check_interval=30)
+        self._pubsub = None
+        self._closed = False
+
+    def start(self):
+        threading.Thread(target=self._run, name='invalidation-bus', daemon=True).start()
+
+    def _run(self):
+        delay = 1
+        lost = False
+        while not self._closed:
+            pubsub = self._pubsub = self._subscriber.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(self.channel)
+                if lost:
+                    # Messages published while disconnected are gone
+                    self.on_reconnect()
+                    lost = False
+                delay = 1
+                for message in pubsub.listen():
+                    if message['type'] == 'message':
+                        self.on_message(message['data'])
+            except (self._redis.RedisError, OSError, ValueError):
+                if self._closed:
+                    return
+                logger.warning('Invalidation bus disconnected, retrying in %ss', delay)
+            finally:
+                pubsub.close()
+            lost = True
+            time.sleep(delay)
+            delay = min(delay * 2, 30)
+
+    def send(self, data):
+        self._publisher.publish(self.channel, data)
+
+    def close(self):
+        self._closed = True
+        if self._pubsub is not None:
+            self._pubsub.close()
+        self._publisher.close()
+
+def create_backend(url, channel, on_message, on_reconnect):
+    if not url or url.startswith('local://'):
+        return LocalBackend(channel, on_message)
+    if url.startswith('unix://'):
+        return UnixSocketBackend(url[len('unix://'):], on_message)
+    if url.startswith(('redis://', 'rediss://')):
+        return RedisBackend(url, channel, on_message, on_reconnect)
+    raise ValueError(f'Unsupported INVALIDATION_BUS_URL: {url}')
+
+class InvalidationBus:
+    """Applies invalidations on this worker and relays them to the others"""
+
+    def __init__(self, url=None, channel='botcommander:invalidate'):
+        self.url = url
+        self.channel = channel
+        self.handlers = {}  # kind -> handler(values)
+        self.backend = None
+        self.origin = None
+        self._lock = threading.Lock()
+        self._pid = None
+        self.published = 0
+        self.received = 0
+        self.failed = 0
+
+    def init_app(self, app):
+        self.url = app.config.get('INVALIDATION_BUS_URL', self.url)
+        self.channel = app.config.get('INVALIDATION_CHANNEL', self.channel)
+        self.close()
+        app.before_request(self.start)
+
+    def handle(self, kind, handler):
+        self.handlers[kind] = handler
+
+    def start(self):
+        """Connect and subscribe (once per process, the backend doesn't survive a fork)"""
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self.origin = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+                    backend = create_backend(self.url, self.channel, self._receive, self._reset)
+                    backend.start()
+                    self.backend = backend
+                    self._pid = os.getpid()
+
+    def close(self):
+        with self._lock:
+            if self.backend is not None and self._pid == os.getpid():
+                self.backend.close()
+            self.backend = None
+            self._pid = None
+
+    def publish(self, kind, values=()):
+        """Invalidate here, then on every other worker"""
+        values = list(values)
+        self.handlers[kind](values)
+        self.start()
+        for start in range(0, max(len(values), 1), MAX_VALUES_PER_MESSAGE):
+            message = {'origin': self.origin, 'kind': kind, 'values': values[start:start + MAX_VALUES_PER_MESSAGE]}
+            try:
+                self.backend.send(json.dumps(message, separators=(',', ':')).encode('utf-8'))
+                self.published += 1
+            except Exception:
+                # The change is committed; other workers catch up when their entries expire
+                self.failed += 1
+                logger.warning('Invalidation not delivered to every worker', exc_info=True,
+                               extra={'kind': kind})
+
+    def _receive(self, data):
+        try:
+            message = json.loads(data)
+            if message['origin'] == self.origin:
+                return
+            self.received += 1
+            self.handlers[message['kind']](message['values'])
+        except Exception:
+            logger.exception('Invalid invalidation message')
+
+    def _reset(self):
+        """Forget everything cached after missing messages"""
+        bot_state_cache.clear()
+        bot_token_cache.clear()
+        session_store.forget_users()
+        invalidate_commander()
+        bot_notifier.publish_all()
+
+    def stats(self):
+        return {
+            'published': self.published,
+            'received': self.received,
+            'failed': self.failed
+        }
+
+def _invalidate_bots(assign_ids):
+    for assign_id in assign_ids:
+        bot_state_cache.invalidate(assign_id)
+        bot_notifier.publish(assign_id)
+
+def _invalidate_bot_keys(bot_id_hashes):
+    for bot_id_hash in bot_id_hashes:
+        bot_state_cache.invalidate_key(bot_id_hash)
+
+def _invalidate_bot_tokens(prefixes):
+    for prefix in prefixes:
+        bot_token_cache.invalidate(prefix)
+
+def _invalidate_users(user_ids):
+    session_store.forget_users(set(user_ids))
+
+def _invalidate_sessions(keys):
+    session_store.forget(keys)
+
+def _invalidate_commander(values):
+    invalidate_commander()
+    bot_notifier.publish_all()
+
+invalidation_bus = InvalidationBus()
+invalidation_bus.handle('bots', _invalidate_bots)
+invalidation_bus.handle('bot_keys', _invalidate_bot_keys)
+invalidation_bus.handle('bot_tokens', _invalidate_bot_tokens)
+invalidation_bus.handle('users', _invalidate_users)
+invalidation_bus.handle('sessions', _invalidate_sessions)
+invalidation_bus.handle('commander', _invalidate_commander)
+
+def bots_changed(assign_ids):
+    """Drop the cached state of these assignments and wake their waiting bots, on every worker"""
+    if assign_ids:
+        invalidation_bus.publish('bots', assign_ids)
+
+def bot_keys_changed(bot_id_hashes):
+    """Drop cached "unknown bot" answers of newly assigned bots, on every worker"""
+    if bot_id_hashes:
+        invalidation_bus.publish('bot_keys', bot_id_hashes)
+
+def bot_tokens_changed(prefixes):
+    """Drop revoked bot API tokens cached by every worker"""
+    if prefixes:
+        invalidation_bus.publish('bot_tokens', prefixes)
+
+def users_changed(user_ids):
+    """Re-read the sessions of these users (admin flag, name, revocation) on every worker"""
+    if user_ids:
+        invalidation_bus.publish('users', user_ids)
+
+def sessions_ended(keys):
+    """Drop ended sessions (logout) cached by every worker"""
+    if keys:
+        invalidation_bus.publish('sessions', keys)
+
+def commander_changed():
+    """Drop the cached common commander and wake every waiting bot, on every worker"""
+    invalidation_bus.publish('commander')
@@ -0,0 +1,122 @@
+"""
+Structured, non-blocking logging
+Request threads only put records on a bounded in-memory queue; a background
+QueueListener thread formats them (one JSON object per line by default) and
+writes them out, so a slow stdout never stalls a worker. Every record carries
+the id of the request that produced it (X-Request-ID, generated if absent).
+High-frequency events such as bot polls go through log_sampled().
+
+Usage in a module:
+
+    logger = logging.getLogger(__name__)
+    logger.warning('Something happened', extra={'assign_id': assign_id})
+"""
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from flask import g, has_request_context, request
+
+# Attributes every LogRecord has; anything else was passed through extra= and is logged as a field
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'request_id'}
+
+_listener = None
+_handler = None
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: ts, level, logger, message, request_id, extra fields, exc"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        request_id = getattr(record, 'request_id', None)
+        if request_id:
+            entry['request_id'] = request_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class RequestQueueHandler(QueueHandler):
+    """QueueHandler that tags records with the request id and never blocks
+
+    The message and traceback are rendered in the calling thread (they may
+    reference objects that change later); everything else is left to the
+    listener thread. Records are dropped when the queue is full.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record.request_id = g.get('request_id') if has_request_context() else None
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def log_sampled(logger, level, rate, msg, **fields):
+    """Log roughly one in 1/rate calls, deciding before any record is built"""
+    if rate > 0 and (rate >= 1 or random.random() < rate) and logger.isEnabledFor(level):
+        logger.log(level, msg, extra=dict(fields, sample_rate=rate))
+
+def _start(level, fmt, queue_size):
+    global _listener, _handler
+    output = logging.StreamHandler(sys.stdout)
+    if fmt == 'json':
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s'))
+    _handler = RequestQueueHandler(queue.Queue(queue_size))
+    _listener = QueueListener(_handler.queue, output, respect_handler_level=False)
+    _listener.start()
+    atexit.register(_listener.stop)
+    root = logging.getLogger()
+    root.addHandler(_handler)
+    root.setLevel(level)
+
+def init_app(app):
+    """Install the queue handler on the root logger and tag requests with an id"""
+    level = app.config.get('LOG_LEVEL', 'INFO').upper()
+    if _listener is None:
+        _start(level, app.config.get('LOG_FORMAT', 'json'), app.config.get('LOG_QUEUE_SIZE', 10000))
+    else:
+        logging.getLogger().setLevel(level)
+
+    @app.before_request
+    def assign_request_id():
+        # Keep an upstream proxy's id so logs can be joined across services
+        g.request_id = request.headers.get('X-Request-ID', '')[:64] or uuid.uuid4().hex
+
+    @app.after_request
+    def add_request_id_header(response):
+        request_id = g.get('request_id')
+        if request_id:
+            response.headers['X-Request-ID'] = request_id
+        return response
+
+def dropped_records():
+    """Records discarded because the log queue was full"""
+    return _handler.dropped if _handler is not None else 0
@@ -0,0 +1,259 @@
+"""
+Prometheus-style metrics
+A small in-process registry (counters and histograms with labels) rendered in
+the Prometheus text exposition format on /metrics. Recording is a dict lookup
+and a bisect under a per-metric lock, cheap enough for the polling path.
+Cache, decrypt, pool and stream figures are read from their owners at scrape
+time instead of being counted twice.
+
+Metrics are per worker process; Prometheus sums them across targets.
+"""
+import threading
+import time
+from bisect import bisect_left
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from models import db
+from utils.auth import login_ip_limiter, login_email_limiter
+from utils.cache import bot_state_cache, bot_token_cache, commander_cache, rendered_state_cache
+from utils.db_pool import pool_stats
+from utils.encryption import decrypt_cache_stats
+from utils.expiry import expiry_scheduler
+from utils.heartbeat import heartbeat_buffer
+from utils.invalidation import invalidation_bus
+from utils.sessions import session_store
+from utils.log import dropped_records
+from utils.notify import bot_notifier
+
+# Request latency buckets (seconds)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Statements issued by one request
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class Counter:
+    """Monotonic counter, one value per label combination"""
+
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}  # label values tuple -> float
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}'
+
+class Histogram:
+    """Cumulative histogram, one set of buckets per label combination"""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._values = {}  # label values tuple -> [per-bucket counts..., +Inf count, sum]
+
+    def observe(self, value, labels=()):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [0] * (len(self.buckets) + 2)
+            entry[index] += 1
+            entry[-1] += value
+
+    def samples(self):
+        with self._lock:
+            values = [(labels, list(entry)) for labels, entry in self._values.items()]
+        for labels, entry in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), entry):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}'
+            label_str = _format_labels(self.labelnames, labels)
+            yield f'{self.name}_sum{label_str} {_format_value(entry[-1])}'
+            yield f'{self.name}_count{label_str} {cumulative}'
+
+class MetricsRegistry:
+    """Holds metrics and scrape-time collectors and renders them as text"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """collector() returns [(name, type, help, labelnames, [(label values, value)])]"""
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.samples())
+        for collector in self._collectors:
+            for name, metric_type, documentation, labelnames, samples in collector():
+                lines.append(f'# HELP {name} {documentation}')
+                lines.append(f'# TYPE {name} {metric_type}')
+                for labels, value in samples:
+                    lines.append(f'{name}{_format_labels(labelnames, labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+registry = MetricsRegistry()
+
+http_requests = registry.counter(
+    'botcommander_http_requests_total', 'HTTP requests handled',
+    ('blueprint', 'endpoint', 'method', 'status'))
+http_request_duration = registry.histogram(
+    'botcommander_http_request_duration_seconds', 'Time spent handling a request',
+    ('blueprint', 'endpoint'))
+db_queries = registry.histogram(
+    'botcommander_db_queries_per_request', 'SQL statements issued by one request',
+    ('blueprint', 'endpoint'), QUERY_COUNT_BUCKETS)
+db_query_duration = registry.histogram(
+    'botcommander_db_query_duration_seconds', 'Time one request spent in SQL statements',
+    ('blueprint', 'endpoint'))
+
+def observe_request(blueprint, endpoint, method, status, duration):
+    """Record one handled request (also used by the native ASGI routes)"""
+    http_requests.inc((blueprint, endpoint, method, str(status)))
+    http_request_duration.observe(duration, (blueprint, endpoint))
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context():
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context():
+        starts = conn.info.get('query_start')
+        if starts:
+            g.metrics_db_time = g.get('metrics_db_time', 0.0) + time.perf_counter() - starts.pop()
+            g.metrics_db_queries = g.get('metrics_db_queries', 0) + 1
+
+def _collect_runtime():
+    """Scrape-time figures owned by other modules (needs an app context)"""
+    caches = {
+        'bot_state': bot_state_cache.stats(),
+        'sessions': session_store.stats(),
+        'commander': commander_cache.stats(),
+        'rendered_state': rendered_state_cache.stats(),
+        'bot_token': bot_token_cache.stats(),
+        'decrypt': decrypt_cache_stats()
+    }
+    decrypt = caches['decrypt']
+    heartbeats = heartbeat_buffer.stats()
+    expiry = expiry_scheduler.stats()
+    invalidations = invalidation_bus.stats()
+    metrics = [
+        ('botcommander_cache_hits_total', 'counter', 'In-process cache hits', ('cache',),
+         [((name, ), stats['hits']) for name, stats in caches.items()]),
+        ('botcommander_cache_misses_total', 'counter', 'In-process cache misses', ('cache',),
+         [((name, ), stats['misses']) for name, stats in caches.items()]),
+        ('botcommander_cache_entries', 'gauge', 'Entries held by an in-process cache', ('cache',),
+         [((name, ), stats.get('entries', stats.get('size', 0))) for name, stats in caches.items()]),
+        ('botcommander_sessions_evicted_total', 'counter', 'Sessions dropped from a full in-memory session store', (),
+         [((), caches['sessions']['evicted'])]),
+        ('botcommander_decrypt_calls_total', 'counter', 'bot_id decryptions requested', (),
+         [((), decrypt['hits'] + decrypt['misses'])]),
+        ('botcommander_decrypt_operations_total', 'counter', 'bot_id decryptions actually performed (cache misses)', (),
+         [((), decrypt['misses'])]),
+        ('botcommander_open_streams', 'gauge', 'Open long-poll and SSE connections', (),
+         [((), bot_notifier.active)]),
+        ('botcommander_login_rate_limited_total', 'counter', 'Login attempts refused by the rate limiter', ('key',),
+         [(('ip', ), login_ip_limiter.limited), (('email', ), login_email_limiter.limited)]),
+        ('botcommander_log_records_dropped_total', 'counter', 'Log records dropped because the log queue was full', (),
+         [((), dropped_records())]),
+        ('botcommander_heartbeats_buffered', 'gauge', 'Bots with a heartbeat waiting for the next flush', (),
+         [((), heartbeats['buffered'])]),
+        ('botcommander_heartbeat_flushes_total', 'counter', 'Batched heartbeat writes', (),
+         [((), heartbeats['flushes'])]),
+        ('botcommander_heartbeats_written_total', 'counter', 'Bot heartbeats written by those batches', (),
+         [((), heartbeats['written'])]),
+        ('botcommander_heartbeats_dropped_total', 'counter', 'Heartbeats dropped because the buffer was full', (),
+         [((), heartbeats['dropped'])]),
+        ('botcommander_validity_expirations_scheduled', 'gauge', 'Upcoming validity expirations held in memory', (),
+         [((), expiry['scheduled'])]),
+        ('botcommander_bots_expired_total', 'counter', 'Bots stopped because their validity passed', (),
+         [((), expiry['expired'])]),
+        ('botcommander_invalidations_published_total', 'counter', 'Cache invalidations sent to the other workers', (),
+         [((), invalidations['published'])]),
+        ('botcommander_invalidations_received_total', 'counter', 'Cache invalidations received from other workers', (),
+         [((), invalidations['received'])]),
+        ('botcommander_invalidations_failed_total', 'counter', 'Cache invalidations not delivered to every worker', (),
+         [((), invalidations['failed'])])
+    ]
+    pool = pool_stats(db.engine)
+    if 'checked_out' in pool:
+        metrics.append(('botcommander_db_pool_connections', 'gauge', 'Primary pool connections by state', ('state',),
+                        [(('checked_out', ), pool['checked_out']), (('checked_in', ), pool['checked_in']),
+                         (('overflow', ), max(pool['overflow'], 0))]))
+    if 'checkouts' in pool:
+        metrics.append(('botcommander_db_pool_checkout_timeouts_total', 'counter', 'Primary pool checkout timeouts', (),
+                        [((), pool['timeouts'])]))
+    return metrics
+
+registry.add_collector(_collect_runtime)
+
+def init_app(app):
+    """Time every request and count its SQL statements when METRICS_ENABLED"""
+    if not app.config.get('METRICS_ENABLED'):
+        return
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(db.engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def record_request_metrics(response):
+        start = g.get('metrics_start')
+        if start is None:
+            return response
+        blueprint = request.blueprint or ''
+        endpoint = request.endpoint or 'none'
+        observe_request(blueprint, endpoint, request.method, response.status_code,
+                        time.perf_counter() - start)
+        db_queries.observe(g.get('metrics_db_queries', 0), (blueprint, endpoint))
+        db_query_duration.observe(g.get('metrics_db_time', 0.0), (blueprint, endpoint))
+        return response
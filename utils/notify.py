@@ -0,0 +1,125 @@
+"""
+In-process change notifications for bot assignments
+Request threads holding a long-poll or SSE connection wait on an Event that
+control_bot sets right after it commits a change for the same assign_id.
+AsyncBotNotifier is the asyncio counterpart used by the ASGI entry point.
+"""
+import asyncio
+import threading
+from contextlib import contextmanager
+
+class TooManyListeners(Exception):
+    """Raised when this worker already holds its maximum of open streams"""
+
+class BotNotifier:
+    """Wakes request threads waiting for changes to a bot assignment"""
+
+    def __init__(self, max_listeners=100):
+        self._lock = threading.Lock()
+        self._listeners = {}  # assign_id -> set of threading.Event
+        self._slots = threading.BoundedSemaphore(max_listeners)
+        self._hooks = []
+        self.max_listeners = max_listeners
+        self.active = 0
+
+    def init_app(self, app):
+        self.max_listeners = app.config.get('STREAM_MAX_CONNECTIONS', self.max_listeners)
+        self._slots = threading.BoundedSemaphore(self.max_listeners)
+        self.active = 0
+
+    def acquire(self, assign_id):
+        """Register for change notifications on assign_id and return the Event.
+
+        Register before reading the current state so that a change committed
+        in between is never missed. Raises TooManyListeners when the worker
+        is at capacity. Every acquire must be paired with release().
+        """
+        if not self._slots.acquire(blocking=False):
+            raise TooManyListeners()
+        event = threading.Event()
+        with self._lock:
+            self._listeners.setdefault(assign_id, set()).add(event)
+            self.active += 1
+        return event
+
+    def release(self, assign_id, event):
+        with self._lock:
+            listeners = self._listeners.get(assign_id)
+            if listeners is not None:
+                listeners.discard(event)
+                if not listeners:
+                    del self._listeners[assign_id]
+            self.active -= 1
+        self._slots.release()
+
+    @contextmanager
+    def listen(self, assign_id):
+        event = self.acquire(assign_id)
+        try:
+            yield event
+        finally:
+            self.release(assign_id, event)
+
+    def subscribe(self, hook):
+        """Call hook(assign_id) on every publish (e.g. to forward to an event loop)
+
+        hook receives None for publish_all().
+        """
+        self._hooks.append(hook)
+
+    def unsubscribe(self, hook):
+        if hook in self._hooks:
+            self._hooks.remove(hook)
+
+    def publish(self, assign_id):
+        """Wake everyone listening on assign_id"""
+        with self._lock:
+            listeners = list(self._listeners.get(assign_id, ()))
+        for event in listeners:
+            event.set()
+        for hook in self._hooks:
+            hook(assign_id)
+
+    def publish_all(self):
+        """Wake every listener on this worker (common commander changes)"""
+        with self._lock:
+            listeners = [event for events in self._listeners.values() for event in events]
+        for event in listeners:
+            event.set()
+        for hook in self._hooks:
+            hook(None)
+
+class AsyncBotNotifier:
+    """asyncio version of BotNotifier, must only be used from its event loop"""
+
+    def __init__(self, max_listeners=10000):
+        self._listeners = {}  # assign_id -> set of asyncio.Event
+        self.max_listeners = max_listeners
+        self.active = 0
+
+    def acquire(self, assign_id):
+        if self.active >= self.max_listeners:
+            raise TooManyListeners()
+        event = asyncio.Event()
+        self._listeners.setdefault(assign_id, set()).add(event)
+        self.active += 1
+        return event
+
+    def release(self, assign_id, event):
+        listeners = self._listeners.get(assign_id)
+        if listeners is not None:
+            listeners.discard(event)
+            if not listeners:
+                del self._listeners[assign_id]
+        self.active -= 1
+
+    def publish(self, assign_id):
+        for event in list(self._listeners.get(assign_id, ())):
+            event.set()
+
+    def publish_all(self):
+        for events in list(self._listeners.values()):
+            for event in list(events):
+                event.set()
+
+bot_notifier = BotNotifier()
@@ -0,0 +1,41 @@
+"""
+Transactional outbox for bot API communication
+Request handlers only add an outbox row to the transaction that changes the
+bot; dispatcher.py delivers it afterwards, so request latency never depends on
+the bot or the network. Nothing is queued unless BOT_DISPATCH_URL is set.
+"""
+import json
+import uuid
+from flask import current_app
+from models import BotOutbox, db
+from utils.pagination import serialize_value
+
+def dispatch_enabled():
+    return bool(current_app.config.get('BOT_DISPATCH_URL'))
+
+def outbox_row(assign_id, action, value):
+    return {
+        'assign_id': assign_id,
+        'idempotency_key': str(uuid.uuid4()),
+        'action': action,
+        'payload': json.dumps({'assign_id': assign_id, 'action': action, 'value': serialize_value(value)}),
+        'status': 'pending'
+    }
+
+def enqueue_command(assign_id, action, value):
+    """Queue one command in the current transaction"""
+    if dispatch_enabled():
+        db.session.add(BotOutbox(**outbox_row(assign_id, action, value)))
+
+def enqueue_commands(assign_ids, action, value):
+    """Queue the same command for many bots with one batched INSERT"""
+    if dispatch_enabled() and assign_ids:
+        db.session.execute(BotOutbox.__table__.insert(),
+                           [outbox_row(assign_id, action, value) for assign_id in assign_ids])
+
+def latest_delivery(assign_id):
+    """Delivery status of the most recent command for a bot, None if there is none"""
+    return (BotOutbox.query
+            .filter_by(assign_id=assign_id)
+            .order_by(BotOutbox.outbox_id.desc())
+            .first())
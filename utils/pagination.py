@@ -0,0 +1,69 @@
+"""
+Keyset pagination, filter and field selection helpers for list endpoints
+
+Pages are addressed by the primary key of the last row seen (?after=<id>)
+instead of OFFSET, so every page is a single index range scan no matter how
+deep the client pages.
+"""
+from datetime import datetime
+from flask import request
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def parse_bool_arg(name):
+    """Read an optional true/false query parameter, None when absent"""
+    value = request.args.get(name)
+    if value is None or value == '':
+        return None
+    value = value.lower()
+    if value in ('1', 'true', 'yes'):
+        return True
+    if value in ('0', 'false', 'no'):
+        return False
+    raise ValueError(f'{name} must be true or false')
+
+def parse_datetime_arg(name):
+    """Read an optional ISO datetime query parameter (trailing Z = UTC)"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.rstrip('Z'))
+    except ValueError:
+        raise ValueError(f'{name} must be an ISO datetime')
+
+def parse_page_args():
+    """Return (limit, after) from ?limit= and ?after="""
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    if limit is None or limit < 1:
+        raise ValueError('limit must be a positive integer')
+    after = request.args.get('after', type=int)
+    return min(limit, MAX_PAGE_SIZE), after
+
+def parse_fields_arg(allowed):
+    """Return the requested ?fields= (comma separated) in allowed order, all when absent"""
+    value = request.args.get('fields')
+    if not value:
+        return list(allowed)
+    requested = {f.strip() for f in value.split(',') if f.strip()}
+    unknown = requested - set(allowed)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}. Valid fields: {', '.join(allowed)}")
+    return [f for f in allowed if f in requested]
+
+def keyset_page(query, key_column, limit, after):
+    """Apply keyset pagination; returns (rows, next_cursor or None)"""
+    if after is not None:
+        query = query.filter(key_column > after)
+    # Fetch one extra row to know whether another page exists
+    rows = query.order_by(key_column).limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, getattr(rows[-1], key_column.key)
+    return rows, None
+
+def serialize_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
@@ -0,0 +1,65 @@
+"""
+SQL query counting
+count_queries() / assert_max_queries() wrap a block of code and record every
+statement sent to the database, so query regressions on hot endpoints (N+1
+lazy loads, duplicate lookups) are caught by a simple assertion:
+
+    with assert_max_queries(2):
+        client.get('/api/bots/1')
+
+With QUERY_COUNT_HEADER enabled, every response also carries an
+X-Query-Count header with the number of statements the request issued.
+"""
+from contextlib import contextmanager
+from flask import g, has_app_context
+from sqlalchemy import event
+from models import db
+
+class QueryCounter:
+    """Statements recorded while a count_queries() block is active"""
+
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+@contextmanager
+def count_queries(engine=None):
+    """Record statements executed on engine (default: db.engine) inside the block"""
+    engine = engine or db.engine
+    counter = QueryCounter()
+    event.listen(engine, 'before_cursor_execute', counter._record)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', counter._record)
+
+@contextmanager
+def assert_max_queries(limit, engine=None):
+    """Fail with the offending statements if the block runs more than limit queries"""
+    with count_queries(engine) as counter:
+        yield counter
+    if counter.count > limit:
+        statements = '\n'.join(f'  {i + 1}. {s}' for i, s in enumerate(counter.statements))
+        raise AssertionError(f'Expected at most {limit} queries, got {counter.count}:\n{statements}')
+
+def _count_request_query(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context():
+        g.query_count = g.get('query_count', 0) + 1
+
+def init_app(app):
+    """Add X-Query-Count to every response when QUERY_COUNT_HEADER is enabled"""
+    if not app.config.get('QUERY_COUNT_HEADER'):
+        return
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', _count_request_query)
+
+    @app.after_request
+    def add_query_count_header(response):
+        response.headers['X-Query-Count'] = str(g.get('query_count', 0))
+        return response
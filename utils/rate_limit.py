@@ -0,0 +1,50 @@
+"""
+Token bucket rate limiting
+Each key (client IP, email...) gets a bucket of `burst` tokens refilled at
+`rate` tokens per second; a request takes one token or is refused with the
+number of seconds until the next token. Buckets live in this worker only.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+class TokenBucketLimiter:
+    """Thread-safe per-key token buckets, least recently used keys evicted first"""
+
+    def __init__(self, rate=1.0, burst=5, max_keys=100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()  # key -> [tokens, updated_at]
+        self.limited = 0
+
+    def configure(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.reset()
+
+    def allow(self, key):
+        """Take a token for key. Returns (allowed, retry_after_seconds)."""
+        if self.rate <= 0:
+            return True, 0
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.pop(key, None)
+            if bucket is None:
+                bucket = [self.burst, now]
+                while len(self._buckets) >= self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            self._buckets[key] = bucket
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return True, 0
+            self.limited += 1
+            return False, (1 - bucket[0]) / self.rate
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
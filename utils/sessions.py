@@ -0,0 +1,286 @@
+"""
+Server-side sessions
+The session cookie only carries a random session id. The record it points to
+(user_id, email, name, is_admin, expiry) is kept by the SessionStore, so
+require_login/require_admin resolve the user and the admin flag from memory
+without a query, and a session can be revoked at once: on logout, when the
+user is deleted or deactivated, or when their details change.
+
+SESSION_STORE_URL selects where records are kept:
+  unset                  this worker's memory (bounded LRU), one worker only
+  sqlite:////path/to.db  an SQLite file shared by the workers of one host
+  redis://host:6379/0    Redis, for workers on several hosts
+With a shared store every worker keeps the records it uses in its LRU for up
+to SESSION_CACHE_TTL seconds, and revocations reach the other workers over the
+invalidation bus. Records are stored under a SHA-256 of the session id.
+"""
+import hashlib
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from models import db, User, Login
+
+# Copied from the user into the session record, dropped when the user changes
+USER_FIELDS = ('email', 'name', 'is_admin')
+
+def session_key(sid):
+    return hashlib.sha256(sid.encode('utf-8')).hexdigest()
+
+def user_fields(user):
+    return {'email': user.email, 'name': user.name, 'is_admin': bool(user.is_admin)}
+
+class SQLiteSessionBackend:
+    """Session records in an SQLite file, one connection per thread"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS session (key TEXT PRIMARY KEY, user_id INTEGER NOT NULL, '
+                         'data TEXT NOT NULL, expires REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_session_user ON session (user_id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_session_expires ON session (expires)')
+
+    def _connect(self):
+        # A connection made before a fork must not be shared with the child
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def save(self, key, record):
+        conn = self._connect()
+        conn.execute('DELETE FROM session WHERE expires <= ?', (time.time(),))
+        conn.execute('INSERT OR REPLACE INTO session (key, user_id, data, expires) VALUES (?, ?, ?, ?)',
+                     (key, record['user_id'], json.dumps(record), record['expires']))
+
+    def load(self, key):
+        row = self._connect().execute('SELECT data FROM session WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def delete(self, key):
+        self._connect().execute('DELETE FROM session WHERE key = ?', (key,))
+
+    def delete_user(self, user_id):
+        self._connect().execute('DELETE FROM session WHERE user_id = ?', (user_id,))
+
+    def update_user(self, user_id, fields):
+        conn = self._connect()
+        for key, data in conn.execute('SELECT key, data FROM session WHERE user_id = ?', (user_id,)).fetchall():
+            conn.execute('UPDATE session SET data = ? WHERE key = ?', (json.dumps(dict(json.loads(data), **fields)), key))
+
+    def count(self, user_id=None):
+        if user_id is None:
+            return self._connect().execute('SELECT COUNT(*) FROM session WHERE expires > ?', (time.time(),)).fetchone()[0]
+        return self._connect().execute('SELECT COUNT(*) FROM session WHERE user_id = ? AND expires > ?',
+                                       (user_id, time.time())).fetchone()[0]
+
+class RedisSessionBackend:
+    """Session records as expiring Redis keys, plus a set of session keys per user"""
+
+    PREFIX = 'botcommander:session:'
+    USER_PREFIX = 'botcommander:user_sessions:'
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('SESSION_STORE_URL is a Redis URL but the redis package is not installed. '
+                               'Install it with: pip install -r requirements-redis.txt')
+        self.client = redis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2)
+
+    def save(self, key, record):
+        ttl = max(1, int(record['expires'] - time.time()))
+        user_key = self.USER_PREFIX + str(record['user_id'])
+        pipe = self.client.pipeline()
+        pipe.set(self.PREFIX + key, json.dumps(record), ex=ttl)
+        pipe.sadd(user_key, key)
+        # The newest session expires last
+        pipe.expire(user_key, ttl)
+        pipe.execute()
+
+    def load(self, key):
+        data = self.client.get(self.PREFIX + key)
+        return json.loads(data) if data else None
+
+    def delete(self, key):
+        record = self.load(key)
+        pipe = self.client.pipeline()
+        pipe.delete(self.PREFIX + key)
+        if record:
+            pipe.srem(self.USER_PREFIX + str(record['user_id']), key)
+        pipe.execute()
+
+    def delete_user(self, user_id):
+        user_key = self.USER_PREFIX + str(user_id)
+        keys = [key.decode() for key in self.client.smembers(user_key)]
+        self.client.delete(user_key, *[self.PREFIX + key for key in keys])
+
+    def update_user(self, user_id, fields):
+        for key in self.client.smembers(self.USER_PREFIX + str(user_id)):
+            key = key.decode()
+            record = self.load(key)
+            if record:
+                self.client.set(self.PREFIX + key, json.dumps(dict(record, **fields)), keepttl=True, xx=True)
+
+    def count(self, user_id=None):
+        if user_id is not None:
+            return sum(1 for key in self.client.smembers(self.USER_PREFIX + str(user_id))
+                       if self.client.exists(self.PREFIX + key.decode()))
+        return sum(1 for _ in self.client.scan_iter(match=self.PREFIX + '*', count=1000))
+
+def create_backend(url):
+    if not url:
+        return None
+    if url.startswith('sqlite:///'):
+        return SQLiteSessionBackend(url[len('sqlite:///'):])
+    if url.startswith(('redis://', 'rediss://')):
+        return RedisSessionBackend(url)
+    raise ValueError(f'Unsupported SESSION_STORE_URL: {url}')
+
+class SessionStore:
+    """Session records by session key in a bounded LRU, in front of an optional shared backend"""
+
+    def __init__(self, lifetime=604800, max_entries=10000, cache_ttl=60):
+        self.lifetime = lifetime
+        self.max_entries = max_entries
+        self.cache_ttl = cache_ttl
+        self.backend = None
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (cached_at, record), least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def init_app(self, app):
+        self.lifetime = app.config.get('SESSION_LIFETIME', self.lifetime)
+        self.max_entries = app.config.get('SESSION_MAX_ENTRIES', self.max_entries)
+        self.cache_ttl = app.config.get('SESSION_CACHE_TTL', self.cache_ttl)
+        self.backend = create_backend(app.config.get('SESSION_STORE_URL'))
+        self.clear()
+
+    def create(self, user):
+        """Start a session for user, returns the session id to put in the cookie"""
+        sid = secrets.token_urlsafe(32)
+        record = dict(user_fields(user), user_id=user.user_id, expires=time.time() + self.lifetime)
+        key = session_key(sid)
+        if self.backend is not None:
+            self.backend.save(key, record)
+        self._put(key, record)
+        return sid
+
+    def get(self, sid):
+        """The live session record of sid, or None"""
+        key = session_key(sid)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        record = None
+        if entry is not None:
+            cached_at, record = entry
+            fresh = self.backend is None or time.monotonic() - cached_at < self.cache_ttl
+            if fresh and record['expires'] > time.time() and 'is_admin' in record:
+                self.hits += 1
+                return record
+        self.misses += 1
+        if self.backend is not None:
+            record = self.backend.load(key)
+        if record is None or record['expires'] <= time.time():
+            self._forget(key)
+            return None
+        if 'is_admin' not in record:
+            # The user changed since this record was cached (memory store only)
+            record = self._resolve(record)
+            if record is None:
+                self._forget(key)
+                return None
+        self._put(key, record)
+        return record
+
+    def _resolve(self, record):
+        """Reload the user of a record: None when deleted or the login is inactive"""
+        user = (db.session.query(User)
+                .join(Login, (Login.user_id == User.user_id) & (Login.is_active == True))
+                .filter(User.user_id == record['user_id'])
+                .first())
+        return dict(record, **user_fields(user)) if user else None
+
+    def _put(self, key, record):
+        with self._lock:
+            self._entries.pop(key, None)
+            while len(self._entries) >= self.max_entries:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+            self._entries[key] = (time.monotonic(), record)
+
+    def _forget(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete(self, sid):
+        """End one session (logout), returns its key for the other workers"""
+        key = session_key(sid)
+        if self.backend is not None:
+            self.backend.delete(key)
+        self._forget(key)
+        return key
+
+    def revoke_user(self, user_id):
+        """End every session of a user (deleted or deactivated)"""
+        if self.backend is not None:
+            self.backend.delete_user(user_id)
+        with self._lock:
+            for key in [key for key, (_, record) in self._entries.items() if record['user_id'] == user_id]:
+                del self._entries[key]
+
+    def update_user(self, user):
+        """Write a user's new details into the shared records of their sessions"""
+        if self.backend is not None:
+            self.backend.update_user(user.user_id, user_fields(user))
+
+    def forget(self, keys):
+        """Drop cached records so they are read again (logout on another worker)"""
+        for key in keys:
+            self._forget(key)
+
+    def forget_users(self, user_ids=None):
+        """Re-read the sessions of these users (all users for None) on their next request"""
+        with self._lock:
+            for key, (cached_at, record) in list(self._entries.items()):
+                if user_ids is not None and record['user_id'] not in user_ids:
+                    continue
+                if self.backend is not None:
+                    del self._entries[key]
+                else:
+                    # The record is all there is, keep the session and reload the user
+                    stale = {name: value for name, value in record.items() if name not in USER_FIELDS}
+                    self._entries[key] = (cached_at, stale)
+
+    def count(self, user_id=None):
+        """Live sessions, of one user or in total"""
+        if self.backend is not None:
+            return self.backend.count(user_id)
+        now = time.time()
+        return sum(1 for _, record in list(self._entries.values())
+                   if record['expires'] > now and (user_id is None or record['user_id'] == user_id))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evicted': self.evicted
+        }
+
+session_store = SessionStore()